@@ -1,6 +1,10 @@
+import os
+
 import streamlit as st
-import requests
-import time
+import streamlit.components.v1 as components
+
+from utils.jikan import JikanClient, JikanError
+from utils.timing import debug_panel, span, start_page, timed
 
 # Configuration de la page
 st.set_page_config(
@@ -8,6 +12,7 @@ st.set_page_config(
     page_icon="👋",
     layout="wide"
 )
+start_page("welcome")
 img_path = "images/welcome.png" 
 # Display the image at the top of the page
 st.image(img_path, use_column_width=True)
@@ -54,16 +59,236 @@ logo_path = "images/streami.png"
 st.sidebar.image(logo_path, use_column_width=True)
 
 
+# Nombre d'animés top récupérés (25 par page Jikan)
+TOP_ANIME_COUNT = 50
+
+
+# Client Jikan partagé par toutes les sessions : réponses en cache sur disque, rafraîchies en arrière-plan
+@st.cache_resource
+def get_jikan_client():
+    return JikanClient()
+
+
 # Fonction pour récupérer les animés top
-@st.cache_data(ttl=3600)  # Cache les données pendant 1 heure
+@timed("get_top_anime")
 def get_top_anime():
-    response = requests.get("https://api.jikan.moe/v4/top/anime")
-    if response.status_code == 200:
-        data = response.json()
-        return data['data']
-    else:
+    try:
+        return get_jikan_client().top_anime(TOP_ANIME_COUNT)
+    except JikanError:
         return []
 
+# Carrousel : "client" envoie toutes les cartes une fois et les fait tourner dans le navigateur,
+# "fragment" ne réexécute que le carrousel côté serveur toutes les CAROUSEL_INTERVAL secondes
+CAROUSEL_MODE = os.environ.get("CAROUSEL_MODE", "client")
+CAROUSEL_INTERVAL = 6
+CAROUSEL_HEIGHT = 560
+
+# CSS personnalisé
+CAROUSEL_CSS = """
+    <style>
+    .anime-card {
+        display: flex;
+        border: 1px solid #333;
+        border-radius: 10px;
+        padding: 15px;
+        margin-top: 20px;
+        gap: 15px;
+        flex-wrap: wrap;
+        transition: transform 0.1s ease-out;
+        transform: perspective(1000px);
+        will-change: transform;
+    }
+
+    
+
+    .anime-image-container {
+        position: relative;
+        width: 300px;
+        border-radius: 5px;
+        flex: 0 0 300px;
+        overflow: hidden;
+    }
+    .anime-image {
+        width: 100%;
+        border-radius: 5px;
+    }
+    .anime-overlay {
+        position: absolute;
+        bottom: 0;
+        left: 0;
+        width: 100%;
+        height: 50px;
+        background: linear-gradient(transparent, rgba(0, 0, 0, 0.7));
+    }
+    .anime-rating {
+        position: absolute;
+        bottom: 10px;
+        left: 10px;
+        padding: 3px 8px;
+        font-size: 10px;
+        color: #fff;
+    }
+    .anime-details {
+        flex: 2;
+    }
+    .anime-right-section {
+        flex: 3;
+        display: flex;
+        flex-direction: column;
+        justify-content: flex-start;
+    }
+    .anime-header {
+        padding: 3px 8px;
+        border: 1px solid #333;
+        border-radius: 5px;
+        display: inline-block;
+        font-size: 14px;
+        margin-bottom: 10px;
+    }
+    .anime-title {
+        font-size: 28px;
+        margin: 10px 0;
+        font-weight: bold;
+    }
+    .anime-meta {
+        font-size: 14px;
+        margin: 5px 0;
+    }
+    .anime-stats {
+        display: flex;
+        align-items: center;
+        margin-top: 10px;
+    }
+    .anime-stats div {
+        margin-right: 15px;
+        display: flex;
+        align-items: center;
+    }
+    .anime-stats div span {
+        font-size: 15px;
+        font-weight: bold;
+        margin-right: 5px;
+    }
+    .tag {
+        display: inline-block;
+        background-color: #292928;
+        padding: 3px 8px;
+        border-radius: 5px;
+        font-size: 12px;
+        margin-right: 5px;
+        color: #fff;
+        text-decoration: none;
+    }
+    .tag a {
+        color: inherit; /* This ensures the link takes the color of its parent */
+        text-decoration: none; /* Removes underline */
+    }
+
+    .tag:hover {
+        background-color: #444;
+    }
+
+    .tag a:hover {
+        color: inherit; /* Keeps the hover color the same as the tag */
+    }
+    iframe {
+        margin-top: 10px;
+        border-radius: 5px;
+        width: 100%;
+        height: 250px; /* Augmenter la hauteur pour une meilleure visibilité */
+    }
+    .synopsis {
+        margin-top: 15px;
+        font-size: 15px;
+        line-height: 1.5;
+    }
+    </style>
+"""
+
+
+def render_card(selected_anime, lazy_trailer=False):
+    """HTML de la carte d'un animé (avec `lazy_trailer`, le trailer n'est chargé que par le script du carrousel)."""
+    title = selected_anime['title']
+    image_url = selected_anime['images']['jpg']['large_image_url']
+    score = selected_anime.get('score', 'N/A')
+    rank = selected_anime.get('rank', 'N/A')
+    users = selected_anime.get('scored_by', 'N/A')
+    status = selected_anime.get('status', 'N/A')
+    start_date = selected_anime.get('aired', {}).get('string', 'N/A')
+    episodes = selected_anime.get('episodes', 'N/A')
+    genres = selected_anime.get('genres', [])
+    trailer_url = selected_anime['trailer']['embed_url']
+    synopsis = selected_anime.get('synopsis') or 'Synopsis not available.'
+    rating = selected_anime.get('rating', 'N/A')
+
+    status_color = "lightblue" if status == "Finished Airing" else "lightgreen" if status == "Currently Airing" else "orange"
+
+    return f"""
+    <div class="anime-card">
+        <div class="anime-image-container">
+            <img src="{image_url}" class="anime-image">
+            <div class="anime-overlay"></div>
+            <div class="anime-rating">{rating}</div>
+        </div>
+        <div class="anime-details">
+            <div class="anime-header" style="color: {status_color};">{status}</div>
+            <h2 class="anime-title">{title}</h2>
+            <div class="anime-stats">
+                <div><span>⭐</span> {score}</div>
+                <div>{users} users</div>
+                <div># {rank} Ranking</div>
+            </div>
+            <div class="anime-meta">
+                Start Date: {start_date} | Episodes: {episodes}
+            </div>
+            <div>
+                {" ".join([
+                    f'<a href="{genre["url"]}" target="_blank" class="tag" style="color: #fff; text-decoration: none;">{genre["name"]}</a>'
+                    for genre in genres
+                ])}
+            </div>
+        </div>
+        <div class="anime-right-section">
+            <iframe {"data-src" if lazy_trailer else "src"}="{trailer_url}" frameborder="0" allow="autoplay; encrypted-media" allowfullscreen></iframe>
+            <p class="synopsis"> {synopsis[:300]}...</p>
+        </div>
+    </div>
+    """
+
+
+def client_carousel(animes):
+    """Page HTML autonome qui fait tourner les cartes dans le navigateur.
+
+    Seul le trailer de la carte affichée est chargé. Le composant est dans une
+    iframe qui n'hérite pas du thème de Streamlit : les couleurs de texte
+    suivent celles du thème par défaut (clair ou sombre selon le système).
+    """
+    slides = "".join(f'<div class="slide" style="display: none;">{render_card(anime, lazy_trailer=True)}</div>' for anime in animes)
+    return f"""
+    {CAROUSEL_CSS}
+    <style>
+    body {{ margin: 0; font-family: "Source Sans Pro", sans-serif; color: rgb(49, 51, 63); }}
+    @media (prefers-color-scheme: dark) {{ body {{ color: rgb(250, 250, 250); }} }}
+    </style>
+    {slides}
+    <script>
+    const slides = document.querySelectorAll(".slide");
+    let current = 0;
+    function show(index) {{
+        // Décharger le trailer de la carte précédente, charger celui de la nouvelle
+        slides[current].style.display = "none";
+        slides[current].querySelector("iframe").removeAttribute("src");
+        current = index;
+        const trailer = slides[current].querySelector("iframe");
+        trailer.src = trailer.dataset.src;
+        slides[current].style.display = "block";
+    }}
+    show(0);
+    setInterval(() => show((current + 1) % slides.length), {CAROUSEL_INTERVAL * 1000});
+    </script>
+    """
+
+
 # Récupération des animés top
 top_anime = get_top_anime()
 
@@ -74,198 +299,26 @@ top_anime_with_trailers = [anime for anime in top_anime if anime.get('trailer',
 if not top_anime_with_trailers:
     st.error("Could not get popular animes with trailers.")
 else:
-    # Initialiser l'index de l'animation dans st.session_state s'il n'existe pas
-    if 'anime_index' not in st.session_state:
-        st.session_state['anime_index'] = 0
-
     st.title("Most Popular Animes at the moment")
-    carousel_placeholder = st.empty()
-
-    # CSS personnalisé
-    st.markdown(
-        """
-        <style>
-        .anime-card {
-            display: flex;
-            border: 1px solid #333;
-            border-radius: 10px;
-            padding: 15px;
-            margin-top: 20px;
-            gap: 15px;
-            flex-wrap: wrap;
-            transition: transform 0.1s ease-out;
-            transform: perspective(1000px);
-            will-change: transform;
-        }
-
-        
-
-        .anime-image-container {
-            position: relative;
-            width: 300px;
-            border-radius: 5px;
-            flex: 0 0 300px;
-            overflow: hidden;
-        }
-        .anime-image {
-            width: 100%;
-            border-radius: 5px;
-        }
-        .anime-overlay {
-            position: absolute;
-            bottom: 0;
-            left: 0;
-            width: 100%;
-            height: 50px;
-            background: linear-gradient(transparent, rgba(0, 0, 0, 0.7));
-        }
-        .anime-rating {
-            position: absolute;
-            bottom: 10px;
-            left: 10px;
-            padding: 3px 8px;
-            font-size: 10px;
-            color: #fff;
-        }
-        .anime-details {
-            flex: 2;
-        }
-        .anime-right-section {
-            flex: 3;
-            display: flex;
-            flex-direction: column;
-            justify-content: flex-start;
-        }
-        .anime-header {
-            padding: 3px 8px;
-            border: 1px solid #333;
-            border-radius: 5px;
-            display: inline-block;
-            font-size: 14px;
-            margin-bottom: 10px;
-        }
-        .anime-title {
-            font-size: 28px;
-            margin: 10px 0;
-            font-weight: bold;
-        }
-        .anime-meta {
-            font-size: 14px;
-            margin: 5px 0;
-        }
-        .anime-stats {
-            display: flex;
-            align-items: center;
-            margin-top: 10px;
-        }
-        .anime-stats div {
-            margin-right: 15px;
-            display: flex;
-            align-items: center;
-        }
-        .anime-stats div span {
-            font-size: 15px;
-            font-weight: bold;
-            margin-right: 5px;
-        }
-        .tag {
-            display: inline-block;
-            background-color: #292928;
-            padding: 3px 8px;
-            border-radius: 5px;
-            font-size: 12px;
-            margin-right: 5px;
-            color: #fff;
-            text-decoration: none;
-        }
-        .tag a {
-            color: inherit; /* This ensures the link takes the color of its parent */
-            text-decoration: none; /* Removes underline */
-        }
-
-        .tag:hover {
-            background-color: #444;
-        }
-
-        .tag a:hover {
-            color: inherit; /* Keeps the hover color the same as the tag */
-        }
-        iframe {
-            margin-top: 10px;
-            border-radius: 5px;
-            width: 100%;
-            height: 250px; /* Augmenter la hauteur pour une meilleure visibilité */
-        }
-        .synopsis {
-            margin-top: 15px;
-            font-size: 15px;
-            line-height: 1.5;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True
-    )
-
-    # Boucle infinie pour le carrousel
-    while True:
-        with carousel_placeholder.container():
-            # Afficher les détails de l'animé sélectionné
-            selected_anime = top_anime_with_trailers[st.session_state['anime_index']]
-            title = selected_anime['title']
-            image_url = selected_anime['images']['jpg']['large_image_url']
-            score = selected_anime.get('score', 'N/A')
-            rank = selected_anime.get('rank', 'N/A')
-            users = selected_anime.get('scored_by', 'N/A')
-            status = selected_anime.get('status', 'N/A')
-            start_date = selected_anime.get('aired', {}).get('string', 'N/A')
-            episodes = selected_anime.get('episodes', 'N/A')
-            genres = selected_anime.get('genres', [])
-            trailer_url = selected_anime['trailer']['embed_url']
-            synopsis = selected_anime.get('synopsis', 'Synopsis not available.')
-            rating = selected_anime.get('rating', 'N/A')
-
-            status_color = "lightblue" if status == "Finished Airing" else "lightgreen" if status == "Currently Airing" else "orange"
-
-            # Affichage des détails de l'animé
-            st.markdown(
-                f"""
-                <div class="anime-card">
-                    <div class="anime-image-container">
-                        <img src="{image_url}" class="anime-image">
-                        <div class="anime-overlay"></div>
-                        <div class="anime-rating">{rating}</div>
-                    </div>
-                    <div class="anime-details">
-                        <div class="anime-header" style="color: {status_color};">{status}</div>
-                        <h2 class="anime-title">{title}</h2>
-                        <div class="anime-stats">
-                            <div><span>⭐</span> {score}</div>
-                            <div>{users} users</div>
-                            <div># {rank} Ranking</div>
-                        </div>
-                        <div class="anime-meta">
-                            Start Date: {start_date} | Episodes: {episodes}
-                        </div>
-                        <div>
-                            {" ".join([
-                                f'<a href="{genre["url"]}" target="_blank" class="tag" style="color: #fff; text-decoration: none;">{genre["name"]}</a>' 
-                                for genre in genres
-                            ])}
-                        </div>
-                    </div>
-                    <div class="anime-right-section">
-                        <iframe src="{trailer_url}" frameborder="0" allow="autoplay; encrypted-media" allowfullscreen></iframe>
-                                                <p class="synopsis"> {synopsis[:300]}...</p>
-                    </div>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
-
-        # Incrémenter l'index pour le prochain élément du carrousel
-        st.session_state['anime_index'] = (st.session_state['anime_index'] + 1) % len(top_anime_with_trailers)
-        
-        # Pause de 18 secondes pour l'affichage de chaque animé
-        time.sleep(6)
 
+    if CAROUSEL_MODE == "fragment":
+        # Initialiser l'index de l'animation dans st.session_state s'il n'existe pas
+        if 'anime_index' not in st.session_state:
+            st.session_state['anime_index'] = 0
+        st.markdown(CAROUSEL_CSS, unsafe_allow_html=True)
+
+        @st.fragment(run_every=CAROUSEL_INTERVAL)
+        def carousel():
+            selected_anime = top_anime_with_trailers[st.session_state['anime_index'] % len(top_anime_with_trailers)]
+            st.markdown(render_card(selected_anime), unsafe_allow_html=True)
+            # Incrémenter l'index pour le prochain élément du carrousel
+            st.session_state['anime_index'] = (st.session_state['anime_index'] + 1) % len(top_anime_with_trailers)
+
+        with span("render_carousel"):
+            carousel()
+    else:
+        # Les cartes sont envoyées une seule fois, aucun thread serveur ne reste occupé par la rotation
+        with span("render_carousel"):
+            components.html(client_carousel(top_anime_with_trailers), height=CAROUSEL_HEIGHT, scrolling=True)
 
+debug_panel()
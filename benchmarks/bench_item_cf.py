@@ -0,0 +1,75 @@
+"""Build time and memory of the item-item collaborative filtering table at the size of the full score dump.
+
+    python -m benchmarks.bench_item_cf [--ratings 24000000 --users 270000 --anime 17000] [--workers 4]
+
+The defaults match ``users-score-2023.csv`` (about 24 million ratings by
+270,000 users on 17,000 anime). Ratings are synthetic: anime popularity
+follows a power law, like on MyAnimeList, which is what makes the sparse
+products expensive. Stages are timed separately, then page lookups.
+"""
+import argparse
+import resource
+import time
+
+import numpy as np
+
+from utils.item_cf import BLOCK_SIZE, K_NEIGHBOURS, MIN_RATINGS, ItemCFTable, build_rating_matrix, item_neighbours
+
+
+def synthetic_ratings(n_ratings, n_users, n_anime, seed=0):
+    rng = np.random.default_rng(seed)
+    popularity = 1 / np.arange(1, n_anime + 1) ** 0.8
+    user_ids = rng.integers(0, n_users, n_ratings, dtype=np.int32)
+    anime_ids = rng.choice(n_anime, n_ratings, p=popularity / popularity.sum()).astype(np.int32)
+    # One rating per (user, anime), as in the dump
+    _, first = np.unique(user_ids.astype(np.int64) * n_anime + anime_ids, return_index=True)
+    ratings = rng.integers(1, 11, len(first), dtype=np.int8)
+    return user_ids[first], anime_ids[first], ratings
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ratings", type=int, default=24_000_000)
+    parser.add_argument("--users", type=int, default=270_000)
+    parser.add_argument("--anime", type=int, default=17_000)
+    parser.add_argument("-k", "--n-neighbours", type=int, default=K_NEIGHBOURS)
+    parser.add_argument("--min-ratings", type=int, default=MIN_RATINGS)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    user_ids, anime_ids, ratings = synthetic_ratings(args.ratings, args.users, args.anime)
+    print(f"{len(ratings):,} synthetic ratings in {time.perf_counter() - start:.1f} s, peak RSS {peak_rss_mb():.0f} MB")
+
+    start = time.perf_counter()
+    matrix, column_ids = build_rating_matrix(user_ids, anime_ids, ratings, args.min_ratings)
+    del user_ids, anime_ids, ratings
+    matrix_mb = (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 1e6
+    print(f"CSR matrix: {matrix.shape[0]:,} users x {matrix.shape[1]:,} anime, {matrix.nnz:,} ratings, "
+          f"{matrix_mb:.0f} MB, built in {time.perf_counter() - start:.1f} s, peak RSS {peak_rss_mb():.0f} MB")
+
+    start = time.perf_counter()
+    columns, similarities = item_neighbours(matrix, args.n_neighbours, args.block_size, args.workers)
+    elapsed = time.perf_counter() - start
+    neighbour_ids = np.where(columns >= 0, column_ids[columns], -1).astype(np.int32)
+    table = ItemCFTable(column_ids.astype(np.int32), neighbour_ids, similarities.astype(np.float16), {})
+    table_mb = (table.anime_ids.nbytes + table.neighbour_ids.nbytes + table.similarities.nbytes) / 1e6
+    print(f"Top {neighbour_ids.shape[1]} similar anime of each in {elapsed:.1f} s "
+          f"({matrix.shape[1] / elapsed:,.0f} anime/s), table {table_mb:.1f} MB, peak RSS {peak_rss_mb():.0f} MB")
+
+    rng = np.random.default_rng(1)
+    for size in (1, 5):
+        profiles = [rng.choice(table.anime_ids, size, replace=False) for _ in range(1000)]
+        start = time.perf_counter()
+        for profile in profiles:
+            table.recommend(profile, k=3)
+        print(f"Lookup of {size} favourite(s): {(time.perf_counter() - start) / len(profiles) * 1e6:.0f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Build time, query latency and option payload of the name search, at several catalogue sizes.
+
+    python -m benchmarks.bench_name_search [--sizes 1000 25000 100000]
+
+Each anime gets three synthetic names (English, romaji, Japanese) made of
+words drawn with Zipf frequencies. The payload is the JSON of the options a
+picker sends to the browser: every name before, the first page of matches
+now.
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synopses
+from utils.name_search import PAGE_SIZE, NameIndex
+
+QUERIES = ["", "w1", "w12 w3", "love", "w12 w", "lvoe stroy", "アニメ 1"]
+
+
+def synthetic_names(n, seed=0):
+    rng = np.random.default_rng(seed)
+    english = synopses(rng, n, vocabulary=5_000, min_words=1, max_words=5)
+    romaji = synopses(rng, n, vocabulary=5_000, min_words=1, max_words=5)
+    return [(e.title(), r, f"アニメ {i}") for i, (e, r) in enumerate(zip(english, romaji))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1_000, 25_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        names = synthetic_names(size)
+        start = time.perf_counter()
+        index = NameIndex([english for english, _, _ in names], names, np.arange(size, 0, -1))
+        build = time.perf_counter() - start
+        full_payload = len(json.dumps(index.keys.tolist(), ensure_ascii=False).encode())
+        latencies, payloads = [], []
+        for query in QUERIES:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                keys, _ = index.search(query, PAGE_SIZE)
+            latencies.append((time.perf_counter() - start) / args.repeat * 1000)
+            payloads.append(len(json.dumps(keys, ensure_ascii=False).encode()))
+        print(f"{size:>7,} anime: index built in {build:.2f} s | search "
+              + ", ".join(f"{q!r} {ms:.1f} ms" for q, ms in zip(QUERIES, latencies))
+              + f" | options {full_payload / 1e3:,.0f} kB before, {max(payloads) / 1e3:.1f} kB now")
+
+
+if __name__ == "__main__":
+    main()
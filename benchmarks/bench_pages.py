@@ -0,0 +1,271 @@
+"""Cold start, rerun latency and peak memory of every page, on synthetic data at several scales.
+
+    python -m benchmarks.bench_pages [--scales 1 10 100] [--pages welcome quiz] [--output results.json]
+    python -m benchmarks.bench_pages --compare before.json after.json
+
+For each scale, writes the synthetic datasets of ``benchmarks.synthetic`` into
+a scratch workspace (the pages, ``utils/`` and ``images/`` are linked from
+the repo), runs the offline builds there and serves local stand-ins for
+Jikan, the inference API and the character images. Each page then runs
+headless with ``streamlit.testing.v1.AppTest`` in a fresh interpreter: the
+first run is the cold start, then every interaction of ``PAGES`` (button
+click, selectbox change...) is timed as one rerun. Peak RSS is the maximum
+resident memory of that interpreter (Linux only).
+
+``--output`` saves the results as JSON; ``--compare`` prints the change of
+each measurement between two such files.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LINKED = ["Welcome.py", "pages", "utils", "images", "benchmarks"]
+# Every offline build, so the pages run their built paths and not the fallbacks
+BUILDS = [["utils.storage"], ["utils.anime_stats"], ["utils.features"], ["utils.neighbours"], ["utils.synopsis"],
+          ["utils.item_cf"], ["utils.images"]]
+# Files written by the pages themselves, removed before each run so every first run is cold
+RUNTIME_DIRS = ["data/jikan_cache", "data/generated"]
+
+
+def click(label):
+    return lambda at: next(b for b in at.button if b.label == label).click()
+
+
+def select_second(label):
+    def interact(at):
+        box = next(s for s in at.selectbox if s.label == label)
+        box.select(box.options[1])
+    return interact
+
+
+def start_hard_quiz(at):
+    next(c for c in at.checkbox if c.label == "Hard mode").check().run()
+    click("Start the Quiz")(at)
+
+
+def choose(label, value):
+    return lambda at: next(r for r in at.radio if r.label == label).set_value(value)
+
+
+def add_second_favorite(at):
+    box = next(s for s in at.multiselect if s.label == "Select your favorite anime:")
+    box.select(box.options[1])
+
+
+def generate_batch(at):
+    next(s for s in at.slider if s.label == "Number of variations").set_value(4)
+    at.run()
+    click("Generate 4 Images")(at)
+
+
+# Page script and timed interactions, each followed by one rerun.
+# The quiz's "Next" includes the page's own 2 s pause after an answer.
+PAGES = {
+    'welcome': ("Welcome.py", [
+        ("switch language", click("Switch to Japanese")),
+    ]),
+    'who_watches': ("pages/1_📺_Who_Watches_Animes_?.py", [
+        ("episodes by gender", lambda at: at.checkbox[0].check()),
+        ("anime details", lambda at: (select_second("Select an anime:")(at), click("Show Details")(at))),
+    ]),
+    'quiz': ("pages/2_㉄_Let's_take_a_quiz!.py", [
+        ("start quiz", click("Start the Quiz")),
+        ("hint", click("Hint")),
+        ("next question", click("Next")),
+        ("stop quiz", click("Stop the Quiz")),
+        ("hard mode quiz", start_hard_quiz),
+    ]),
+    'recommendations': ("pages/3_🙋🏻‍♀️_Wants_Some_Recommandations?.py", [
+        ("add a favorite", add_second_favorite),
+        ("closest favorite", choose("Combine your favorites by:", "max")),
+        ("blend synopsis", lambda at: next(s for s in at.slider if s.label == "Weight of the synopsis:").set_value(0.5)),
+        ("fans also liked", choose("Recommend by:", "fans")),
+    ]),
+    'generate': ("pages/4_🧚🏼_Generate_your_anime_character!.py", [
+        ("generate image", click("Generate Image")),
+        ("generate 4 variations", generate_batch),
+    ]),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process, Linux only.
+
+    Not ``ru_maxrss``, which keeps the peak of the parent across exec.
+    """
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM:")) / 1024
+
+
+def measure(page, timeout):
+    """Run ``page`` in this process (cwd: the workspace) and print its measurements as JSON."""
+    from streamlit.testing.v1 import AppTest
+
+    script, interactions = PAGES[page]
+    errors = []
+
+    def rerun(at):
+        start = time.perf_counter()
+        at.run()
+        elapsed = time.perf_counter() - start
+        errors.extend(e.message for e in at.exception)
+        return elapsed
+
+    at = AppTest.from_file(script, default_timeout=timeout)
+    result = {'cold_start': rerun(at), 'interactions': {}}
+    for name, interact in interactions:
+        try:
+            interact(at)
+        except StopIteration:
+            errors.append(f"{name}: widget not found")
+            continue
+        result['interactions'][name] = rerun(at)
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['errors'] = errors
+    print(json.dumps(result))
+
+
+def prepare_workspace(workspace, scale, image_base):
+    from benchmarks.synthetic import write_datasets
+
+    for name in LINKED:
+        os.symlink(os.path.join(REPO, name), os.path.join(workspace, name))
+    rows = write_datasets(workspace, scale, image_base)
+    start = time.perf_counter()
+    for build in BUILDS:
+        subprocess.run([sys.executable, "-m", *build], cwd=workspace, check=True, stdout=subprocess.DEVNULL)
+    return rows, time.perf_counter() - start
+
+
+def run_page(page, workspace, env, repeat, timeout):
+    runs = []
+    for _ in range(repeat):
+        for name in RUNTIME_DIRS:
+            shutil.rmtree(os.path.join(workspace, name), ignore_errors=True)
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_pages", "--measure", page, "--timeout", str(timeout)],
+            cwd=workspace, env=env, capture_output=True, text=True, check=True,
+        ).stdout
+        runs.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        'cold_start': float(np.median([r['cold_start'] for r in runs])),
+        'interactions': {name: float(np.median([r['interactions'][name] for r in runs if name in r['interactions']]))
+                         for name in runs[0]['interactions']},
+        'peak_rss_mb': float(np.median([r['peak_rss_mb'] for r in runs])),
+        'errors': sorted({e for r in runs for e in r['errors']}),
+    }
+
+
+def flatten(results):
+    """``{(scale, page, measurement): value}`` of a results file."""
+    values = {}
+    for run in results['runs']:
+        key = (run['scale'], run['page'])
+        values[key + ('cold start s',)] = run['cold_start']
+        for name, seconds in run['interactions'].items():
+            values[key + (f"{name} s",)] = seconds
+        values[key + ('peak RSS MB',)] = run['peak_rss_mb']
+    return values
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = flatten(json.load(f))
+    with open(new_path) as f:
+        new = flatten(json.load(f))
+    print(f"{'scale':>6} {'page':16} {'measurement':28} {'before':>9} {'after':>9} {'change':>8}")
+    for key in sorted(old.keys() & new.keys()):
+        scale, page, name = key
+        change = (new[key] - old[key]) / old[key] * 100 if old[key] else float('nan')
+        print(f"{scale:>6g} {page:16} {name:28} {old[key]:9.2f} {new[key]:9.2f} {change:+7.0f}%")
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"only in {'before' if key in old else 'after'}: {key}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scales", type=float, nargs="*", default=[1, 10, 100])
+    parser.add_argument("--pages", nargs="*", default=list(PAGES), choices=list(PAGES))
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per page (the median is kept)")
+    parser.add_argument("--timeout", type=float, default=600, help="Limit for one rerun (s)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Generation time of the inference stand-in (s)")
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"))
+    parser.add_argument("--measure", choices=list(PAGES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure, args.timeout)
+        return
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    from benchmarks.synthetic import serve_images
+    from utils import mock_inference, mock_jikan
+
+    jikan_port, inference_port, image_port = free_port(), free_port(), free_port()
+    servers = [
+        mock_jikan.serve(jikan_port, rate_limit=0),
+        mock_inference.serve(inference_port, latency=args.latency),
+        serve_images(image_port),
+    ]
+    env = {
+        **os.environ,
+        'JIKAN_BASE_URL': f"http://127.0.0.1:{jikan_port}/v4",
+        'HF_API_URL': f"http://127.0.0.1:{inference_port}/generate",
+    }
+    commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO,
+                            capture_output=True, text=True).stdout.strip()
+    results = {
+        'meta': {
+            'commit': commit,
+            'date': datetime.datetime.now().isoformat(timespec="seconds"),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+        },
+        'runs': [],
+    }
+    try:
+        for scale in args.scales:
+            with tempfile.TemporaryDirectory(prefix="streamimanga-bench-") as workspace:
+                rows, build_seconds = prepare_workspace(workspace, scale, f"http://127.0.0.1:{image_port}")
+                print(f"Scale {scale:g}: " + ", ".join(f"{name} {n:,}" for name, n in rows.items())
+                      + f" rows, offline builds {build_seconds:.1f} s")
+                for page in args.pages:
+                    run = run_page(page, workspace, env, args.repeat, args.timeout)
+                    results['runs'].append({'scale': scale, 'page': page, 'rows': rows, **run})
+                    steps = ", ".join(f"{name} {s:.2f} s" for name, s in run['interactions'].items())
+                    print(f"  {page:16} cold start {run['cold_start']:6.2f} s | {steps} | "
+                          f"peak RSS {run['peak_rss_mb']:.0f} MB")
+                    for error in run['errors']:
+                        print(f"    error: {error.splitlines()[0]}")
+    finally:
+        for server in servers:
+            server.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Parse throughput of the character scraper's HTML backends over saved pages.
+
+    cd data/character && python fixture_server.py --save /tmp/pages --repeat 4
+    python -m benchmarks.bench_parsers --fixtures /tmp/pages [--repeat 3]
+
+Without ``--fixtures`` the pages are generated from the character CSV. Every
+backend must extract exactly the same rows as BeautifulSoup (``bs4``).
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+
+# The scraper is a standalone script, not part of a package
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "character"))
+
+from fixture_server import pages_from_csv, pages_from_dir  # noqa: E402
+from scrap_characters import PARSERS  # noqa: E402
+
+
+def run(parse, pages):
+    # Rows the extractors fail on are reported with print(); keep them out of the timing output
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [parse(html) for html in pages]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fixtures", help="Directory of page-<n>.html files (fixture_server.py --save)")
+    parser.add_argument("--csv", default="data/character/anime_planet_characters.csv")
+    parser.add_argument("--parsers", nargs="*", default=list(PARSERS))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pages = pages_from_dir(args.fixtures) if args.fixtures else pages_from_csv(args.csv, 15)
+    pages = [pages[page] for page in sorted(pages)]
+    print(f"{len(pages)} pages, {sum(len(html) for html in pages) / 1e6:.1f} MB of HTML")
+
+    reference = run(PARSERS['bs4'], pages)
+    rows = sum(len(characters) for characters in reference)
+    for name in args.parsers:
+        try:
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                output = run(PARSERS[name], pages)
+                timings.append(time.perf_counter() - start)
+        except ImportError as e:
+            print(f"{name:>6}: skipped ({e})")
+            continue
+        best = np.min(timings)
+        same = "identical" if output == reference else "DIFFERENT from bs4"
+        print(f"{name:>6}: {rows / best:10,.0f} rows/s  {len(pages) / best:8,.1f} pages/s  "
+              f"({best:.2f} s best of {args.repeat}), output {same}")
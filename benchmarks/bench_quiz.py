@@ -0,0 +1,77 @@
+"""Time to draw a quiz question and its options, and session state kept, at several character counts.
+
+    python -m benchmarks.bench_quiz [--characters 300 30000 300000]
+
+Characters come from ``benchmarks.synthetic.characters_table`` (one anime
+per ten characters). "before" is the page's former DataFrame path: filter
+the characters of the anime, drop those already asked (``isin``), ``sample``
+one, then list every name of the anime to draw the wrong answers. "now" draws
+row numbers from ``utils.quiz.CharacterPools``. Both are timed for "All" and
+for one anime.
+"""
+import argparse
+import pickle
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import characters_table
+from utils.quiz import ALL, CharacterPools, draw_options, draw_questions
+
+
+def before(data, title, n_questions=5):
+    filtered = data if title == ALL else data[data['Manga Associé'] == title]
+    used = []
+    for _ in range(n_questions):
+        available = filtered[~filtered['Nom'].isin(used)]
+        character = available.sample(1).iloc[0]
+        used.append(character['Nom'])
+        names = filtered['Nom'].tolist()
+        options = [character['Nom']] + random.sample([name for name in names if name != character['Nom']], 3)
+        random.shuffle(options)
+    return filtered
+
+
+def now(pools, names, title):
+    pool = pools.pool(title)
+    rows = draw_questions(pool).tolist()
+    for row in rows:
+        draw_options(pool, row, names)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--characters", type=int, nargs="*", default=[300, 30_000, 300_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n in args.characters:
+        anime = pd.DataFrame({'Name': [f"Anime {i}" for i in range(max(1, n // 10))]})
+        data = characters_table(rng, n, anime, "http://127.0.0.1:8092")[['Nom', 'Image', 'Tags', 'Manga Associé']]
+        start = time.perf_counter()
+        pools = CharacterPools(data['Manga Associé'].to_numpy())
+        names = data['Nom'].to_numpy(dtype=object)
+        build = time.perf_counter() - start
+        title = data['Manga Associé'].iat[0]
+        line = []
+        for label, choice in (("All", ALL), ("one anime", title)):
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                filtered = before(data, choice)
+            old = (time.perf_counter() - start) / args.repeat / 5 * 1000
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                rows = now(pools, names, choice)
+            new = (time.perf_counter() - start) / args.repeat / 5 * 1000
+            line.append(f"{label} {old:.2f} -> {new:.3f} ms/question")
+        state_before = len(pickle.dumps(filtered)) + len(pickle.dumps(data.iloc[0]))
+        print(f"{n:>7,} characters: pools built in {build * 1000:.0f} ms | " + ", ".join(line)
+              + f" | session state {state_before / 1e3:,.1f} kB -> {len(pickle.dumps(rows))} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Build time, size and latency of the hard-mode trait similarity of the quiz, at several character counts.
+
+    python -m benchmarks.bench_quiz_traits [--characters 750 100000 300000] [--tags 400]
+
+Characters get 1 or 2 of 25 traits and 2 to 12 of ``--tags`` tags drawn
+with Zipf frequencies, like the anime-planet dataset (750 characters, 25
+traits, 400 tags, "Teenager" on 40 % of them). A question looks up the
+characters of the whole table most similar to the answer, as many as the
+page asks for (``TraitIndex.most_similar``); it is compared with a Jaccard
+of row-major bitsets (one packed row per character) counted with a byte
+popcount table, which scans every word of every row.
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.quiz import N_OPTIONS, SPARE_OPTIONS, TraitIndex
+
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def item_lists(rng, n, n_items, min_items, max_items, prefix):
+    """``n`` strings of ``min_items`` to ``max_items`` items of ``n_items`` drawn with Zipf frequencies."""
+    weights = 1 / np.arange(1, n_items + 1)
+    counts = rng.integers(min_items, max_items + 1, n)
+    items = rng.choice(n_items, counts.sum(), p=weights / weights.sum())
+    owners = np.repeat(np.arange(n), counts)
+    names = np.array([f"{prefix} {i}" for i in range(n_items)], dtype=object)
+    return pd.Series(names[items]).groupby(owners).agg(", ".join).to_numpy()
+
+
+def row_major_jaccard(rows, row):
+    """Jaccard of every packed row of ``rows`` (n, words) to ``rows[row]``, by byte popcount."""
+    as_bytes = rows.view(np.uint8)
+    shared = POPCOUNT[as_bytes & as_bytes[row]].sum(axis=1, dtype=np.int32)
+    union = POPCOUNT[as_bytes | as_bytes[row]].sum(axis=1, dtype=np.int32)
+    return np.divide(shared, union, out=np.zeros(len(rows)), where=union > 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--characters", type=int, nargs="*", default=[750, 100_000, 300_000])
+    parser.add_argument("--tags", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    for n in args.characters:
+        columns = {'Traits': item_lists(rng, n, 25, 1, 2, "trait"), 'Tags': item_lists(rng, n, args.tags, 2, 12, "tag")}
+        start = time.perf_counter()
+        index = TraitIndex(columns)
+        build = time.perf_counter() - start
+        queries = rng.choice(n, args.queries)
+
+        start = time.perf_counter()
+        for row in queries:
+            index.most_similar(row, N_OPTIONS - 1 + SPARE_OPTIONS)
+        now = (time.perf_counter() - start) / args.queries * 1000
+
+        # Same bitsets, one row per character
+        bits = np.unpackbits(index.bits.view(np.uint8), axis=1, count=n, bitorder='little')
+        rows = np.packbits(bits.T, axis=1, bitorder='little')
+        rows = np.ascontiguousarray(np.pad(rows, ((0, 0), (0, -rows.shape[1] % 8)))).view(np.uint64)
+        del bits
+        start = time.perf_counter()
+        for row in queries[:10]:
+            scores = row_major_jaccard(rows, row)
+            np.argpartition(-scores, N_OPTIONS + SPARE_OPTIONS)
+        before = (time.perf_counter() - start) / min(10, args.queries) * 1000
+        assert np.allclose(row_major_jaccard(rows, queries[0]), index.similarities(queries[0]))
+
+        print(f"{n:>7,} characters, {len(index.vocabulary):,} traits and tags: built in {build:.2f} s, "
+              f"{index.nbytes / 1e6:.1f} MB | most similar {now:.2f} ms/question "
+              f"(row-major popcount {before:.1f} ms)")
+
+
+if __name__ == "__main__":
+    main()
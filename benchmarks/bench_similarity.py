@@ -0,0 +1,152 @@
+"""Latency and agreement of the NumPy similarity engine against the Spark LSH backend.
+
+    python -m benchmarks.bench_similarity [--features-dir DIR] [--queries 50] [--profiles 2000]
+
+Uses the feature artifact built by ``python -m utils.features`` when it
+exists, a random matrix of the same shape otherwise. Taste profiles
+(``--profile-size`` random favourites each) are answered one by one, then in
+batches of ``PROFILE_BLOCK_SIZE`` per matrix product. The Spark part is
+skipped when pyspark is not installed.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from utils.features import ARTIFACT_DIR, load_features
+from utils.neighbours import PROFILE_BLOCK_SIZE
+from utils.similarity import SimilarityEngine, spark_top_k
+
+GENRE_WEIGHT_FACTOR = 7.0
+
+
+def synthetic_features(rows, numeric=7, binary=80, seed=0):
+    """Standardized numeric columns followed by sparse one-hot columns."""
+    rng = np.random.default_rng(seed)
+    matrix = np.hstack([
+        rng.standard_normal((rows, numeric)),
+        (rng.random((rows, binary)) < 0.05).astype(float),
+    ]).astype(np.float32)
+    return matrix, np.arange(1, rows + 1)
+
+
+def load_queries(args, rng):
+    """Feature matrix, anime ids and ``(anime_id, weights)`` queries."""
+    try:
+        store = load_features(args.features_dir)
+    except FileNotFoundError:
+        print(f"No feature artifact in {args.features_dir}, using {args.synthetic_rows} synthetic rows")
+        matrix, anime_ids = synthetic_features(args.synthetic_rows)
+        queries = []
+        for anime_id in rng.choice(anime_ids, size=args.queries, replace=False):
+            weights = np.ones(matrix.shape[1])
+            weights[rng.choice(np.arange(7, matrix.shape[1]), size=3, replace=False)] = GENRE_WEIGHT_FACTOR
+            queries.append((anime_id, weights))
+        return matrix, anime_ids, queries
+
+    display = store.display.set_index('anime_id')
+    queries = []
+    for anime_id in rng.choice(store.anime_ids, size=min(args.queries, len(store.anime_ids)), replace=False):
+        genres = display.loc[anime_id, 'Genres'].split(", ")
+        queries.append((anime_id, store.genre_weights(genres, GENRE_WEIGHT_FACTOR)))
+    return store.matrix, store.anime_ids, queries
+
+
+def reference_top_k(matrix, anime_ids, anime_id, k, weights):
+    """Brute force on a weighted copy, as the page used to build it."""
+    features = np.asarray(matrix, dtype=np.float64) * weights
+    row = int(np.flatnonzero(anime_ids == anime_id)[0])
+    distances = np.linalg.norm(features - features[row], axis=1)
+    distances[row] = np.inf
+    return anime_ids[np.argsort(distances, kind='stable')[:k]]
+
+
+def profile_throughput(engine, matrix, anime_ids, args, rng):
+    """Profiles per second answered one by one and in batches, and whether both agree."""
+    profiles = [rng.choice(anime_ids, size=args.profile_size, replace=False) for _ in range(args.profiles)]
+    weights = np.ones((len(profiles), matrix.shape[1]))
+    boosted = rng.random(weights.shape) < 0.05
+    weights[boosted] = GENRE_WEIGHT_FACTOR
+
+    start = time.perf_counter()
+    single = [engine.profile_top_k(profile, args.k, weights[i], args.metric)[0] for i, profile in enumerate(profiles)]
+    single_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = np.vstack([
+        engine.batch_profile_top_k(profiles[i:i + PROFILE_BLOCK_SIZE], args.k, weights[i:i + PROFILE_BLOCK_SIZE],
+                                   args.metric)[0]
+        for i in range(0, len(profiles), PROFILE_BLOCK_SIZE)
+    ])
+    batched_seconds = time.perf_counter() - start
+    return len(profiles) / single_seconds, len(profiles) / batched_seconds, np.array_equal(np.vstack(single), batched)
+
+
+def percentiles(timings):
+    timings_ms = np.array(timings) * 1000
+    return f"median {np.median(timings_ms):8.2f} ms | p99 {np.percentile(timings_ms, 99):8.2f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--features-dir", default=ARTIFACT_DIR)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--synthetic-rows", type=int, default=1000)
+    parser.add_argument("--metric", default="euclidean", choices=["euclidean", "cosine"])
+    parser.add_argument("--profiles", type=int, default=2000, help="Taste profiles for the batched queries")
+    parser.add_argument("--profile-size", type=int, default=5, help="Favourites per profile")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    matrix, anime_ids, queries = load_queries(args, rng)
+    print(f"Catalogue: {matrix.shape[0]} anime x {matrix.shape[1]} features, {len(queries)} queries, k={args.k}")
+
+    start = time.perf_counter()
+    engine = SimilarityEngine(matrix, anime_ids)
+    print(f"NumPy engine setup: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    numpy_results, numpy_timings = [], []
+    for anime_id, weights in queries:
+        start = time.perf_counter()
+        ids, _ = engine.top_k(anime_id, k=args.k, weights=weights, metric=args.metric)
+        numpy_timings.append(time.perf_counter() - start)
+        numpy_results.append(set(ids.tolist()))
+    print(f"NumPy  top-k : {percentiles(numpy_timings)}")
+
+    if args.metric == "euclidean":
+        exact = np.mean([
+            len(result & set(reference_top_k(matrix, anime_ids, anime_id, args.k, weights).tolist())) / args.k
+            for result, (anime_id, weights) in zip(numpy_results, queries)
+        ])
+        print(f"Agreement with brute force: {exact:.1%}")
+
+    single, batched, same = profile_throughput(engine, matrix, anime_ids, args, rng)
+    print(f"Profiles of {args.profile_size}: {single:,.0f}/s one by one, {batched:,.0f}/s batched "
+          f"(x{batched / single:.1f}), {'same' if same else 'DIFFERENT'} results")
+
+    try:
+        from pyspark.sql import SparkSession
+    except ImportError:
+        print("pyspark is not installed, skipping the Spark LSH comparison")
+        return
+
+    start = time.perf_counter()
+    spark = SparkSession.builder.appName("AnimeRecommendationBenchmark").getOrCreate()
+    print(f"Spark session startup: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    spark_results, spark_timings = [], []
+    for anime_id, weights in queries:
+        start = time.perf_counter()
+        ids = spark_top_k(matrix, anime_ids, anime_id, k=args.k, weights=weights, spark=spark)
+        spark_timings.append(time.perf_counter() - start)
+        spark_results.append(set(ids))
+    print(f"Spark  LSH   : {percentiles(spark_timings)}")
+
+    agreement = np.mean([len(a & b) / args.k for a, b in zip(numpy_results, spark_results)])
+    speedup = np.median(spark_timings) / np.median(numpy_timings)
+    print(f"Agreement with Spark LSH: {agreement:.1%} | median speedup x{speedup:.0f}")
+
+
+if __name__ == "__main__":
+    main()
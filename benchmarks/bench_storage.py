@@ -0,0 +1,82 @@
+"""Cold-start time and resident memory of the Who Watches page datasets, CSV against Parquet.
+
+    python -m utils.storage              # build the Parquet files first
+    python -m benchmarks.bench_storage [--repeat 3]
+
+Each load runs in a fresh interpreter so every measurement is a cold start.
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+
+def load_csv():
+    """What load_data() used to do."""
+    import pandas as pd
+    anime_df = pd.read_csv('data/anime/anime-dataset-2023.csv')
+    user_details_df = pd.read_csv('data/user/users-details-2023.csv')
+    user_scores_df = pd.read_csv('data/user/user_scores_filtered.csv')
+    anime_filtered_df = pd.read_csv('data/anime/anime-filtered.csv')
+    anime_df['Score'] = pd.to_numeric(anime_df['Score'], errors='coerce')
+    return anime_df, user_details_df, user_scores_df, anime_filtered_df
+
+
+def load_parquet():
+    """What load_data() does now."""
+    from utils.storage import load_table
+    return (
+        load_table('anime', columns=['Name', 'Score', 'Genres', 'Image URL']),
+        load_table('user_details', columns=['Mal ID', 'Gender', 'Days Watched', 'Episodes Watched']),
+        load_table('user_scores', columns=['user_id', 'anime_id', 'rating']),
+        load_table('anime_filtered', columns=['anime_id', 'Name', 'Score', 'Popularity', 'Members', 'Watching', 'Completed']),
+    )
+
+
+LOADERS = {'csv': load_csv, 'parquet': load_parquet}
+
+
+def measure(mode):
+    """Run one load in this process and print its measurements as JSON."""
+    import pandas  # noqa: F401  (import cost is not part of the load)
+    import pyarrow  # noqa: F401
+    baseline_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    frames = LOADERS[mode]()
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'seconds': elapsed,
+        'peak_rss_mb': (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - baseline_rss) / 1024,
+        'frames_mb': sum(df.memory_usage(deep=True).sum() for df in frames) / 1e6,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--measure", choices=list(LOADERS), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    for mode in LOADERS:
+        runs = []
+        for _ in range(args.repeat):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_storage", "--measure", mode],
+                capture_output=True, text=True, check=True,
+            ).stdout
+            runs.append(json.loads(output))
+        print(f"{mode:8s}: cold start {np.median([r['seconds'] for r in runs]):6.2f} s | "
+              f"peak RSS +{np.median([r['peak_rss_mb'] for r in runs]):7.1f} MB | "
+              f"frames {runs[0]['frames_mb']:7.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Build time, size and query latency of the synopsis index at the size of the full anime dataset.
+
+    python -m benchmarks.bench_synopsis [--anime 25000] [--max-terms 64] [--max-postings 100 500]
+
+Synopses are synthetic (``benchmarks.synthetic.synopses``: 30 to 200 words
+drawn with Zipf frequencies from a 20,000-word vocabulary). The index is
+written to a scratch directory and loaded back memory-mapped, as the page
+does; queries are timed for one and five favourites, exact and pruned to the
+heaviest ``--max-postings`` of each term (with their recall of the exact top
+10).
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import synopses
+from utils.synopsis import MAX_TERMS, build_synopsis_index, index_size_mb, load_synopsis_index, save_synopsis_index
+
+
+def top(scores, exclude, k=10):
+    scores = scores.copy()
+    scores[exclude] = -np.inf
+    return set(np.argpartition(-scores, k)[:k])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--anime", type=int, default=25_000)
+    parser.add_argument("--max-terms", type=int, default=MAX_TERMS)
+    parser.add_argument("--bigrams", action="store_true")
+    parser.add_argument("--max-postings", type=int, nargs="*", default=[100, 500])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    texts = synopses(rng, args.anime)
+    anime_ids = np.arange(1, args.anime + 1)
+
+    start = time.perf_counter()
+    forward, inverted, n_terms = build_synopsis_index(texts, args.max_terms, bigrams=args.bigrams)
+    print(f"{args.anime:,} synopses -> {n_terms:,} terms, {len(forward[2]):,} weights, "
+          f"built in {time.perf_counter() - start:.1f} s")
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        save_synopsis_index(anime_ids, forward, inverted, output_dir)
+        start = time.perf_counter()
+        index = load_synopsis_index(output_dir)
+        print(f"Index {index_size_mb(index):.1f} MB, loaded (memory-mapped) in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        for size in (1, 5):
+            profiles = [rng.choice(anime_ids, size, replace=False) for _ in range(args.queries)]
+            for aggregate in ("mean", "max"):
+                if size == 1 and aggregate == "max":
+                    continue
+                exact = []
+                start = time.perf_counter()
+                for profile in profiles:
+                    exact.append(index.similarities(profile, aggregate))
+                line = [f"exact {(time.perf_counter() - start) / len(profiles) * 1000:.2f} ms"]
+                for max_postings in args.max_postings:
+                    start = time.perf_counter()
+                    pruned = [index.similarities(profile, aggregate, max_postings) for profile in profiles]
+                    elapsed = time.perf_counter() - start
+                    recall = [len(top(p, profile - 1) & top(e, profile - 1)) / 10
+                              for profile, p, e in zip(profiles, pruned, exact)]
+                    line.append(f"pruned to {max_postings} postings {elapsed / len(profiles) * 1000:.2f} ms"
+                                f" (recall@10 {np.mean(recall):.2f})")
+                print(f"{size} favourite(s), {aggregate}: " + ", ".join(line))
+
+
+if __name__ == "__main__":
+    main()
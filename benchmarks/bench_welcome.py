@@ -0,0 +1,153 @@
+"""Server threads and CPU of the Welcome page carousel per simulated visitor.
+
+    python -m benchmarks.bench_welcome [--sessions 100] [--duration 30] [--modes client fragment]
+
+For each carousel mode, starts ``streamlit run Welcome.py`` against a local
+mock of Jikan (``utils.mock_jikan``), opens ``--sessions`` browser sessions
+over the Streamlit websocket and, once their first run is over, samples the
+server's thread count and CPU time for ``--duration`` seconds.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from utils.mock_jikan import serve
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def threads_and_cpu(pid):
+    """Thread count and CPU seconds (user + system) of process ``pid``, Linux only."""
+    with open(f"/proc/{pid}/status") as f:
+        threads = next(int(line.split()[1]) for line in f if line.startswith("Threads:"))
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return threads, (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def wait_for_server(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1)
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("streamlit did not start")
+
+
+async def open_sessions(port, n):
+    """Open ``n`` sessions that each request a first run of the page, like a browser tab does."""
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from tornado.websocket import websocket_connect
+
+    msg = BackMsg()
+    msg.rerun_script.query_string = ""
+    msg.rerun_script.page_script_hash = ""
+    payload = msg.SerializeToString()
+
+    connections = []
+    for _ in range(n):
+        connection = await websocket_connect(f"ws://127.0.0.1:{port}/_stcore/stream", subprotocols=["streamlit"])
+        await connection.write_message(payload, binary=True)
+        connections.append(connection)
+    return connections
+
+
+async def run_sessions(connections, pid, warmup, duration):
+    """Keep the sessions alive, sampling the server after ``warmup`` and ``warmup + duration`` seconds.
+
+    Like the browser, a session asks for the periodic reruns of a fragment
+    with ``run_every`` itself, when the server sends it an ``auto_rerun``.
+    """
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    async def auto_rerun(connection, interval, fragment_id):
+        msg = BackMsg()
+        msg.rerun_script.query_string = ""
+        msg.rerun_script.page_script_hash = ""
+        msg.rerun_script.fragment_id = fragment_id
+        while True:
+            await asyncio.sleep(interval)
+            await connection.write_message(msg.SerializeToString(), binary=True)
+
+    tasks = []
+
+    async def read(connection):
+        while (payload := await connection.read_message()) is not None:
+            msg = ForwardMsg()
+            msg.ParseFromString(payload)
+            if msg.HasField("auto_rerun"):
+                tasks.append(asyncio.ensure_future(
+                    auto_rerun(connection, msg.auto_rerun.interval, msg.auto_rerun.fragment_id)))
+
+    tasks.extend(asyncio.ensure_future(read(connection)) for connection in connections)
+    await asyncio.sleep(warmup)
+    start = threads_and_cpu(pid)
+    await asyncio.sleep(duration)
+    end = threads_and_cpu(pid)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return start, end
+
+
+def measure(mode, sessions, duration, warmup, jikan_url, script="Welcome.py"):
+    port = free_port()
+    env = {**os.environ, 'CAROUSEL_MODE': mode, 'JIKAN_BASE_URL': jikan_url}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", script, "--server.headless", "true",
+         "--server.port", str(port), "--browser.gatherUsageStats", "false"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_server(port)
+        idle_threads, _ = threads_and_cpu(server.pid)
+        loop = asyncio.new_event_loop()
+        connections = loop.run_until_complete(open_sessions(port, sessions))
+        (threads_start, cpu_start), (threads_end, cpu_end) = loop.run_until_complete(
+            run_sessions(connections, server.pid, warmup, duration))
+        for connection in connections:
+            connection.close()
+        loop.close()
+    finally:
+        server.terminate()
+        server.wait()
+    per_100 = 100 / sessions
+    return {
+        'idle_threads': idle_threads,
+        'threads': max(threads_start, threads_end),
+        'cpu_per_minute': (cpu_end - cpu_start) * 60 / duration,
+        'per_100': per_100,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=30.0, help="Measurement window (s)")
+    parser.add_argument("--warmup", type=float, default=10.0, help="Time left to the first runs before measuring (s)")
+    parser.add_argument("--modes", nargs="*", default=["client", "fragment"])
+    parser.add_argument("--jikan-port", type=int, default=8090)
+    parser.add_argument("--script", default="Welcome.py", help="Page to run, e.g. a copy of an older version to compare")
+    args = parser.parse_args()
+
+    jikan = serve(args.jikan_port, rate_limit=0)
+    jikan_url = f"http://127.0.0.1:{args.jikan_port}/v4"
+    print(f"{args.sessions} sessions, {args.duration:.0f} s window")
+    for mode in args.modes:
+        r = measure(mode, args.sessions, args.duration, args.warmup, jikan_url, args.script)
+        extra_threads = (r['threads'] - r['idle_threads']) * r['per_100']
+        print(f"{mode:>9}: {r['threads']} threads ({r['idle_threads']} idle, {extra_threads:+.0f} per 100 sessions), "
+              f"{r['cpu_per_minute'] * r['per_100']:.2f} CPU s per minute per 100 sessions")
+    jikan.shutdown()
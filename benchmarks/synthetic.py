@@ -0,0 +1,185 @@
+"""Synthetic versions of the Kaggle and anime-planet datasets, at any scale.
+
+    python -m benchmarks.synthetic --root /tmp/streamimanga --scale 10
+
+writes every CSV the pages read under ``ROOT/data/`` (same paths and columns
+as ``utils.storage.DATASETS``). Scale 1 is ``BASE_SIZES`` rows; the real
+dataset is roughly scale 25 for anime and 370 for users.
+"""
+import argparse
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from PIL import Image
+
+from utils.storage import DATASETS
+
+BASE_SIZES = {'anime': 1000, 'users': 2000, 'scores': 50_000, 'characters': 300}
+
+GENRES = ['Action', 'Adventure', 'Comedy', 'Drama', 'Fantasy', 'Romance', 'Sci-Fi', 'Slice of Life',
+          'Sports', 'Mystery', 'Horror', 'Supernatural']
+WORDS = ['ninja', 'school', 'robot', 'love', 'magic', 'war', 'space', 'cooking', 'sports', 'demon',
+         'friendship', 'tournament', 'idol', 'detective', 'dragon', 'time', 'travel', 'village']
+TAGS = ['Adult', 'Glasses', 'Ninja', 'Scar', 'Student', 'Swordsman', 'Ponytail', 'Villain', 'Orphan', 'Hero']
+
+
+def pick_lists(rng, pool, n, max_items, sep=", "):
+    """``n`` strings of 1 to ``max_items`` distinct sorted items of ``pool``."""
+    pool = np.asarray(pool)
+    counts = rng.integers(1, max_items + 1, n)
+    keys = rng.random((n, len(pool))).argsort(axis=1)
+    return [sep.join(sorted(pool[keys[i, :counts[i]]])) for i in range(n)]
+
+
+def synopses(rng, n, vocabulary=20_000, min_words=30, max_words=200):
+    """``n`` texts of ``WORDS`` and made-up words drawn with Zipf frequencies, like natural language."""
+    words = np.array(WORDS + [f"w{j}" for j in range(vocabulary - len(WORDS))])
+    frequencies = 1 / np.arange(1, len(words) + 1)
+    lengths = rng.integers(min_words, max_words + 1, n)
+    drawn = words[rng.choice(len(words), lengths.sum(), p=frequencies / frequencies.sum())]
+    return [" ".join(text) for text in np.split(drawn, np.cumsum(lengths)[:-1])]
+
+
+def anime_table(rng, n, image_base):
+    ids = np.arange(1, n + 1)
+    score = rng.uniform(5, 9.5, n).round(2).astype(str)
+    score[rng.random(n) < 0.05] = 'UNKNOWN'
+    return pd.DataFrame({
+        'anime_id': ids,
+        'Name': [f"Anime {i}" for i in ids],
+        'English name': [f"English title {i}" for i in ids],
+        'Other name': [f"アニメ {i}" for i in ids],
+        'Score': score,
+        'Genres': pick_lists(rng, GENRES, n, 3),
+        'Synopsis': synopses(rng, n),
+        'Type': rng.choice(['TV', 'Movie', 'OVA', 'ONA', 'Special'], n),
+        'Episodes': rng.integers(1, 100, n).astype(float),
+        'Aired': "Apr 1, 2010 to Jun 30, 2010",
+        'Premiered': "spring 2010",
+        'Status': rng.choice(['Finished Airing', 'Currently Airing'], n, p=[0.9, 0.1]),
+        'Producers': pick_lists(rng, [f"Producer {j}" for j in range(40)], n, 2),
+        'Licensors': pick_lists(rng, [f"Licensor {j}" for j in range(10)], n, 1),
+        'Studios': pick_lists(rng, [f"Studio {j}" for j in range(30)], n, 1),
+        'Source': rng.choice(['Manga', 'Original', 'Light novel', 'Visual novel'], n),
+        'Duration': "24 min per ep",
+        'Rating': rng.choice(['G - All Ages', 'PG-13 - Teens 13 or older', 'R - 17+ (violence & profanity)'], n),
+        'Rank': ids.astype(float),
+        'Popularity': rng.permutation(n) + 1,
+        'Favorites': rng.integers(0, 10_000, n),
+        'Scored By': rng.integers(100, 1_000_000, n).astype(float),
+        'Members': rng.integers(100, 3_000_000, n),
+        'Image URL': [f"{image_base}/anime/{i}.jpg" for i in ids],
+    })
+
+
+def anime_filtered_table(rng, anime):
+    sample = anime.sample(frac=0.5, random_state=0)
+    n = len(sample)
+    return pd.DataFrame({
+        'anime_id': sample['anime_id'], 'Name': sample['Name'], 'Score': sample['Score'], 'Genres': sample['Genres'],
+        'English name': sample['English name'], 'Japanese name': sample['Other name'], 'sypnopsis': sample['Synopsis'],
+        'Type': sample['Type'], 'Episodes': sample['Episodes'], 'Aired': sample['Aired'], 'Premiered': sample['Premiered'],
+        'Producers': sample['Producers'], 'Licensors': sample['Licensors'], 'Studios': sample['Studios'],
+        'Source': sample['Source'], 'Duration': sample['Duration'], 'Rating': sample['Rating'], 'Ranked': sample['Rank'],
+        'Popularity': sample['Popularity'], 'Members': sample['Members'], 'Favorites': sample['Favorites'],
+        'Watching': rng.integers(0, 100_000, n), 'Completed': rng.integers(0, 1_000_000, n),
+        'On-Hold': rng.integers(0, 10_000, n), 'Dropped': rng.integers(0, 10_000, n),
+    })
+
+
+def user_details_table(rng, n):
+    return pd.DataFrame({
+        'Mal ID': np.arange(1, n + 1),
+        'Username': [f"user{i}" for i in range(n)],
+        'Gender': rng.choice(np.array(['Male', 'Female', 'Non-Binary', None], dtype=object), n, p=[0.5, 0.3, 0.05, 0.15]),
+        'Birthday': "2000-01-01T00:00:00+00:00",
+        'Location': "Paris",
+        'Joined': "2010-01-01T00:00:00+00:00",
+        'Days Watched': rng.uniform(0, 500, n).round(1),
+        'Mean Score': rng.uniform(0, 10, n).round(2),
+        'Watching': rng.integers(0, 50, n), 'Completed': rng.integers(0, 500, n), 'On Hold': rng.integers(0, 20, n),
+        'Dropped': rng.integers(0, 20, n), 'Plan to Watch': rng.integers(0, 100, n),
+        'Total Entries': rng.integers(0, 600, n), 'Rewatched': rng.integers(0, 30, n),
+        'Episodes Watched': rng.integers(0, 20_000, n),
+    })
+
+
+def user_scores_table(rng, n, n_users, anime_ids):
+    # Popular anime get most of the ratings, like on MyAnimeList
+    weights = 1 / np.arange(1, len(anime_ids) + 1) ** 0.8
+    return pd.DataFrame({
+        'user_id': rng.integers(1, n_users + 1, n),
+        'Username': "user",
+        'anime_id': rng.choice(anime_ids, n, p=weights / weights.sum()),
+        'Anime Title': "Anime",
+        'rating': rng.integers(1, 11, n),
+    })
+
+
+def characters_table(rng, n, anime, image_base):
+    titles = anime['Name'].to_numpy()[:max(1, n // 10)]
+    return pd.DataFrame({
+        'Nom': [f"Character {i}" for i in range(n)],
+        'Lien Profil': [f"https://www.anime-planet.com/characters/character-{i}" for i in range(n)],
+        'Image': [f"{image_base}/characters/{i}.jpg" for i in range(n)],
+        'Traits': pick_lists(rng, ['Male', 'Female', 'Black Hair', 'Blonde Hair', 'Blue Eyes'], n, 2),
+        'Tags': pick_lists(rng, TAGS, n, 4),
+        'Anime Associé': rng.choice(titles, n),
+        'Manga Associé': rng.choice(titles, n),
+    })
+
+
+def write_datasets(root, scale=1, image_base="http://127.0.0.1:8092", seed=0):
+    """Write every dataset at ``scale`` under ``root``; returns the number of rows of each."""
+    rng = np.random.default_rng(seed)
+    sizes = {name: max(1, int(size * scale)) for name, size in BASE_SIZES.items()}
+    anime = anime_table(rng, sizes['anime'], image_base)
+    tables = {
+        'anime': anime,
+        'anime_filtered': anime_filtered_table(rng, anime),
+        'user_details': user_details_table(rng, sizes['users']),
+        'user_scores': user_scores_table(rng, sizes['scores'], sizes['users'], anime['anime_id'].to_numpy()),
+        'characters': characters_table(rng, sizes['characters'], anime, image_base),
+    }
+    for name, df in tables.items():
+        path = os.path.join(root, DATASETS[name]['csv'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path, index=False)
+    return {name: len(df) for name, df in tables.items()}
+
+
+def serve_images(port=8092):
+    """Serve the same small JPEG for any path (character and anime images); returns the server."""
+    buf = BytesIO()
+    Image.new("RGB", (285, 399), (120, 90, 160)).save(buf, format="JPEG")
+    body = buf.getvalue()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", required=True, help="Directory under which data/ is written")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--image-base", default="http://127.0.0.1:8092")
+    args = parser.parse_args()
+
+    rows = write_datasets(args.root, args.scale, args.image_base)
+    print(", ".join(f"{name}: {n:,} rows" for name, n in rows.items()))
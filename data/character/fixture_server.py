@@ -0,0 +1,138 @@
+"""Serveur local qui remplace anime-planet pour tester le scraper.
+
+Il sert soit des pages HTML sauvegardées (``--fixtures DIR``, fichiers
+``page-<n>.html``), soit des pages générées à partir du CSV des personnages
+avec la même structure que celles d'anime-planet. Il peut simuler de la
+latence et des erreurs pour exercer le rate limit et les nouveaux essais :
+
+    python fixture_server.py --port 8000 --error-rate 0.1 --latency 0.2
+    python scrap_characters.py --base-url http://127.0.0.1:8000/characters/all --rate 20 --workers 8
+
+Chaque page a un ETag (requêtes conditionnelles, 304 si elle n'a pas changé).
+``--save DIR`` écrit les pages générées dans DIR pour s'en servir de fixtures.
+"""
+import argparse
+import hashlib
+import html
+import os
+import random
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+SITE = "https://www.anime-planet.com"
+
+
+def render_list(title, items, css_class=None):
+    class_attr = f' class="{css_class}"' if css_class else ""
+    links = "".join(f'<li><a href="#">{html.escape(item)}</a></li>' for item in items)
+    return f"<div{class_attr}><h4>{title}</h4><ul>{links}</ul></div>"
+
+
+def render_row(character):
+    def values(col):
+        value = character[col]
+        return [v for v in str(value).split(", ") if v] if isinstance(value, str) else []
+
+    anime = [] if character["Anime Associé"] == "Aucun anime" else [character["Anime Associé"]]
+    manga = [] if character["Manga Associé"] == "Aucun manga" else [character["Manga Associé"]]
+    href = str(character["Lien Profil"]).replace(SITE, "")
+    return (
+        "<tr>"
+        f'<td class="tableAvatar"><a href="{html.escape(href)}"><img src="{html.escape(str(character["Image"]))}" alt=""></a></td>'
+        f'<td class="tableCharInfo"><a href="{html.escape(href)}" class="name">{html.escape(str(character["Nom"]))}</a>'
+        f'{render_list("Traits", values("Traits"), "tags tags--plain")}{render_list("Tags", values("Tags"), "tags")}</td>'
+        '<td class="tableAnime">'
+        f'{"".join(f"<div><h4>Anime</h4><ul><li>{html.escape(a)}</li></ul></div>" for a in anime) or "<div><h4>Anime</h4><ul></ul></div>"}'
+        f'{"".join(f"<div><h4>Manga</h4><ul><li>{html.escape(m)}</li></ul></div>" for m in manga) or "<div><h4>Manga</h4><ul></ul></div>"}'
+        "</td></tr>"
+    )
+
+
+def render_page(characters):
+    rows = "".join(render_row(character) for _, character in characters.iterrows())
+    return (
+        "<!DOCTYPE html><html><head><title>Characters | Anime-Planet</title></head><body>"
+        '<table class="pure-table striped">'
+        f"<tbody>{rows}</tbody></table></body></html>"
+    )
+
+
+def pages_from_csv(path, rows_per_page):
+    df = pd.read_csv(path)
+    return {
+        i // rows_per_page + 1: render_page(df.iloc[i:i + rows_per_page])
+        for i in range(0, len(df), rows_per_page)
+    }
+
+
+def pages_from_dir(path):
+    pages = {}
+    for name in os.listdir(path):
+        if name.startswith("page-") and name.endswith(".html"):
+            with open(os.path.join(path, name), encoding="utf-8") as f:
+                pages[int(name[len("page-"):-len(".html")])] = f.read()
+    return pages
+
+
+def make_handler(pages, error_rate, latency):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            if random.random() < error_rate:
+                self.send_response(503)
+                self.send_header("Retry-After", "0")
+                self.end_headers()
+                return
+            page = int(parse_qs(urlparse(self.path).query).get("page", ["1"])[0])
+            if page not in pages:
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = pages[page].encode("utf-8")
+            etag = f'"{hashlib.md5(body).hexdigest()}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serveur local de pages de personnages.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--fixtures", help="Dossier de pages sauvegardées (page-<n>.html)")
+    parser.add_argument("--csv", default="anime_planet_characters.csv", help="CSV à partir duquel générer les pages")
+    parser.add_argument("--rows-per-page", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=1, help="Répète les pages générées pour simuler plus de pages")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Part des requêtes qui renvoient 503")
+    parser.add_argument("--latency", type=float, default=0.0, help="Délai de chaque réponse (s)")
+    parser.add_argument("--save", help="Écrit les pages dans ce dossier et quitte")
+    args = parser.parse_args()
+
+    pages = pages_from_dir(args.fixtures) if args.fixtures else pages_from_csv(args.csv, args.rows_per_page)
+    n = len(pages)
+    pages = {page + k * n: pages[page] for k in range(args.repeat) for page in pages}
+
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        for page, content in pages.items():
+            with open(os.path.join(args.save, f"page-{page}.html"), "w", encoding="utf-8") as f:
+                f.write(content)
+        print(f"{len(pages)} pages écrites dans {args.save}")
+    else:
+        print(f"{len(pages)} pages servies sur http://127.0.0.1:{args.port}/characters/all")
+        ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(pages, args.error_rate, args.latency)).serve_forever()
@@ -1,79 +1,383 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-import pandas as pd
-import time
+from requests.adapters import HTTPAdapter
 
 # URL de base pour la première page de personnages
 base_url = "https://www.anime-planet.com/characters/all"
 
+# Colonnes du CSV, un personnage est identifié par son lien de profil
+COLUMNS = ["Nom", "Lien Profil", "Image", "Traits", "Tags", "Anime Associé", "Manga Associé"]
+KEY = "Lien Profil"
+
 # En-tête pour imiter un navigateur
 headers = {
     "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/89.0.4389.82 Safari/537.36"
 }
 
-# Liste pour stocker les données des personnages
-characters_data = []
-
-# Fonction pour scraper une page donnée
-def scrape_characters_page(url):
-    response = requests.get(url, headers=headers)  # Ajout des en-têtes
-    if response.status_code == 200:
-        soup = BeautifulSoup(response.text, 'html.parser')
-        characters = soup.select("tr")  # Sélection de chaque ligne de personnage
-
-        for character in characters:
-            try:
-                # Lien de l'image
-                image_tag = character.select_one("td.tableAvatar img")
-                image_url = image_tag["src"] if image_tag else None
-
-                # Nom et lien du personnage
-                name_tag = character.select_one("td.tableCharInfo a.name")
-                name = name_tag.text.strip() if name_tag else None
-                profile_link = "https://www.anime-planet.com" + name_tag["href"] if name_tag else None
-
-                # Traits (premier groupe de tags)
-                traits_list = [trait.text.strip() for trait in character.select("div.tags:nth-of-type(1) ul li a")]
-
-                # Tags (deuxième groupe de tags)
-                tags_list = [tag.text.strip() for tag in character.select("div.tags:nth-of-type(2) ul li a")]
-
-                # Premier Anime associé
-                first_anime_tag = character.select_one("td.tableAnime div:nth-of-type(1) ul li")
-                anime_title = first_anime_tag.text.strip() if first_anime_tag else "Aucun anime"
-
-                # Premier Manga associé
-                first_manga_tag = character.select_one("td.tableAnime div:nth-of-type(2) ul li")
-                manga_title = first_manga_tag.text.strip() if first_manga_tag else "Aucun manga"
-
-                # Ajouter les données dans la liste
-                characters_data.append({
-                    "Nom": name,
-                    "Lien Profil": profile_link,
-                    "Image": image_url,
-                    "Traits": ", ".join(traits_list),
-                    "Tags": ", ".join(tags_list),
-                    "Anime Associé": anime_title,
-                    "Manga Associé": manga_title
-                })
-                print(f"Personnage '{name}' scrappé avec succès.")
-            except Exception as e:
-                print(f"Erreur lors de l'extraction d'un personnage : {e}")
+
+class TokenBucket:
+    """Limiteur de débit partagé entre les threads : `rate` requêtes par seconde, rafales de `capacity`."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def make_session(pool_size):
+    """Session HTTP avec un pool de connexions réutilisées par tous les threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers)
+    return session
+
+
+def page_url(page, base=base_url):
+    return base if page == 1 else f"{base}?page={page}"
+
+
+# Extraction des personnages d'une page avec BeautifulSoup (référence)
+def parse_bs4(html):
+    characters_data = []
+    soup = BeautifulSoup(html, 'html.parser')
+    characters = soup.select("tr")  # Sélection de chaque ligne de personnage
+
+    for character in characters:
+        try:
+            # Lien de l'image
+            image_tag = character.select_one("td.tableAvatar img")
+            image_url = image_tag["src"] if image_tag else None
+
+            # Nom et lien du personnage
+            name_tag = character.select_one("td.tableCharInfo a.name")
+            name = name_tag.text.strip() if name_tag else None
+            profile_link = "https://www.anime-planet.com" + name_tag["href"] if name_tag else None
+
+            # Traits (premier groupe de tags)
+            traits_list = [trait.text.strip() for trait in character.select("div.tags:nth-of-type(1) ul li a")]
+
+            # Tags (deuxième groupe de tags)
+            tags_list = [tag.text.strip() for tag in character.select("div.tags:nth-of-type(2) ul li a")]
+
+            # Premier Anime associé
+            first_anime_tag = character.select_one("td.tableAnime div:nth-of-type(1) ul li")
+            anime_title = first_anime_tag.text.strip() if first_anime_tag else "Aucun anime"
+
+            # Premier Manga associé
+            first_manga_tag = character.select_one("td.tableAnime div:nth-of-type(2) ul li")
+            manga_title = first_manga_tag.text.strip() if first_manga_tag else "Aucun manga"
+
+            # Ajouter les données dans la liste
+            characters_data.append({
+                "Nom": name,
+                "Lien Profil": profile_link,
+                "Image": image_url,
+                "Traits": ", ".join(traits_list),
+                "Tags": ", ".join(tags_list),
+                "Anime Associé": anime_title,
+                "Manga Associé": manga_title
+            })
+        except Exception as e:
+            print(f"Erreur lors de l'extraction d'un personnage : {e}")
+    return characters_data
+
+
+def _has_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+# Les mêmes sélecteurs en XPath, compilés une fois (div:nth-of-type(n) = n-ième div parmi ses frères)
+_XPATHS = {
+    "image": f".//td[{_has_class('tableAvatar')}]//img",
+    "name": f".//td[{_has_class('tableCharInfo')}]//a[{_has_class('name')}]",
+    "traits": f".//div[{_has_class('tags')}][count(preceding-sibling::div) = 0]//ul//li//a",
+    "tags": f".//div[{_has_class('tags')}][count(preceding-sibling::div) = 1]//ul//li//a",
+    "anime": f".//td[{_has_class('tableAnime')}]//div[count(preceding-sibling::div) = 0]//ul//li",
+    "manga": f".//td[{_has_class('tableAnime')}]//div[count(preceding-sibling::div) = 1]//ul//li",
+}
+_compiled_xpaths = None
+
+
+# Extraction avec lxml : même résultat que parse_bs4, plusieurs fois plus rapide
+def parse_lxml(html):
+    global _compiled_xpaths
+    from lxml import etree
+    from lxml import html as lxml_html
+    if _compiled_xpaths is None:
+        _compiled_xpaths = {key: etree.XPath(path) for key, path in _XPATHS.items()}
+    xpath = _compiled_xpaths
+
+    if not html.strip():
+        return []
+    characters_data = []
+    for character in lxml_html.fromstring(html).iter("tr"):
+        try:
+            image_tags = xpath["image"](character)
+            image_url = image_tags[0].attrib["src"] if image_tags else None
+
+            name_tags = xpath["name"](character)
+            name = name_tags[0].text_content().strip() if name_tags else None
+            profile_link = "https://www.anime-planet.com" + name_tags[0].attrib["href"] if name_tags else None
+
+            anime_tags = xpath["anime"](character)
+            manga_tags = xpath["manga"](character)
+
+            characters_data.append({
+                "Nom": name,
+                "Lien Profil": profile_link,
+                "Image": image_url,
+                "Traits": ", ".join(a.text_content().strip() for a in xpath["traits"](character)),
+                "Tags": ", ".join(a.text_content().strip() for a in xpath["tags"](character)),
+                "Anime Associé": anime_tags[0].text_content().strip() if anime_tags else "Aucun anime",
+                "Manga Associé": manga_tags[0].text_content().strip() if manga_tags else "Aucun manga"
+            })
+        except Exception as e:
+            print(f"Erreur lors de l'extraction d'un personnage : {e}")
+    return characters_data
+
+
+PARSERS = {"bs4": parse_bs4, "lxml": parse_lxml}
+
+
+def default_parser():
+    """lxml s'il est installé, BeautifulSoup sinon."""
+    try:
+        import lxml  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "bs4"
+
+
+# Fonction pour extraire les personnages d'une page
+def scrape_characters_page(html, parser=None):
+    return PARSERS[parser or default_parser()](html)
+
+
+def fetch_page(session, url, bucket, retries=5, backoff=1.0, validators=None):
+    """Télécharge une page, en réessayant avec un délai exponentiel si le statut n'est pas 200.
+
+    Avec `validators` (ETag / Last-Modified d'un passage précédent), la requête
+    est conditionnelle et peut renvoyer 304. Renvoie la réponse (200 ou 304),
+    ou None après le dernier essai.
+    """
+    request_headers = {}
+    if validators:
+        if validators.get("etag"):
+            request_headers["If-None-Match"] = validators["etag"]
+        if validators.get("last_modified"):
+            request_headers["If-Modified-Since"] = validators["last_modified"]
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            response = session.get(url, headers=request_headers, timeout=30)
+            if response.status_code in (200, 304):
+                return response
+            status = response.status_code
+            retry_after = response.headers.get("Retry-After")
+        except requests.RequestException as e:
+            status, retry_after = e, None
+        if attempt == retries:
+            break
+        delay = float(retry_after) if retry_after and retry_after.isdigit() else backoff * 2 ** attempt
+        delay += random.uniform(0, backoff)
+        print(f"Erreur lors du chargement de la page : {url} ({status}), nouvel essai dans {delay:.1f} s")
+        time.sleep(delay)
+    print(f"Abandon de la page : {url} ({status})")
+    return None
+
+
+def read_jsonl(path):
+    """Entrées d'un fichier JSON lines indexées par page (la dernière l'emporte)."""
+    entries = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # dernière ligne tronquée par un arrêt brutal
+                entries[entry["page"]] = entry
+    return entries
+
+
+def content_hash(characters):
+    return hashlib.sha256(json.dumps(characters, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def append_rows(path, characters):
+    """Ajoute des personnages à la fin d'un CSV, en écrivant l'en-tête s'il n'existe pas."""
+    if characters:
+        pd.DataFrame(characters, columns=COLUMNS).to_csv(
+            path, mode="a", header=not os.path.exists(path), index=False, encoding="utf-8"
+        )
+
+
+def merge_rows(delta_paths, output_path, existing_path=None, chunksize=10_000):
+    """Fusionne les personnages des CSV `delta_paths` dans `existing_path` et écrit `output_path`.
+
+    Un personnage est identifié par son `Lien Profil` : la version du delta
+    remplace l'ancienne et les doublons sont supprimés. Les fichiers sont lus
+    par morceaux, seule la liste des liens est gardée en mémoire.
+    """
+    delta_paths = [path for path in delta_paths if os.path.exists(path)]
+    delta_links = set()
+    for path in delta_paths:
+        for chunk in pd.read_csv(path, usecols=[KEY], chunksize=chunksize):
+            delta_links.update(chunk[KEY])
+
+    seen = set()
+    tmp_path = f"{output_path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    def copy(path, skip):
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            keep = ~chunk[KEY].isin(skip) & ~chunk[KEY].isin(seen) & ~chunk[KEY].duplicated()
+            seen.update(chunk.loc[keep, KEY])
+            append_rows(tmp_path, chunk[keep].to_dict("records"))
+
+    if existing_path and os.path.exists(existing_path):
+        copy(existing_path, delta_links)
+    for path in delta_paths:
+        copy(path, set())
+    if not os.path.exists(tmp_path):
+        pd.DataFrame(columns=COLUMNS).to_csv(tmp_path, index=False, encoding="utf-8")
+    os.replace(tmp_path, output_path)
+    return len(seen)
+
+
+def rows_path(rows_dir, page):
+    return os.path.join(rows_dir, f"page-{page}.csv")
+
+
+def scrape(pages, base=base_url, workers=4, rate=0.5, burst=1, retries=5, backoff=1.0,
+           checkpoint="scrap_checkpoint.jsonl", rows_dir="scrap_rows", state=None, parser=None):
+    """Scrape `pages` en parallèle en écrivant les personnages de chaque page dans `rows_dir` au fil de l'eau.
+
+    Chaque page terminée est ajoutée au fichier `checkpoint` : relancer la même
+    commande après un arrêt reprend là où elle s'était arrêtée.
+
+    Avec `state` (empreintes et validateurs HTTP d'un passage précédent, par
+    page), les pages inchangées (304 ou même contenu) ne sont pas réécrites.
+    Renvoie les entrées du checkpoint de ce passage.
+    """
+    state = state or {}
+    done = read_jsonl(checkpoint)
+    todo = [page for page in pages if page not in done]
+    print(f"{len(pages) - len(todo)} pages déjà scrappées, {len(todo)} à faire")
+
+    session = make_session(workers)
+    bucket = TokenBucket(rate, burst)
+    lock = threading.Lock()
+    failed = []
+    os.makedirs(rows_dir, exist_ok=True)
+
+    def scrape_page(page):
+        previous = state.get(page)
+        response = fetch_page(session, page_url(page, base), bucket, retries, backoff, previous)
+        if response is None:
+            failed.append(page)
+            return
+        entry = {"page": page, "changed": False}
+        if response.status_code == 304:
+            entry.update({k: previous.get(k) for k in ("hash", "etag", "last_modified")})
+        else:
+            characters = scrape_characters_page(response.text, parser)
+            entry.update({
+                "hash": content_hash(characters),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "rows": len(characters),
+            })
+            entry["changed"] = previous is None or previous.get("hash") != entry["hash"]
+        if entry["changed"]:
+            path = rows_path(rows_dir, page)
+            if os.path.exists(path):
+                os.remove(path)
+            append_rows(path, characters)
+        with lock:
+            with open(checkpoint, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+            done[page] = entry
+        print(f"Page {page} : {'modifiée' if entry['changed'] else 'inchangée'}")
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for future in as_completed([executor.submit(scrape_page, page) for page in todo]):
+            future.result()
+    elapsed = time.perf_counter() - start
+    if todo:
+        print(f"{len(todo) - len(failed)} pages en {elapsed:.1f} s ({(len(todo) - len(failed)) / elapsed:.2f} pages/s)")
+    if failed:
+        print(f"Pages en échec (relancer pour réessayer) : {sorted(failed)}")
+    return done
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape les personnages d'anime-planet.")
+    parser.add_argument("--start", type=int, default=1, help="Première page")
+    parser.add_argument("--end", type=int, default=50, help="Dernière page (incluse)")
+    parser.add_argument("--base-url", default=base_url, help="Par exemple un serveur local de fixtures (fixture_server.py)")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.5, help="Requêtes par seconde")
+    parser.add_argument("--burst", type=int, default=1, help="Requêtes autorisées d'un coup")
+    parser.add_argument("--retries", type=int, default=5)
+    parser.add_argument("--backoff", type=float, default=1.0, help="Délai du premier nouvel essai (s), doublé à chaque essai")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Ne récupère que les pages modifiées depuis le dernier passage et les fusionne dans --output")
+    parser.add_argument("--checkpoint", default="scrap_checkpoint.jsonl")
+    parser.add_argument("--rows-dir", default="scrap_rows", help="Personnages de ce passage, un CSV par page modifiée")
+    parser.add_argument("--state", default="scrap_state.jsonl", help="Empreinte et validateurs HTTP de chaque page")
+    parser.add_argument("--output", default="anime_planet_characters.csv")
+    parser.add_argument("--parser", choices=list(PARSERS), default=default_parser(),
+                        help="Extraction HTML (lxml par défaut s'il est installé)")
+    args = parser.parse_args()
+
+    pages = range(args.start, args.end + 1)
+    state = read_jsonl(args.state) if args.incremental else {}
+    done = scrape(pages, args.base_url, args.workers, args.rate, args.burst, args.retries, args.backoff,
+                  args.checkpoint, args.rows_dir, state, args.parser)
+    if any(page not in done for page in pages):
+        print("Passage incomplet : relancer la même commande pour le terminer")
     else:
-        print(f"Erreur lors du chargement de la page : {url} (Status code: {response.status_code})")
-
-# Scraper la première page
-print("Scraping de la première page")
-scrape_characters_page(base_url)
-
-# Scraper les pages de 2 à 50
-for page in range(2, 51):
-    url = f"{base_url}?page={page}"
-    print(f"Scraping de la page {page}")
-    scrape_characters_page(url)
-    time.sleep(2)  # Pause pour éviter de surcharger le serveur
-
-# Convertir les données en DataFrame et sauvegarder en CSV
-df = pd.DataFrame(characters_data)
-df.to_csv("anime_planet_characters.csv", index=False, encoding="utf-8")
-print("Données enregistrées dans 'anime_planet_characters.csv'")
+        # Fusionner les personnages de ce passage dans le CSV (ou le remplacer sans --incremental)
+        delta_paths = [rows_path(args.rows_dir, page) for page in pages]
+        total = merge_rows(delta_paths, args.output, args.output if args.incremental else None)
+        changed = sum(entry["changed"] for entry in done.values())
+        state.update(done)
+        with open(f"{args.state}.tmp", "w", encoding="utf-8") as f:
+            for page in sorted(state):
+                f.write(json.dumps(state[page]) + "\n")
+        os.replace(f"{args.state}.tmp", args.state)
+        for path in delta_paths + [args.checkpoint]:
+            if os.path.exists(path):
+                os.remove(path)
+        if not os.listdir(args.rows_dir):
+            os.rmdir(args.rows_dir)
+        print(f"{changed} pages modifiées sur {len(done)}, {total} personnages enregistrés dans '{args.output}'")
@@ -1,9 +1,13 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+from utils.catalog import get_catalog
+from utils.anime_stats import load_gender_stats, gender_breakdown
+from utils.name_search import NameIndex, search_box
+from utils.timing import debug_panel, span, start_page
 
 st.set_page_config(page_title="Who Watches Animes ?", page_icon="📺", layout="wide")
+start_page("who_watches")
 
 st.markdown("# Who Watches Animes アニメを見ているのは誰？📺")
 st.sidebar.header("Who Are Anime Fans? 🤔")
@@ -16,24 +20,25 @@ def load_logo():
 logo_path = load_logo()
 st.sidebar.image(logo_path, use_column_width=True)
 
-# Cache for loading datasets
-@st.cache_data
-def load_data():
-    anime_data_path = 'data/anime/anime-dataset-2023.csv'
-    user_details_path = 'data/user/users-details-2023.csv'
-    user_scores_path = 'data/user/user_scores_filtered.csv'
-    anime_filtered_path = 'data/anime/anime-filtered.csv'
+# Datasets shared by every session of the process (Parquet built by `python -m utils.storage`, CSV otherwise).
+# The frames are read-only: derive new frames from them, never assign columns.
+catalog = get_catalog()
 
-    anime_df = pd.read_csv(anime_data_path)
-    user_details_df = pd.read_csv(user_details_path)
-    user_scores_df = pd.read_csv(user_scores_path)
-    anime_filtered_df = pd.read_csv(anime_filtered_path)
-    return anime_df, user_details_df, user_scores_df, anime_filtered_df
+# Search over every name of the anime of the selection tab, built once per process
+@st.cache_resource
+def load_anime_name_index(_anime_filtered_df):
+    return NameIndex.from_frame(_anime_filtered_df, 'Name', ['Name', 'English name', 'Japanese name'], 'Members')
+
+with span("load_data"):
+    anime_df = catalog.table('anime', columns=['Name', 'Score', 'Genres', 'Image URL'])
+    user_details_df = catalog.table('user_details', columns=['Mal ID', 'Gender', 'Days Watched', 'Episodes Watched'])
+    anime_filtered_df = catalog.table('anime_filtered', columns=['anime_id', 'Name', 'English name', 'Japanese name', 'Score',
+                                                                 'Popularity', 'Members', 'Watching', 'Completed'])
 
-anime_df, user_details_df, user_scores_df, anime_filtered_df = load_data()
+    # Per-anime rating statistics (built by `python -m utils.anime_stats`)
+    anime_stats_df = catalog.register('anime_gender_stats', load_gender_stats)
 
-# Convert the Score column to numeric values, handling errors
-anime_df['Score'] = pd.to_numeric(anime_df['Score'], errors='coerce')
+    anime_name_index = load_anime_name_index(anime_filtered_df)
 
 # Creating tabs
 tab1, tab2, tab3 = st.tabs(["Explanation", "General Overview", "Anime Selection"])
@@ -53,10 +58,10 @@ with tab1:
 with tab2:
     st.subheader("General Overview")
 
-    # Cache computation of the average score
+    # Cache computation of the average score (the shared frame is not hashed: it never changes)
     @st.cache_data
-    def calculate_average_score(dataframe):
-        return dataframe['Score'].mean()
+    def calculate_average_score(_dataframe):
+        return _dataframe['Score'].mean()
 
     average_score = calculate_average_score(anime_df)
 
@@ -103,11 +108,11 @@ with tab2:
         unsafe_allow_html=True
     )
 
-    # Cache computation of anime type counts
+    # Cache computation of anime type counts (without adding a column to the shared frame)
     @st.cache_data
-    def compute_type_counts(dataframe):
-        dataframe['Type'] = dataframe['Genres'].apply(lambda x: x.split(',')[0] if pd.notnull(x) else 'Unknown')
-        counts = dataframe['Type'].value_counts()
+    def compute_type_counts(_dataframe):
+        types = _dataframe['Genres'].astype(str).str.split(',').str[0].where(_dataframe['Genres'].notna(), 'Unknown')
+        counts = types.value_counts()
         return counts[counts.index != 'UNKNOWN']  # Remove 'Unknown'
 
     type_counts = compute_type_counts(anime_df)
@@ -127,6 +132,7 @@ with tab2:
     )
 
     gender_counts = user_details_df['Gender'].value_counts()
+    gender_counts = gender_counts[gender_counts > 0]
     fig_pie = go.Figure(data=[go.Pie(
         labels=gender_counts.index,
         values=gender_counts.values,
@@ -149,8 +155,8 @@ with tab2:
         
     # Average episodes watched by gender
     filtered_user_details_df = user_details_df[user_details_df['Gender'] != 'Non-Binary']
-    avg_episodes_by_gender = filtered_user_details_df.groupby('Gender')['Episodes Watched'].mean()
-    avg_days_watched_by_gender = filtered_user_details_df.groupby('Gender')['Days Watched'].mean()
+    avg_episodes_by_gender = filtered_user_details_df.groupby('Gender', observed=True)['Episodes Watched'].mean()
+    avg_days_watched_by_gender = filtered_user_details_df.groupby('Gender', observed=True)['Days Watched'].mean()
 
     col1, col2 = st.columns(2)
 
@@ -167,11 +173,12 @@ with tab2:
 with tab3:
     st.subheader("Anime Selection")
 
-    # Selection of an anime in a selectbox
-    selected_anime = st.selectbox("Select an anime:", anime_filtered_df['Name'].unique())
+    # Selection of an anime among the best matches of the search (the full list is never sent)
+    matches = search_box(anime_name_index, "who_watches_anime")
+    selected_anime = st.selectbox("Select an anime:", matches)
     
     # Validation button
-    if st.button("Show Details"):
+    if st.button("Show Details") and selected_anime is not None:
         # Filter details of the selected anime
         anime_details = anime_filtered_df[anime_filtered_df['Name'] == selected_anime]
         anime_image = anime_df[anime_df['Name'] == selected_anime]['Image URL'].values
@@ -210,28 +217,27 @@ with tab3:
                     unsafe_allow_html=True
                 )
 
-                # Merge and filter for user scores
+                # Read the precomputed statistics of the selected anime
                 selected_anime_id = anime_details['anime_id'].values[0]
-                user_scores_for_anime = user_scores_df[user_scores_df['anime_id'] == selected_anime_id]
-                user_scores_merged = user_details_df.merge(user_scores_for_anime, left_on='Mal ID', right_on='user_id', how='inner')
-                user_scores_merged = user_scores_merged[user_scores_merged['Gender'].isin(['Male', 'Female'])]
+                stats_by_gender = gender_breakdown(anime_stats_df, selected_anime_id)
 
-                if not user_scores_merged.empty:
-                    avg_score_by_gender = user_scores_merged.groupby('Gender')['rating'].mean()
+                if not stats_by_gender.empty:
+                    avg_score_by_gender = stats_by_gender[['Gender', 'rating']]
                     st.markdown("### Average score by gender:")
-                    st.dataframe(avg_score_by_gender.reset_index())
+                    st.dataframe(avg_score_by_gender)
                     
             with col3:
-                if not user_scores_merged.empty:
-                    gender_counts = user_scores_merged['Gender'].value_counts()
+                if not stats_by_gender.empty:
                     color_map = {'Male': 'blue', 'Female': 'pink'}
                     fig_pie = px.pie(
-                        values=gender_counts.values,
-                        names=gender_counts.index,
+                        values=stats_by_gender['viewers'],
+                        names=stats_by_gender['Gender'],
                         title=f"Viewer distribution by gender for {selected_anime}",
-                        color=gender_counts.index,
+                        color=stats_by_gender['Gender'],
                         color_discrete_map=color_map
                     )
                     st.plotly_chart(fig_pie, use_container_width=True)
                 else:
                     st.write("No user data available for this anime.")
+
+debug_panel()
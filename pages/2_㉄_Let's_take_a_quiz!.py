@@ -1,12 +1,13 @@
 import streamlit as st
-import pandas as pd
-import random
-from PIL import Image, ImageFilter
-import requests
-from io import BytesIO
 import time
+from utils.images import BLUR_LEVELS, BlurCache, ThumbnailBundle
+from utils.catalog import get_catalog
+from utils.name_search import NameIndex, search_box
+from utils.quiz import ALL, CharacterPools, TraitIndex, draw_hard_options, draw_options, draw_questions
+from utils.timing import debug_panel, span, start_page, timed
 
 st.set_page_config(page_title="Let's Take a Quiz!", page_icon="㉄")
+start_page("quiz")
 
 st.markdown("# Let's Take a Quiz クイズをやってみましょう！㉄")
 st.sidebar.header("How well do you know anime characters? 😶‍🌫️")
@@ -19,7 +20,8 @@ In this interactive quiz, you'll test your knowledge of popular anime characters
 
 - **Choose an anime**: Select your favorite anime or pick "All" to include characters from a variety of series.
 - **Guess the character**: You'll be presented with a blurred image of a character and multiple-choice options to identify them.
-- **Hints available**: If you're unsure, click the "Hint" button to reveal traits or characteristics about the character.
+- **Hard mode**: Tick "Hard mode" and the wrong answers are the characters whose traits and tags are closest to the right one.
+- **Hints available**: If you're unsure, click the "Hint" button to reveal traits or characteristics about the character. Each hint also makes the image a little less blurry.
 - **Score tracking**: The quiz consists of 5 questions, and your score will be displayed at the end.
 
 Are you ready to show off your anime knowledge and have some fun? Let’s start! 🤓✨
@@ -28,66 +30,120 @@ Are you ready to show off your anime knowledge and have some fun? Let’s start!
 logo_path = "images/streami.png"
 st.sidebar.image(logo_path, use_column_width=True)
 
-# Load the CSV file of characters
-data = pd.read_csv("data/character/anime_planet_characters.csv")
+# Characters loaded once per process and shared by every session (Parquet built by `python -m utils.storage`, CSV otherwise)
+with span("load_data"):
+    data = get_catalog().table('characters', columns=['Nom', 'Image', 'Traits', 'Tags', 'Manga Associé'])
+
+# Search over the anime of the characters, those with the most characters first, built once per process
+@st.cache_resource
+def load_title_index():
+    counts = data['Manga Associé'].value_counts()
+    counts = counts[counts > 0]
+    return NameIndex(counts.index, [[title] for title in counts.index], counts.to_numpy())
+
+# Row numbers of the characters of each anime and their names, built once per process: sessions only keep row numbers
+@st.cache_resource
+def load_character_pools():
+    return CharacterPools(data['Manga Associé'].to_numpy())
+
+@st.cache_resource
+def load_character_names():
+    return data['Nom'].to_numpy(dtype=object)
+
+# Traits and tags as packed bitsets for the hard mode, built on the first hard quiz of the process
+@st.cache_resource
+def load_trait_index():
+    return TraitIndex({'Traits': data['Traits'], 'Tags': data['Tags']})
+
+# Pre-blurred thumbnails built by `python -m utils.images`, read from a memory-mapped file
+@st.cache_resource
+def get_thumbnail_bundle():
+    try:
+        return ThumbnailBundle()
+    except FileNotFoundError:
+        return None
+
+# Images missing from the bundle are blurred on demand, cached in memory and on disk
+@st.cache_resource
+def get_blur_cache():
+    return BlurCache()
 
 # Function to blur the image from a URL
-def blur_image(url):
-    """Floute une image depuis son URL."""
-    response = requests.get(url)
-    img = Image.open(BytesIO(response.content))
-    blurred_img = img.filter(ImageFilter.GaussianBlur(radius=10))
-    return blurred_img
+@timed("blur_image")
+def blur_image(url, level=0):
+    """Floute une image depuis son URL, moins à chaque niveau d'indice."""
+    bundle = get_thumbnail_bundle()
+    if bundle is not None and url in bundle:
+        return bundle.get(url, level)
+    return get_blur_cache().get(url, BLUR_LEVELS[min(level, len(BLUR_LEVELS) - 1)])
+
+def prefetch_image(url):
+    bundle = get_thumbnail_bundle()
+    if bundle is None or url not in bundle:
+        get_blur_cache().prefetch(url, BLUR_LEVELS[0])
 
 # Initialize session state variables
+QUIZ_STATE = {
+    'quiz_started': False,
+    'anime_selected': False,
+    'question_index': 0,
+    'score': 0,
+    'question_rows': [],
+    'selected_anime': None,
+    'options': None,
+    'show_selectbox': True,
+    'selected_option': None,
+    'hard_mode': False,
+    'show_hint': False,
+    'blur_level': 0
+}
 if 'quiz_started' not in st.session_state:
-    st.session_state.update({
-        'quiz_started': False,
-        'anime_selected': False,
-        'question_index': 0,
-        'score': 0,
-        'current_character': None,
-        'selected_anime': None,
-        'filtered_data': None,
-        'options': None,
-        'used_characters': [],
-        'show_selectbox': True,
-        'selected_option': None,
-        'show_hint': False
-    })
-
-# Function to handle selectbox submission
-def submit_action(option):
+    st.session_state.update(QUIZ_STATE)
+
+# Function to handle selectbox submission: the characters of the quiz are drawn at once, as row numbers
+def submit_action(option, hard_mode=False):
     st.session_state.show_selectbox = False
     st.session_state.selected_option = option
+    st.session_state.hard_mode = hard_mode
     st.session_state.anime_selected = True
     st.session_state.quiz_started = True
-    if option != "All":
-        st.session_state.filtered_data = data[data['Manga Associé'] == option]
-    else:
-        st.session_state.filtered_data = data
+    st.session_state.question_rows = draw_questions(load_character_pools().pool(option)).tolist()
+
+# Show the hint and un-blur the image one level
+def use_hint():
+    st.session_state.show_hint = True
+    st.session_state.blur_level += 1
 
 # Display selectbox if not hidden
 if st.session_state.show_selectbox:
-    animes = ["All"] + list(data['Manga Associé'].dropna().unique())
+    # Only the best matches of the search are sent as options
+    animes = [ALL] + search_box(load_title_index(), "quiz_anime")
     selected_anime = st.selectbox("Choose an anime", animes)
-    submit_button = st.button("Start the Quiz", on_click=submit_action, args=(selected_anime,))
+    hard_mode = st.checkbox("Hard mode", help="Wrong answers share the most traits and tags with the right one")
+    submit_button = st.button("Start the Quiz", on_click=submit_action, args=(selected_anime, hard_mode))
 
 # Display the selected option and start the quiz
 if not st.session_state.show_selectbox and st.session_state.anime_selected:
-    st.write(f"**Selected anime**: {st.session_state.selected_option}")
-
-    # Quiz logic for 5 questions
-    if st.session_state.question_index < 5:
-        if st.session_state.current_character is None:
-            available_data = st.session_state.filtered_data[
-                ~st.session_state.filtered_data['Nom'].isin(st.session_state.used_characters)
-            ]
-            st.session_state.current_character = available_data.sample(1).iloc[0]
-            st.session_state.used_characters.append(st.session_state.current_character['Nom'])
-        
-        character = st.session_state.current_character
-        blurred_image = blur_image(character['Image'])
+    st.write(f"**Selected anime**: {st.session_state.selected_option}" + (" (hard mode)" if st.session_state.hard_mode else ""))
+
+    # Quiz logic for 5 questions (fewer if the anime has fewer characters)
+    question_rows = st.session_state.question_rows
+    if st.session_state.question_index < len(question_rows):
+        row = question_rows[st.session_state.question_index]
+        if st.session_state.options is None:
+            names = load_character_names()
+            pool = load_character_pools().pool(st.session_state.selected_option)
+            if st.session_state.hard_mode:
+                with span("similar_characters"):
+                    st.session_state.options = draw_hard_options(load_trait_index(), pool, row, names)
+            else:
+                st.session_state.options = draw_options(pool, row, names)
+            # Blur the next question's image while this one is shown
+            if st.session_state.question_index + 1 < len(question_rows):
+                prefetch_image(data['Image'].iat[question_rows[st.session_state.question_index + 1]])
+
+        character = data.iloc[row]
+        blurred_image = blur_image(character['Image'], st.session_state.blur_level)
 
         # Display the quiz card using columns
         col1, col2 = st.columns([1, 2])
@@ -96,21 +152,11 @@ if not st.session_state.show_selectbox and st.session_state.anime_selected:
             st.image(blurred_image, caption="Who Am I ?", use_column_width=True)
 
         with col2:
-            st.subheader(f"Question {st.session_state.question_index + 1} / 5")
-            if st.session_state.options is None:
-                options = st.session_state.filtered_data['Nom'].tolist()
-                if len(options) > 4:
-                    options = [character['Nom']] + random.sample([name for name in options if name != character['Nom']], 3)
-                else:
-                    options = [character['Nom']] + [name for name in options if name != character['Nom']]
-                random.shuffle(options)
-                st.session_state.options = options
-
+            st.subheader(f"Question {st.session_state.question_index + 1} / {len(question_rows)}")
             guess = st.radio("Guess the character:", st.session_state.options, key=st.session_state.question_index)
 
-            # Bouton Indice (Hint)
-            if st.button("Hint", key=f"hint_{st.session_state.question_index}"):
-                st.session_state.show_hint = True
+            # Bouton Indice (Hint): each click also un-blurs the image one level
+            st.button("Hint", key=f"hint_{st.session_state.question_index}", on_click=use_hint)
 
             if st.session_state.show_hint:
                 traits = character['Tags']
@@ -125,44 +171,20 @@ if not st.session_state.show_selectbox and st.session_state.anime_selected:
                     st.error(f"Wrong answer. The correct answer was {character['Nom']}.")
                     time.sleep(2)
                 st.session_state.question_index += 1
-                st.session_state.current_character = None
                 st.session_state.options = None
                 st.session_state.show_hint = False
+                st.session_state.blur_level = 0
                 st.rerun()
 
             if st.button("Stop the Quiz"):
-                st.session_state.update({
-                    'quiz_started': False,
-                    'anime_selected': False,
-                    'question_index': 0,
-                    'score': 0,
-                    'current_character': None,
-                    'selected_anime': None,
-                    'filtered_data': None,
-                    'options': None,
-                    'used_characters': [],
-                    'show_selectbox': True,
-                    'selected_option': None,
-                    'show_hint': False
-                })
+                st.session_state.update(QUIZ_STATE)
                 st.success("Quiz stopped.")
                 st.rerun()
 
     else:
-        st.write(f"Quiz over! Your score is {st.session_state.score} / 5.")
+        st.write(f"Quiz over! Your score is {st.session_state.score} / {len(question_rows)}.")
         if st.button("Play Again"):
-            st.session_state.update({
-                'quiz_started': False,
-                'anime_selected': False,
-                'question_index': 0,
-                'score': 0,
-                'current_character': None,
-                'selected_anime': None,
-                'filtered_data': None,
-                'options': None,
-                'used_characters': [],
-                'show_selectbox': True,
-                'selected_option': None,
-                'show_hint': False
-            })
-            st.rerun()
\ No newline at end of file
+            st.session_state.update(QUIZ_STATE)
+            st.rerun()
+
+debug_panel()
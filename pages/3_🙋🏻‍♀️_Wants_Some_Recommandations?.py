@@ -1,14 +1,16 @@
-import pandas as pd
-import numpy as np
-from sklearn.preprocessing import MultiLabelBinarizer, StandardScaler
+import os
 import streamlit as st
-from pyspark.sql import SparkSession
-from pyspark.ml.linalg import Vectors
-from pyspark.ml.feature import BucketedRandomProjectionLSH
-from pyspark.sql import functions as F
-import time
+from utils.catalog import get_catalog
+from utils.features import load_features
+from utils.item_cf import load_item_cf
+from utils.name_search import NameIndex, search_box
+from utils.neighbours import load_neighbour_table
+from utils.similarity import SimilarityEngine, spark_top_k
+from utils.synopsis import ARTIFACT_DIR as SYNOPSIS_DIR, blend_top_k, load_synopsis_index
+from utils.timing import debug_panel, span, start_page
 
 st.set_page_config(page_title="Wants some Recommandations ?", page_icon="🙋🏻‍♀️")
+start_page("recommendations")
 
 st.markdown("# Wants some Recommandations おすすめを知りたいですか ？")
 st.sidebar.header("We'll predict your next favorite anime ! 🔮")
@@ -17,40 +19,80 @@ st.sidebar.header("We'll predict your next favorite anime ! 🔮")
 st.markdown("""
 ### How Does the Recommendation Work? 🤔
 
-Welcome to the **Anime Recommendation Page**! 🎉 Here, we use advanced data analysis and machine learning to suggest anime that you might enjoy based on your favorite selections. Here's a breakdown of how this process works:
+Welcome to the **Anime Recommendation Page**! 🎉 Here, we use advanced data analysis and machine learning to suggest anime that you might enjoy based on your favorite selections. Pick one favorite, or several to build your taste profile. Here's a breakdown of how this process works:
 
 1. **Feature Extraction**: We start by analyzing various features of each anime, such as genres, type, popularity, score, and more. These features are encoded using one-hot encoding and standardized for uniformity.
 
-2. **Genre Weighting**: The system applies a special emphasis on matching genres. If you select an anime with certain genres, those genres are given more weight in the feature analysis, making the recommendations more tailored to your tastes.
+2. **Genre Weighting**: The system applies a special emphasis on matching genres. If you select an anime with certain genres, those genres are given more weight in the feature analysis, making the recommendations more tailored to your tastes. With several favorites, all of their genres are boosted.
 
-3. **Similarity Analysis**: Using a machine learning technique called *Locality Sensitive Hashing (LSH)*, we identify anime that are similar to your favorite based on cosine similarity. This method helps us find the most relevant anime from a vast dataset quickly and efficiently.
+3. **Similarity Analysis**: We measure the distance between your favorites and every other anime in a single vectorized pass and keep the closest ones. With several favorites, each anime is scored by its average similarity to all of them, or by its similarity to the closest one. You can also blend in how close their synopses are (TF-IDF similarity of the words they use).
 
-4. **Recommendations**: Once similar anime are found, we display the top matches (excluding your original selection). The results are shown with essential details like the score, number of episodes, and genres, accompanied by an image of the anime.
+4. **Recommendations**: Once similar anime are found, we display the top matches (excluding your own selection). The results are shown with essential details like the score, number of episodes, and genres, accompanied by an image of the anime.
 
-### Ready to discover your next favorite anime? Select an anime from the dropdown and see the magic unfold! ✨
+### Ready to discover your next favorite anime? Search for an anime, add it to your favorites and see the magic unfold! ✨
 """)
 
 logo_path = "images/streami.png"  
 # Display the logo image in the sidebar
 st.sidebar.image(logo_path, use_column_width=True)
 
-# Start Spark session for PySpark
-spark = SparkSession.builder.appName("AnimeRecommendation").getOrCreate()
-
-# Load the anime dataset
-anime_info_df = pd.read_csv("data/anime/anime-dataset-2023.csv")
-
-# Save the 'Image URL' column before dropping it
-image_url_df = anime_info_df[['anime_id', 'Image URL']]
-
-# Drop unnecessary columns
-anime_info_df = anime_info_df.drop(columns=['Image URL', 'Premiered', 'Aired', 'Status', 'Duration', 'Rating'])
-
-# Remove rows containing 'UNKNOWN' in any column
-anime_info_df = anime_info_df.replace('UNKNOWN', np.nan).dropna()
-
-# Filter to only include anime with a Score above 8
-anime_info_df = anime_info_df[anime_info_df['Score'].astype(float) > 8]
+# "numpy" (exact, in process) or "spark" (LSH, the former path, to compare results).
+# Both are only used when the neighbour table has not been built (`python -m utils.neighbours`).
+# Several favourites are always answered by the numpy engine, in one batched query.
+SIMILARITY_BACKEND = os.environ.get("RECOMMENDATION_BACKEND", "numpy")
+
+# How the similarities to several favourites are combined (see utils.similarity)
+AGGREGATE_LABELS = {'mean': "Average similarity", 'max': "Closest favorite"}
+
+# "fans" is offered once the item-item table has been built from the user scores (`python -m utils.item_cf`)
+MODE_LABELS = {'content': "Similar content", 'fans': "Fans also liked"}
+CARD_COLUMNS = ['anime_id', 'English name', 'Other name', 'Genres', 'Score', 'Episodes', 'Image URL']
+
+# Load the precomputed feature matrix (built offline by `python -m utils.features`)
+@st.cache_resource
+def load_recommendation_features():
+    return load_features()
+
+try:
+    with span("load_features"):
+        feature_store = load_recommendation_features()
+except FileNotFoundError:
+    st.error("The recommendation features have not been built yet. Run `python -m utils.features` first.")
+    st.stop()
+
+# Search over the English and other names of the catalogue, built once per process
+@st.cache_resource
+def load_name_index():
+    return NameIndex.from_frame(feature_store.display, 'English name', ['English name', 'Other name'], 'Score')
+
+@st.cache_resource
+def load_similarity_engine():
+    return SimilarityEngine(feature_store.matrix, feature_store.anime_ids)
+
+@st.cache_resource
+def load_precomputed_neighbours():
+    try:
+        return load_neighbour_table()
+    except FileNotFoundError:
+        return None
+
+# Only loaded by the first session that blends in the synopses
+@st.cache_resource
+def load_synopsis():
+    return load_synopsis_index()
+
+@st.cache_resource
+def load_fan_table():
+    try:
+        return load_item_cf()
+    except FileNotFoundError:
+        return None
+
+with span("load_neighbours"):
+    neighbour_table = load_precomputed_neighbours()
+    fan_table = load_fan_table()
+
+anime_info_df = feature_store.display
 
 # Center selection box using custom CSS
 st.markdown("""
@@ -63,101 +105,100 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
-favorite_anime = st.selectbox("Select your favorite anime:", anime_info_df['English name'].values)
-
-# Retrieve anime_id and genres for the selected anime
-selected_anime = anime_info_df[anime_info_df['English name'] == favorite_anime].iloc[0]
-selected_anime_id = selected_anime['anime_id']
-selected_anime_genres = selected_anime['Genres'].split(", ")
-
-# ---- Step 1: Feature Engineering ----
-# Handling 'Genres' - assuming it's a comma-separated list
-if 'Genres' in anime_info_df.columns:
-    anime_info_df['Genres'] = anime_info_df['Genres'].astype(str).apply(lambda x: x.split(',') if isinstance(x, str) else [])
-    mlb_genres = MultiLabelBinarizer()
-    genres_encoded = pd.DataFrame(mlb_genres.fit_transform(anime_info_df['Genres']), columns=mlb_genres.classes_, index=anime_info_df.index)
-    anime_info_df = pd.concat([anime_info_df, genres_encoded], axis=1)
-
-# One-hot encoding for other categorical columns: 'Type', 'Producers', 'Licensors', 'Studios', 'Source'
-for col in ['Type', 'Producers', 'Licensors', 'Studios', 'Source']:
-    if col in anime_info_df.columns:
-        anime_info_df[col] = anime_info_df[col].astype(str).fillna('')
-        mlb = MultiLabelBinarizer()
-        encoded = pd.DataFrame(mlb.fit_transform(anime_info_df[col].apply(lambda x: x.split(', ') if isinstance(x, str) else [])),
-                               columns=[f"{col}_{cls}" for cls in mlb.classes_], index=anime_info_df.index)
-        anime_info_df = pd.concat([anime_info_df, encoded], axis=1)
-
-# Keep a copy of original numeric columns for display purposes
-original_numeric_columns = anime_info_df[['anime_id', 'Score', 'Episodes']].copy()
-
-# Standardize numeric features: 'Score', 'Episodes', 'Rank', 'Popularity', 'Favorites', 'Scored By', 'Members'
-numeric_columns = ['Score', 'Episodes', 'Rank', 'Popularity', 'Favorites', 'Scored By', 'Members']
-scaler = StandardScaler()
-for feature in numeric_columns:
-    anime_info_df[feature] = scaler.fit_transform(anime_info_df[[feature]])
-
-# ---- Step 2: Apply Dynamic Weighting ----
+mode = "content"
+if fan_table is not None:
+    mode = st.radio("Recommend by:", list(MODE_LABELS), format_func=MODE_LABELS.get, horizontal=True)
+
+# Only the favorites and the best matches of the search are sent as options. The favorites are kept
+# in the session and passed as the default, as a new list of options makes a new widget.
+if 'favorite_animes' not in st.session_state:
+    st.session_state.favorite_animes = list(anime_info_df['English name'].values[:1])
+matches = search_box(load_name_index(), "favorites")
+favorite_animes = st.multiselect("Select your favorite anime:",
+                                 list(dict.fromkeys(st.session_state.favorite_animes + matches)),
+                                 default=st.session_state.favorite_animes)
+st.session_state.favorite_animes = favorite_animes
+if not favorite_animes:
+    st.info("Select at least one anime to get recommendations.")
+    debug_panel()
+    st.stop()
+
+aggregate = "mean"
+if len(favorite_animes) > 1:
+    aggregate = st.radio("Combine your favorites by:", list(AGGREGATE_LABELS), format_func=AGGREGATE_LABELS.get,
+                         horizontal=True)
+
+# "Similar content" can blend in the synopsis similarity once its index has been built (`python -m utils.synopsis`)
+synopsis_weight = 0.0
+if mode == "content" and os.path.exists(os.path.join(SYNOPSIS_DIR, "synopsis.json")):
+    synopsis_weight = st.slider("Weight of the synopsis:", 0.0, 1.0, 0.0, 0.1)
+
+# Retrieve the anime_id of each selected anime (first match of each name) and the union of their genres
+selected_anime_ids = anime_info_df.drop_duplicates('English name').set_index('English name').loc[favorite_animes, 'anime_id'].tolist()
+selected_anime_genres = feature_store.profile_genres(selected_anime_ids)
+
+# ---- Step 1: Apply Dynamic Weighting ----
 # Define a weighting factor for genres that match the selected anime's genres
 genre_weight_factor = 7.0  # Example factor; can be adjusted
 
-# Apply weighting to matching genre columns
-for genre in selected_anime_genres:
-    if genre in anime_info_df.columns:
-        anime_info_df[genre] *= genre_weight_factor
-
-# ---- Step 3: Create Feature Vectors ----
-# Select only the feature columns for the vector
-feature_columns = [col for col in anime_info_df.columns if col not in ['anime_id', 'Name', 'English name', 'Other name', 'Synopsis', 'Genres', 'Producers', 'Licensors', 'Studios', 'Source', 'Type']]
-anime_info_df['features'] = anime_info_df[feature_columns].values.tolist()
-
-# Convert lists of features to dense vectors (e.g., numpy arrays) for each anime
-anime_info_df['features'] = anime_info_df['features'].apply(lambda x: np.array(x, dtype=float))
-
-# ---- Step 4: Prepare PySpark DataFrame for LSH ----
-# Convert each list of features into a PySpark dense vector
-anime_info_df['features'] = anime_info_df['features'].apply(lambda x: Vectors.dense(x))
-
-# Create a PySpark DataFrame with anime_id and features columns
-anime_spark_df = spark.createDataFrame(anime_info_df[['anime_id', 'features']])
-
-# ---- Step 5: Fit LSH Model and Find Nearest Neighbors ----
-
-# LSH model for cosine similarity
-lsh = BucketedRandomProjectionLSH(inputCol="features", outputCol="hashes", bucketLength=2.0, numHashTables=3)
-lsh_model = lsh.fit(anime_spark_df)
-
-# Get the feature vector for the selected anime
-player_of_interest = anime_spark_df.filter(F.col("anime_id") == selected_anime_id).select("features")
-
-# Find the top 4 nearest neighbors (including the anime itself)
-nearest_neighbors = lsh_model.approxNearestNeighbors(anime_spark_df, player_of_interest.first()['features'], numNearestNeighbors=4)
-
-# Extract IDs of nearest neighbors, excluding the selected anime itself
-similar_anime_ids = [row['anime_id'] for row in nearest_neighbors.collect() if row['anime_id'] != selected_anime_id][:3]
-
-# ---- Step 5: Display recommendations using original values ----
-# Retrieve similar anime information from the original DataFrame
-recommended_anime_df = anime_info_df[anime_info_df['anime_id'].isin(similar_anime_ids)]
-
-# Merge 'Image URL' and original numeric columns back to the recommended anime DataFrame
-recommended_anime_df = pd.merge(recommended_anime_df, image_url_df, on='anime_id', how='left')
-recommended_anime_df = pd.merge(recommended_anime_df, original_numeric_columns, on='anime_id', how='left', suffixes=('', '_original'))
+# The weights are applied at query time, the cached matrix is shared between sessions
+with span("genre_weights"):
+    weights = feature_store.genre_weights(selected_anime_genres, genre_weight_factor)
+
+# ---- Step 2: Find Nearest Neighbors ----
+single_favorite = len(selected_anime_ids) == 1
+if mode == "fans":
+    # What the users who rated the favourites also rated highly, read from the item-item table
+    with span("nearest_neighbours", backend="item_cf", favorites=len(selected_anime_ids)):
+        similar_anime_ids, _ = fan_table.recommend(selected_anime_ids, k=3, aggregate=aggregate)
+    if len(similar_anime_ids) == 0:
+        st.info("Not enough ratings for these anime yet, try the similar content mode.")
+elif synopsis_weight > 0:
+    # Feature distances and synopsis similarities of the whole catalogue, mixed before ranking
+    with span("nearest_neighbours", backend="synopsis", favorites=len(selected_anime_ids)):
+        distances = load_similarity_engine().batch_profile_distances([selected_anime_ids], weights[None, :],
+                                                                     aggregate=aggregate)[0]
+        synopsis_index = load_synopsis()
+        text_similarities = synopsis_index.aligned(synopsis_index.similarities(selected_anime_ids, aggregate),
+                                                   feature_store.anime_ids)
+        similar_anime_ids, _ = blend_top_k(feature_store.anime_ids, distances, text_similarities, synopsis_weight, k=3)
+# The table is only used while it was computed from these features and weights (see utils.neighbours)
+elif single_favorite and neighbour_table is not None and neighbour_table.matches(feature_store, genre_weight_factor):
+    with span("nearest_neighbours", backend="table"):
+        similar_anime_ids, _ = neighbour_table.lookup(selected_anime_ids[0], k=3)
+elif single_favorite and SIMILARITY_BACKEND == "spark":
+    with span("nearest_neighbours", backend="spark"):
+        similar_anime_ids = spark_top_k(feature_store.matrix, feature_store.anime_ids, selected_anime_ids[0], k=3, weights=weights)
+else:
+    with span("nearest_neighbours", backend="numpy", favorites=len(selected_anime_ids)):
+        similar_anime_ids, _ = load_similarity_engine().profile_top_k(selected_anime_ids, k=3, weights=weights,
+                                                                      aggregate=aggregate)
+
+# ---- Step 3: Display recommendations using original values ----
+# Retrieve similar anime information from the display table, closest first
+# (fans may recommend anime outside of it: their cards come from the full dataset)
+card_df = anime_info_df if mode == "content" else get_catalog().table('anime', columns=CARD_COLUMNS)
+card_df = card_df.drop_duplicates('anime_id').set_index('anime_id')
+recommended_anime_df = card_df.loc[[i for i in similar_anime_ids if i in card_df.index]].reset_index()
 
 # Display the recommendations with original 'Score' and 'Episodes'
 st.write("Recommended anime based on your selection:")
-for _, row in recommended_anime_df.iterrows():
-    st.markdown(f"""
-    <div style="border:1px solid #333; padding: 5px; border-radius: 5px; margin-bottom: 10px; display: flex; align-items: center; gap: 10px; box-shadow: 2px 2px 8px rgba(255, 255, 255, 0.1);">
-        <div style="flex: 1;">
-            <img src="{row['Image URL']}" alt="{row['English name']}" style="width: 100px; border-radius: 5px;">
+with span("render_recommendations"):
+    for _, row in recommended_anime_df.iterrows():
+        st.markdown(f"""
+        <div style="border:1px solid #333; padding: 5px; border-radius: 5px; margin-bottom: 10px; display: flex; align-items: center; gap: 10px; box-shadow: 2px 2px 8px rgba(255, 255, 255, 0.1);">
+            <div style="flex: 1;">
+                <img src="{row['Image URL']}" alt="{row['English name']}" style="width: 100px; border-radius: 5px;">
+            </div>
+            <div style="flex: 2; color: #ddd;">
+            <h3 style="margin: 0; font-size: 16px; color: #fff;">
+                {row['English name']} ({row['Other name']})
+            </h3>
+                <p style="margin: 3px 0; font-size: 14px;"><strong>Genres :</strong> {row['Genres']}</p>
+                <p style="margin: 3px 0; font-size: 14px;"><strong>Score :</strong> {row['Score']}</p>
+                <p style="margin: 3px 0; font-size: 14px;"><strong>Episodes :</strong> {row['Episodes']}</p>
+            </div>
         </div>
-        <div style="flex: 2; color: #ddd;">
-        <h3 style="margin: 0; font-size: 16px; color: #fff;">
-            {row['English name']} ({row['Other name']})
-        </h3>
-            <p style="margin: 3px 0; font-size: 14px;"><strong>Genres :</strong> {', '.join(row['Genres'])}</p>
-            <p style="margin: 3px 0; font-size: 14px;"><strong>Score :</strong> {row['Score_original']}</p>
-            <p style="margin: 3px 0; font-size: 14px;"><strong>Episodes :</strong> {row['Episodes_original']}</p>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
\ No newline at end of file
+        """, unsafe_allow_html=True)
+
+debug_panel()
@@ -1,9 +1,15 @@
-import streamlit as st
-import requests
 import io
-from PIL import Image
+import time
+import uuid
+import zipfile
+
+import streamlit as st
+
+from utils.generation import EXTENSIONS, GenerationError, GenerationService
+from utils.timing import debug_panel, span, start_page
 
 st.set_page_config(page_title="Generate Your Anime Character!", page_icon="🧚🏼", layout="wide")
+start_page("generate")
 
 st.markdown("# Generate Your Own Anime Character 自分だけのアニメキャラクターを作ってみよう！🪄")
 st.sidebar.header("Let Your words be a reality ! 🪄")
@@ -11,22 +17,18 @@ st.sidebar.header("Let Your words be a reality ! 🪄")
 # Sidebar logo
 st.sidebar.image("images/streami.png", use_column_width=True)
 
-# HuggingFace API Config
-HF_TOKEN = st.secrets["HF_TOKEN"]  # <-- SAFE
-API_URL = "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell"
-headers = {"Authorization": f"Bearer {HF_TOKEN}"}
 
-# Function to call HF
-def generate_image(prompt):
-    payload = {"inputs": prompt}
-    response = requests.post(API_URL, headers=headers, json=payload)
+# HuggingFace API Config : un seul service par processus (file d'attente, quotas et cache partagés)
+@st.cache_resource
+def get_generation_service():
+    # Pas de secrets.toml avec le serveur local de test (HF_API_URL)
+    token = st.secrets["HF_TOKEN"] if st.secrets.load_if_toml_exists() else None  # <-- SAFE
+    return GenerationService(token=token)
 
-    # Check for JSON error response
-    if response.headers.get("content-type") == "application/json":
-        return None, response.json()
-
-    return response.content, None
 
+# Identifiant de la session pour les quotas
+if 'generation_session' not in st.session_state:
+    st.session_state['generation_session'] = uuid.uuid4().hex
 
 # Prompt input
 prompt = st.text_input(
@@ -34,29 +36,83 @@ prompt = st.text_input(
     "cute anime girl with cat ears, big sparkling eyes, pastel colors, soft glow"
 )
 
+# Batch mode: plusieurs variations du prompt générées en parallèle
+n_variations = st.slider("Number of variations", 1, 8, 1)
+if n_variations > 1:
+    prompt_variations = st.text_area(
+        "Prompt variations (optional, one per line, added to the prompt; otherwise only the seed changes):"
+    )
+    concurrency = st.slider("Parallel requests", 1, get_generation_service().workers,
+                            min(n_variations, get_generation_service().workers))
+    lines = [line.strip() for line in prompt_variations.splitlines() if line.strip()][:n_variations]
+    variations = [(f"{prompt}, {line}", None) for line in lines] or [(prompt, {'seed': seed}) for seed in range(n_variations)]
+
+
+def show_error(error):
+    st.error("🚨 HuggingFace API Error:")
+    st.code(error)
+
+
 # Generate button
-if st.button("Generate Image"):
-    with st.spinner("Generating your anime character... ⏳"):
-        img_bytes, error = generate_image(prompt)
+if st.button("Generate Image" if n_variations == 1 else f"Generate {len(variations)} Images"):
+    if n_variations == 1:
+        with st.spinner("Generating your anime character... ⏳"), span("generate_image"):
+            try:
+                image = get_generation_service().generate(prompt, session_id=st.session_state['generation_session'])
+            except GenerationError as e:
+                image, error = None, e.detail
 
-        if error:
-            st.error("🚨 HuggingFace API Error:")
-            st.code(error)
+        if image is None:
+            show_error(error)
         else:
-            # Convert bytes to image
-            image = Image.open(io.BytesIO(img_bytes))
-
-            # Display the image
-            st.image(image, caption="Generated Anime Character", width=400)
+            # Display the image (bytes as sent by the API, no decoding)
+            st.image(image.data, caption="Generated Anime Character", width=400)
 
             # Download button
-            buf = io.BytesIO()
-            image.save(buf, format="PNG")
             st.download_button(
                 label="Download Image",
-                data=buf.getvalue(),
-                file_name="anime_character.png",
-                mime="image/png"
+                data=image.data,
+                file_name=f"anime_character.{EXTENSIONS[image.mime]}",
+                mime=image.mime
+            )
+
+            st.success("Image generation completed! ✨" + (" (from cache)" if image.cached else ""))
+    else:
+        # Galerie : chaque image s'affiche dès qu'elle arrive, et rejoint le zip au même moment
+        columns = st.columns(4)
+        slots = [columns[i % 4].empty() for i in range(len(variations))]
+        for slot in slots:
+            slot.info("⏳")
+        progress = st.progress(0.0, text="Generating your anime characters... ⏳")
+        archive = io.BytesIO()
+        request_seconds, done, errors = 0.0, 0, []
+        start = time.perf_counter()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf, span("generate_batch", images=len(variations)):
+            for index, result in get_generation_service().generate_batch(
+                variations, st.session_state['generation_session'], concurrency
+            ):
+                done += 1
+                progress.progress(done / len(variations), text=f"{done}/{len(variations)} images")
+                if isinstance(result, GenerationError):
+                    slots[index].warning(f"Variation {index + 1} failed")
+                    errors.append(result.detail)
+                    continue
+                slots[index].image(result.data, caption=f"Variation {index + 1}", use_column_width=True)
+                zf.writestr(f"anime_character_{index + 1}.{EXTENSIONS[result.mime]}", result.data)
+                request_seconds += result.seconds
+        wall_seconds = time.perf_counter() - start
+        progress.empty()
+
+        for error in dict.fromkeys(map(str, errors)):
+            show_error(error)
+        if done > len(errors):
+            st.download_button(
+                label="Download All Images (zip)",
+                data=archive.getvalue(),
+                file_name="anime_characters.zip",
+                mime="application/zip"
             )
+            st.success(f"{done - len(errors)} images generated in {wall_seconds:.1f} s "
+                       f"(sum of request times: {request_seconds:.1f} s) ✨")
 
-            st.success("Image generation completed! ✨")
+debug_panel()
@@ -0,0 +1,37 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import user_details_table, user_scores_table
+from utils.anime_stats import compute_gender_stats, gender_breakdown, stream_gender_stats
+from utils.storage import DATASETS, convert_dataset
+
+
+@pytest.fixture
+def scores(tmp_path, monkeypatch):
+    """Synthetic ratings at the path of ``user_scores_full``, some by users without details."""
+    rng = np.random.default_rng(0)
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/user")
+    user_details_df = user_details_table(rng, 400)
+    user_scores_df = user_scores_table(rng, 5_000, 450, np.arange(1, 60))
+    user_scores_df.to_csv(DATASETS['user_scores_full']['csv'], index=False)
+    return user_scores_df, user_details_df
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("parquet", [False, True])
+def test_streamed_stats_match_in_memory_stats(scores, workers, parquet):
+    user_scores_df, user_details_df = scores
+    if parquet:
+        convert_dataset('user_scores_full', chunksize=1_000)
+    stats, rows = stream_gender_stats(user_details_df, chunksize=700, workers=workers)
+    assert rows == len(user_scores_df)
+    expected = compute_gender_stats(user_scores_df, user_details_df)
+    pd.testing.assert_frame_equal(stats.sort_index(), expected.sort_index(), check_dtype=False,
+                                  check_index_type=False)
+    for anime_id in expected.index[:5]:
+        pd.testing.assert_frame_equal(gender_breakdown(stats, anime_id), gender_breakdown(expected, anime_id),
+                                      check_dtype=False)
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.catalog import DataCatalog
+
+
+def frame():
+    return pd.DataFrame({
+        'count': np.arange(5),
+        'score': np.linspace(0, 1, 5),
+        'genre': pd.Categorical(list("xyxyx")),
+        'name': pd.array(list("abcde"), dtype='string[pyarrow]'),
+    })
+
+
+def test_assigning_columns_does_not_leak():
+    catalog = DataCatalog()
+    df = catalog.register('scores', frame)
+    df['count'] = 0
+    df['extra'] = 1
+    df.drop(columns='score', inplace=True)
+    pd.testing.assert_frame_equal(catalog.register('scores', frame), frame())
+
+
+@pytest.mark.parametrize("write", [
+    lambda df: df.loc.__setitem__((0, 'score'), 5.0),
+    lambda df: df.iloc.__setitem__((0, 0), 9),
+    lambda df: df['count'].to_numpy().__setitem__(0, 7),
+    lambda df: df.loc.__setitem__((0, 'genre'), 'y'),
+])
+def test_writing_values_raises(write):
+    catalog = DataCatalog()
+    with pytest.raises(ValueError):
+        write(catalog.register('scores', frame))
+    pd.testing.assert_frame_equal(catalog.register('scores', frame), frame())
+
+
+def test_writing_strings_only_changes_the_copy():
+    catalog = DataCatalog()
+    df = catalog.register('scores', frame)
+    df.loc[0, 'name'] = "ZZZ"
+    df['name'].array[1] = "YYY"
+    assert df['name'].tolist()[:2] == ["ZZZ", "YYY"]
+    pd.testing.assert_frame_equal(catalog.register('scores', frame), frame())
+
+
+def test_derived_frames_do_not_shadow_datasets():
+    catalog = DataCatalog()
+    catalog.register('characters', frame)
+    assert 'Nom' in catalog.table('characters').columns
+    assert list(catalog.register('characters', frame).columns) == list(frame().columns)
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import anime_table
+from utils.features import build_features, load_features, prepare_catalogue, update_features
+from utils.neighbours import build_neighbour_table, load_neighbour_table, save_neighbour_table, update_neighbour_table
+
+
+@pytest.fixture
+def sources(tmp_path):
+    """A catalogue, and its refresh: 60 new anime, 15 changed ones (one with a new studio)."""
+    anime = anime_table(np.random.default_rng(0), 300, "http://127.0.0.1")
+    refreshed = anime.copy()
+    changed = refreshed.index[:240:16]
+    refreshed.loc[changed, 'Members'] += 50_000
+    refreshed.loc[changed[0], 'Studios'] = "Studio 99"
+    old_path, new_path = str(tmp_path / "old.csv"), str(tmp_path / "new.csv")
+    anime.iloc[:240].to_csv(old_path, index=False)
+    refreshed.to_csv(new_path, index=False)
+    return old_path, new_path
+
+
+def aligned(store, other):
+    """Matrix of ``store`` in the row and column order of ``other``."""
+    rows = [store.row_of(anime_id) for anime_id in other.anime_ids]
+    columns = [store.column_index[column] for column in other.columns]
+    return np.asarray(store.matrix)[np.ix_(rows, columns)]
+
+
+def test_restandardized_update_matches_a_rebuild(tmp_path, sources):
+    old_path, new_path = sources
+    build_features(old_path, tmp_path / "updated", min_score=None)
+    report = update_features(new_path, tmp_path / "updated", drift_threshold=0.0)
+    # Rows with 'UNKNOWN' values are not in the catalogue
+    old_ids = set(prepare_catalogue(pd.read_csv(old_path), None)['anime_id'])
+    new_ids = set(prepare_catalogue(pd.read_csv(new_path), None)['anime_id'])
+    assert report['added'] == len(new_ids - old_ids) and report['changed'] > 0 and report['new_columns'] == 1
+    assert report['restandardized']
+
+    build_features(new_path, tmp_path / "rebuilt", min_score=None)
+    updated, rebuilt = load_features(tmp_path / "updated"), load_features(tmp_path / "rebuilt")
+    assert sorted(updated.anime_ids) == sorted(rebuilt.anime_ids)
+    assert set(rebuilt.columns) <= set(updated.columns)
+    np.testing.assert_allclose(aligned(updated, rebuilt), np.asarray(rebuilt.matrix), atol=1e-5)
+    # Values no row has any more stay as empty columns until the next rebuild
+    unused = [updated.column_index[column] for column in set(updated.columns) - set(rebuilt.columns)]
+    assert not np.asarray(updated.matrix)[:, unused].any()
+
+
+def test_unchanged_source_is_a_no_op(tmp_path, sources):
+    old_path, _ = sources
+    build_features(old_path, tmp_path, min_score=None)
+    report = update_features(old_path, tmp_path)
+    assert report['added'] == report['changed'] == 0 and len(report['delta_rows']) == 0
+
+
+def test_updated_neighbour_table_matches_a_rebuild(tmp_path, sources):
+    old_path, new_path = sources
+    params = {'genre_weight_factor': 7.0, 'metric': "euclidean"}
+    build_features(old_path, tmp_path, min_score=None)
+    store = load_features(tmp_path)
+    save_neighbour_table(*build_neighbour_table(store, 5, block_size=64, **params), store.fingerprint, tmp_path, **params)
+
+    report = update_features(new_path, tmp_path, drift_threshold=np.inf)
+    assert not report['restandardized']
+    store = load_features(tmp_path)
+    table = load_neighbour_table(tmp_path)
+    assert not table.matches(store, 7.0)
+    ids, distances = update_neighbour_table(store, table, report['delta_rows'], block_size=64)
+    expected_ids, expected_distances = build_neighbour_table(store, 5, block_size=64, **params)
+    np.testing.assert_array_equal(ids, expected_ids)
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-5)
+
+
+def test_neighbour_table_is_stale_after_a_rebuild(tmp_path, sources):
+    old_path, new_path = sources
+    build_features(old_path, tmp_path, min_score=None)
+    store = load_features(tmp_path)
+    save_neighbour_table(*build_neighbour_table(store, 5), store.fingerprint, tmp_path, genre_weight_factor=7.0,
+                         metric="euclidean")
+    table = load_neighbour_table(tmp_path)
+    assert table.matches(store, 7.0)
+    assert not table.matches(store, 3.0) and not table.matches(store, 7.0, metric="cosine")
+
+    # New and changed anime: the table no longer matches the rows, until the same features are built again
+    build_features(new_path, tmp_path, min_score=None)
+    rebuilt = load_features(tmp_path)
+    assert not load_neighbour_table(tmp_path).matches(rebuilt, 7.0)
+    build_features(old_path, tmp_path, min_score=None)
+    assert load_neighbour_table(tmp_path).matches(load_features(tmp_path), 7.0)
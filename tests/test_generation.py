@@ -0,0 +1,92 @@
+import time
+import types
+
+import pytest
+
+from utils import generation, mock_inference
+from utils.generation import GenerationError, GenerationService, QuotaExceeded
+
+
+class Response:
+    status_code = 200
+    headers = {'content-type': "image/png"}
+    content = b"\x89PNG"
+
+
+class Session:
+    headers = {}
+
+    def post(self, url, json=None, timeout=None):
+        return Response()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic time of the service, moved by hand."""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(generation, "time", types.SimpleNamespace(
+        monotonic=lambda: clock.now, perf_counter=time.perf_counter, sleep=time.sleep))
+    return clock
+
+
+def test_quota_per_session_and_window(tmp_path, clock):
+    service = GenerationService("http://inference.test", cache_dir=str(tmp_path), quota=2, quota_window=60,
+                                session=Session())
+    service.generate("a", session_id="alice")
+    service.generate("b", session_id="alice")
+    with pytest.raises(QuotaExceeded):
+        service.generate("c", session_id="alice")
+    # Cached images are not counted
+    service.generate("a", session_id="alice")
+    assert service.remaining_quota("alice") == 0 and service.remaining_quota("bob") == 2
+
+    clock.now += 60
+    assert service.remaining_quota("alice") == 2
+    service.generate("c", session_id="alice")
+
+
+def test_expired_sessions_are_forgotten(tmp_path, clock):
+    service = GenerationService("http://inference.test", cache_dir=str(tmp_path), quota=5, quota_window=60,
+                                session=Session())
+    for i in range(50):
+        service.generate(f"prompt {i}", session_id=f"session {i}")
+    assert len(service._usage) == 50
+
+    clock.now += 30
+    assert service.remaining_quota("session 0") == 4
+    clock.now += 30
+    # Read without generating: the session is dropped, not recreated empty
+    assert service.remaining_quota("session 0") == 5 and "session 0" not in service._usage
+    assert service.remaining_quota("someone else") == 5 and "someone else" not in service._usage
+    # The next request sweeps every session whose window has passed
+    service.generate("new prompt", session_id="session 1")
+    assert list(service._usage) == ["session 1"]
+
+
+@pytest.fixture
+def inference():
+    server = mock_inference.serve(port=0, latency=0.3)
+    yield server, f"http://127.0.0.1:{server.server_address[1]}/generate"
+    server.shutdown()
+
+
+def test_batch(tmp_path, inference):
+    server, url = inference
+    service = GenerationService(url, cache_dir=str(tmp_path), workers=4)
+    cached = service.generate("cat girl", {'seed': 1})
+    variations = [("cat girl", {'seed': 2}), ("cat girl", {'seed': 2}), ("", None), ("cat girl", {'seed': 1})]
+
+    start = time.perf_counter()
+    results = list(service.generate_batch(variations, session_id="alice"))
+    elapsed = time.perf_counter() - start
+
+    # The cached image comes first, without waiting for the others
+    assert results[0] == (3, cached._replace(cached=True, seconds=0.0))
+    by_index = dict(results)
+    assert sorted(by_index) == [0, 1, 2, 3]
+    # Identical variations share one call, a failing one does not stop the batch
+    assert by_index[0] is by_index[1] and by_index[0].mime == "image/jpeg" and not by_index[0].cached
+    assert isinstance(by_index[2], GenerationError)
+    assert server.stats['generated'] == 2 and server.stats['requests'] == 3
+    # Requests run side by side
+    assert elapsed < 0.55
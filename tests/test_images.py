@@ -0,0 +1,64 @@
+import os
+from io import BytesIO
+
+from PIL import Image
+
+from utils.images import BlurCache
+
+
+class Response:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class Session:
+    """Stand-in for ``requests.Session``: a different noisy image per URL."""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, timeout=None):
+        self.requests.append(url)
+        buf = BytesIO()
+        Image.effect_noise((64, 64), len(self.requests) * 10).convert("RGB").save(buf, format="PNG")
+        return Response(buf.getvalue())
+
+
+def jpg_files(path):
+    return sorted(name for name in os.listdir(path) if name.endswith(".jpg"))
+
+
+def test_disk_tier_keeps_the_most_recent_files(tmp_path):
+    session = Session()
+    size = len(BlurCache(str(tmp_path / "sizes"), session=Session()).get("a"))
+    # No memory tier, room for two images on disk
+    cache = BlurCache(str(tmp_path), max_items=0, workers=1, session=session, max_disk_bytes=int(size * 2.5))
+    for url in "abc":
+        cache.get(url)
+    assert len(jpg_files(tmp_path)) == 2
+    cache.get("b")
+    cache.get("a")
+    # "a" was deleted, then "c" as the oldest when "a" came back
+    assert session.requests == list("abca")
+    cache.get("b")
+    cache.get("c")
+    assert session.requests == list("abcac")
+    assert sum(os.path.getsize(tmp_path / name) for name in jpg_files(tmp_path)) <= cache.max_disk_bytes
+
+
+def test_existing_files_are_evicted_by_age_on_start(tmp_path):
+    session = Session()
+    cache = BlurCache(str(tmp_path), max_items=0, workers=1, session=session)
+    for url in "abc":
+        cache.get(url)
+    files = {name: os.path.getsize(tmp_path / name) for name in jpg_files(tmp_path)}
+    newest = sorted(files)[:2]
+    for age, name in enumerate(sorted(files, key=newest.__contains__)):
+        os.utime(tmp_path / name, (1_000_000 + age, 1_000_000 + age))
+    BlurCache(str(tmp_path), session=session, max_disk_bytes=sum(files[name] for name in newest))
+    assert jpg_files(tmp_path) == newest
+    BlurCache(str(tmp_path), session=session, max_disk_bytes=0)
+    assert jpg_files(tmp_path) == []
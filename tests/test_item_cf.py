@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+
+from utils.item_cf import build_rating_matrix, item_neighbours
+
+
+def test_neighbours_match_dense_cosine():
+    rng = np.random.default_rng(0)
+    matrix = sp.random(300, 70, density=0.1, format='csr', dtype=np.float32, random_state=0)
+    matrix.data -= 0.5
+    columns, similarities = item_neighbours(matrix, k=8, block_size=16, workers=2)
+
+    dense = matrix.toarray().astype(np.float64)
+    norms = np.linalg.norm(dense, axis=0)
+    cosine = dense.T @ dense / np.outer(norms, norms)
+    np.fill_diagonal(cosine, 0)
+    for column in rng.choice(70, 10, replace=False):
+        expected = np.sort(cosine[column])[::-1][:8]
+        positive = expected > 0
+        np.testing.assert_allclose(similarities[column], np.where(positive, expected, 0), atol=1e-5)
+        assert (columns[column][~positive] == -1).all()
+        np.testing.assert_allclose(cosine[column, columns[column][positive]], expected[positive], atol=1e-5)
+
+
+@pytest.mark.parametrize("n_items", [0, 1])
+def test_tiny_catalogues(n_items):
+    columns, similarities = item_neighbours(sp.csr_matrix((5, n_items), dtype=np.float32), k=20)
+    assert columns.shape == similarities.shape == (n_items, 0)
+
+
+def test_rating_matrix_is_centered_per_user():
+    user_ids = np.array([1, 1, 1, 2, 2, 3])
+    anime_ids = np.array([10, 20, 30, 10, 20, 30])
+    ratings = np.array([8, 6, 0, 9, 5, 7])
+    matrix, anime = build_rating_matrix(user_ids, anime_ids, ratings, min_ratings=2)
+    # Anime 30 only has one rating once the 0 ("not rated") is dropped
+    np.testing.assert_array_equal(anime, [10, 20])
+    np.testing.assert_allclose(matrix.toarray(), [[1, -1], [2, -2]])
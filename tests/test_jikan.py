@@ -0,0 +1,54 @@
+import pytest
+
+from utils.jikan import PAGE_SIZE, JikanClient, JikanError
+
+
+class Response:
+    def __init__(self, status_code, payload=None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = {}
+
+    def json(self):
+        return self.payload
+
+
+class Session:
+    """Stand-in for ``requests.Session``: ``pages`` of the top anime, any other page is a 404."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def get(self, url, params=None, timeout=None):
+        self.requests.append(params['page'])
+        if params['page'] not in self.pages:
+            return Response(404)
+        return Response(200, {'data': [{'mal_id': i} for i in self.pages[params['page']]],
+                              'pagination': {'has_next_page': True}})
+
+
+def client(tmp_path, pages):
+    return JikanClient("http://jikan.test/v4", cache_dir=str(tmp_path), rate_limits=((1000, 1.0),), retries=0,
+                       session=Session(pages))
+
+
+def test_top_anime_pages_without_duplicates(tmp_path):
+    # The ranking shifted between the two pages: anime 24 is on both
+    jikan = client(tmp_path, {1: range(PAGE_SIZE), 2: range(PAGE_SIZE - 1, 2 * PAGE_SIZE - 1)})
+    anime = jikan.top_anime(limit=40)
+    assert [item['mal_id'] for item in anime] == list(range(40))
+    assert jikan.session.requests == [1, 2]
+    # Served from the cache the second time
+    jikan.top_anime(limit=40)
+    assert jikan.session.requests == [1, 2]
+
+
+def test_top_anime_keeps_the_pages_fetched_before_a_failure(tmp_path):
+    jikan = client(tmp_path, {1: range(PAGE_SIZE)})
+    assert [item['mal_id'] for item in jikan.top_anime(limit=60)] == list(range(PAGE_SIZE))
+
+
+def test_top_anime_raises_when_the_first_page_fails(tmp_path):
+    with pytest.raises(JikanError):
+        client(tmp_path, {}).top_anime()
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+from utils.name_search import NameIndex
+
+
+def index(titles, popularity=None):
+    return NameIndex(titles, [[title] for title in titles], popularity)
+
+
+def test_ranking_order():
+    titles = ["Title 9", "English Title 9", "English Title 90", "Title 9 Season 2", "The Title of 9", "Titl 9"]
+    keys, total = index(titles, popularity=np.arange(len(titles))).search("title 9")
+    # Exact, word suffix, prefix, word prefix, all words, trigrams
+    assert keys == ["Title 9", "English Title 9", "Title 9 Season 2", "English Title 90", "The Title of 9", "Titl 9"]
+    assert total == len(titles)
+
+
+def test_normalized_names_and_popularity():
+    df = pd.DataFrame({
+        'English name': ["Attack on Titan", "Attack No. 1", "UNKNOWN", None],
+        'Japanese name': ["進撃の巨人", "アタックNo.1", "ＦＵＬＬＷＩＤＴＨ", "Orphan"],
+        'Members': [3_000_000, 10_000, 5, 1],
+    })
+    names = NameIndex.from_frame(df, 'English name', ['English name', 'Japanese name'], 'Members')
+    # Rows without a key are not indexed, the "UNKNOWN" name of the third one is ignored
+    assert len(names) == 3
+    assert names.search("attack")[0] == ["Attack on Titan", "Attack No. 1"]
+    assert names.search("fullwidth")[0] == ["UNKNOWN"]
+    assert names.search("進撃")[0] == ["Attack on Titan"]
+    assert names.search("atack on")[0] == ["Attack on Titan"]
+    assert names.search("")[0][:2] == ["Attack on Titan", "Attack No. 1"]
+    assert names.search("attack", allowed=["Attack No. 1"]) == (["Attack No. 1"], 1)
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+from utils.quiz import ALL, CharacterPools, TraitIndex, draw_hard_options, draw_options, draw_questions
+
+
+def random_traits(rng, n, n_items, max_items):
+    """``n`` comma-separated lists of up to ``max_items`` items, and the sets they stand for."""
+    lists = [rng.choice(n_items, rng.integers(0, max_items + 1), replace=False) for _ in range(n)]
+    return [", ".join(f"t{i}" for i in items) for items in lists], [{f"Tags: t{i}" for i in items} for items in lists]
+
+
+def brute_force(sets, row):
+    return np.array([len(sets[row] & s) / len(sets[row] | s) if sets[row] | s else 0.0 for s in sets])
+
+
+@pytest.mark.parametrize("n_items, max_items", [(30, 6), (40, 30)])
+def test_most_similar_matches_brute_force(n_items, max_items):
+    rng = np.random.default_rng(n_items)
+    values, sets = random_traits(rng, 400, n_items, max_items)
+    index = TraitIndex({'Tags': values})
+    titles = rng.integers(0, 20, len(values)).astype(str)
+    pools = CharacterPools(titles)
+    for row in rng.choice(len(values), 40, replace=False):
+        expected = brute_force(sets, row)
+        np.testing.assert_allclose(index.similarities(row), expected, rtol=1e-6)
+        for pool in (None, pools.pool(titles[row]), pools.pool(ALL)):
+            candidates = np.arange(len(values)) if pool is None else pool
+            candidates = candidates[candidates != row]
+            for k in (1, 3, 6):
+                found = index.most_similar(row, k, pool, rng)
+                assert len(set(found)) == len(found) == min(k, len(candidates))
+                assert row not in found and set(found) <= set(candidates)
+                np.testing.assert_allclose(expected[found], np.sort(expected[candidates])[::-1][:k], rtol=1e-6)
+
+
+def test_most_similar_draws_among_ties():
+    # Every other character shares the answer's only tag: any of them may come out
+    index = TraitIndex({'Tags': ["a"] * 50})
+    rng = np.random.default_rng(0)
+    drawn = {int(row) for _ in range(50) for row in index.most_similar(0, 2, rng=rng)}
+    assert 0 not in drawn and len(drawn) > 10
+
+
+def test_questions_and_options_come_from_the_pool():
+    rng = np.random.default_rng(0)
+    titles = np.array(["a", "b", None, "a", "c", "b", "a"], dtype=object)
+    names = np.array(list("ABCDEFG"), dtype=object)
+    pools = CharacterPools(titles)
+    assert pools.pool("a").tolist() == [0, 3, 6]
+    assert pools.pool("unknown").tolist() == []
+    assert pools.pool(ALL).tolist() == list(range(7))
+    questions = draw_questions(pools.pool("a"), rng=rng)
+    assert sorted(questions.tolist()) == [0, 3, 6]
+    options = draw_options(pools.pool("a"), 3, names, rng=rng)
+    assert sorted(options) == ["A", "D", "G"]
+    assert draw_options(pools.pool("c"), 4, names, rng=rng) == ["E"]
+    index = TraitIndex({'Tags': ["x, y", "x", None, "y", "x, y", "z", "x, y"]})
+    assert sorted(draw_hard_options(index, pools.pool(ALL), 0, names, n=3, rng=rng)) == ["A", "E", "G"]
@@ -0,0 +1,81 @@
+import os
+import random
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+CHARACTER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "character")
+sys.path.insert(0, CHARACTER_DIR)
+import fixture_server  # noqa: E402
+import scrap_characters  # noqa: E402
+
+ROWS_PER_PAGE = 15
+
+
+@pytest.fixture
+def characters(tmp_path):
+    """The first 60 characters of the dataset, as the fixture server's CSV."""
+    path = tmp_path / "characters.csv"
+    pd.read_csv(os.path.join(CHARACTER_DIR, "anime_planet_characters.csv"), nrows=60).to_csv(path, index=False)
+    return path
+
+
+def serve(pages, error_rate=0.0):
+    """Start the fixture server on a free port, returns it and the base URL of its pages."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), fixture_server.make_handler(pages, error_rate, 0.0))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/characters/all"
+
+
+def scrape(tmp_path, base, pages, state=None, parser=None, output=None):
+    """One run of the scraper as its command line does it, returns the pages done."""
+    checkpoint, rows_dir = str(tmp_path / "checkpoint.jsonl"), str(tmp_path / "rows")
+    done = scrap_characters.scrape(pages, base, workers=4, rate=1000, burst=10, retries=5, backoff=0.0,
+                                   checkpoint=checkpoint, rows_dir=rows_dir, state=state, parser=parser)
+    scrap_characters.merge_rows([scrap_characters.rows_path(rows_dir, page) for page in pages], output,
+                                output if state is not None else None)
+    os.remove(checkpoint)
+    return done
+
+
+def same_rows(path, expected):
+    scraped = pd.read_csv(path).sort_values("Lien Profil").reset_index(drop=True)
+    expected = pd.read_csv(expected).sort_values("Lien Profil").reset_index(drop=True)
+    pd.testing.assert_frame_equal(scraped, expected[scrap_characters.COLUMNS])
+
+
+@pytest.mark.parametrize("parser", list(scrap_characters.PARSERS))
+def test_round_trip(tmp_path, characters, parser):
+    random.seed(0)
+    server, base = serve(fixture_server.pages_from_csv(characters, ROWS_PER_PAGE), error_rate=0.3)
+    try:
+        done = scrape(tmp_path, base, range(1, 5), parser=parser, output=str(tmp_path / "scraped.csv"))
+    finally:
+        server.shutdown()
+    assert sorted(done) == [1, 2, 3, 4]
+    same_rows(tmp_path / "scraped.csv", characters)
+
+
+def test_incremental_run_only_rewrites_changed_pages(tmp_path, characters):
+    output = str(tmp_path / "scraped.csv")
+    pages = fixture_server.pages_from_csv(characters, ROWS_PER_PAGE)
+    server, base = serve(pages)
+    try:
+        state = scrape(tmp_path, base, range(1, 5), state={}, output=output)
+        assert all(entry["changed"] for entry in state.values())
+
+        # One character renamed, one moved from page 3 to page 2 (which pushes another one to page 3)
+        df = pd.read_csv(characters)
+        df.loc[20, "Nom"] = "Renamed"
+        df = pd.concat([df.iloc[:20], df.iloc[[35]], df.iloc[20:35], df.iloc[36:]])
+        df.to_csv(characters, index=False)
+        pages.clear()
+        pages.update(fixture_server.pages_from_csv(characters, ROWS_PER_PAGE))
+        done = scrape(tmp_path, base, range(1, 5), state=state, output=output)
+    finally:
+        server.shutdown()
+    assert sorted(page for page, entry in done.items() if entry["changed"]) == [2, 3]
+    same_rows(output, characters)
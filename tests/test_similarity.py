@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from utils.similarity import ROW_BLOCK, SimilarityEngine
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """An engine over a memory-mapped float32 matrix of more than two row blocks."""
+    rng = np.random.default_rng(0)
+    path = tmp_path / "features.npy"
+    np.save(path, rng.normal(size=(2 * ROW_BLOCK + 300, 12)).astype(np.float32))
+    return SimilarityEngine(np.load(path, mmap_mode='r'), np.arange(2 * ROW_BLOCK + 300) * 10)
+
+
+def brute_force(matrix, query, weights, metric):
+    matrix, query = np.asarray(matrix, dtype=np.float64) * weights, query * weights
+    if metric == "euclidean":
+        return np.sqrt(((matrix - query) ** 2).sum(axis=1))
+    return 1 - matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query))
+
+
+def test_matrix_is_not_copied(tmp_path):
+    path = tmp_path / "features.npy"
+    np.save(path, np.ones((10, 3), dtype=np.float32))
+    matrix = np.load(path, mmap_mode='r')
+    engine = SimilarityEngine(matrix, np.arange(10))
+    assert np.shares_memory(engine.matrix, matrix) and engine.matrix.dtype == np.float32
+
+
+@pytest.mark.parametrize("metric", ["euclidean", "cosine"])
+def test_distances_match_brute_force(engine, metric):
+    rng = np.random.default_rng(1)
+    queries = engine.matrix[[5, 1500, 2300]].astype(np.float64)
+    weights = rng.uniform(0.5, 3, size=(3, engine.matrix.shape[1]))
+    distances = engine.batch_distances(queries, weights, metric)
+    for query, w, row in zip(queries, weights, distances):
+        np.testing.assert_allclose(row, brute_force(engine.matrix, query, w, metric), atol=1e-6)
+
+
+@pytest.mark.parametrize("aggregate", ["mean", "max"])
+def test_profile_top_k_matches_brute_force(engine, aggregate):
+    weights = np.random.default_rng(2).uniform(0.5, 3, engine.matrix.shape[1])
+    favourites = [30, 12_000, 20_000]
+    ids, distances = engine.profile_top_k(favourites, k=5, weights=weights, aggregate=aggregate)
+
+    rows = [engine.row_index[anime_id] for anime_id in favourites]
+    each = np.array([brute_force(engine.matrix, engine.matrix[row].astype(np.float64), weights, "euclidean")
+                     for row in rows])
+    expected = each.mean(axis=0) if aggregate == "mean" else each.min(axis=0)
+    expected[rows] = np.inf
+    order = np.argsort(expected, kind='stable')[:5]
+    np.testing.assert_array_equal(ids, engine.anime_ids[order])
+    np.testing.assert_allclose(distances, expected[order], atol=1e-6)
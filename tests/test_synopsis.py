@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from utils.similarity import SimilarityEngine
+from utils.synopsis import (blend_top_k, build_synopsis_index, invert, keep_heaviest, load_synopsis_index,
+                            save_synopsis_index)
+
+WORDS = ["pirate", "ninja", "school", "robot", "dragon", "magic", "sword", "space", "idol", "detective",
+         "village", "tournament", "demon", "festival", "train", "ocean"]
+
+
+@pytest.fixture
+def synopses():
+    rng = np.random.default_rng(0)
+    return [" ".join(rng.choice(WORDS, rng.integers(3, 12))) for _ in range(40)] + [None]
+
+
+@pytest.fixture
+def index(tmp_path, synopses):
+    """Index of every term of every synopsis, saved and memory-mapped again."""
+    forward, inverted, _ = build_synopsis_index(synopses, max_terms=len(WORDS), min_df=1, max_df=1.0)
+    save_synopsis_index(np.arange(len(synopses)) + 100, forward, inverted, str(tmp_path))
+    return load_synopsis_index(str(tmp_path))
+
+
+def dense_tfidf(texts):
+    vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True)
+    return vectorizer.fit_transform([text or "" for text in texts]).toarray()
+
+
+@pytest.mark.parametrize("aggregate", ["mean", "max"])
+def test_similarities_match_dense_cosine(index, synopses, aggregate):
+    vectors = dense_tfidf(synopses)
+    favourites = [3, 17, 29]
+    if aggregate == "mean":
+        centroid = vectors[favourites].sum(axis=0)
+        expected = vectors @ (centroid / np.linalg.norm(centroid))
+    else:
+        expected = (vectors @ vectors[favourites].T).max(axis=1)
+    scores = index.similarities([favourite + 100 for favourite in favourites] + [999], aggregate)
+    np.testing.assert_allclose(scores, expected, atol=1e-5)
+    # The missing synopsis shares no term with anything
+    assert scores[-1] == 0
+
+
+def test_keep_heaviest():
+    matrix = sp.csr_matrix(np.array([[0.1, 0.5, 0.3, 0.0], [2.0, 0.0, 1.0, 3.0], [0.0, 0.0, 0.0, 0.0]]))
+    indptr, indices, data = keep_heaviest(matrix, 2)
+    np.testing.assert_array_equal(indptr, [0, 2, 4, 4])
+    np.testing.assert_array_equal(indices, [1, 2, 0, 3])
+    np.testing.assert_allclose(data, np.array([0.5, 0.3, 2.0, 3.0]) / np.repeat([np.hypot(0.5, 0.3), np.hypot(2, 3)], 2))
+
+
+def test_postings_are_sorted_and_pruned(index, synopses):
+    n_terms = len(index.inverted[0]) - 1
+    inverted_indptr, rows, data = index.inverted
+    for built, saved in zip(invert(*index.forward, n_terms), index.inverted):
+        np.testing.assert_array_equal(built, saved)
+    assert sorted(zip(rows, data)) == sorted(zip(np.repeat(np.arange(len(synopses)), np.diff(index.forward[0])),
+                                                 index.forward[2]))
+    for term in range(n_terms):
+        assert (np.diff(data[inverted_indptr[term]:inverted_indptr[term + 1]]) <= 0).all()
+
+    # With one posting per term, only the anime of the heaviest posting of each of the favourite's terms scores
+    favourite = 5
+    start, end = index.forward[0][favourite], index.forward[0][favourite + 1]
+    terms, weights = index.forward[1][start:end], index.forward[2][start:end]
+    expected = np.zeros(len(synopses))
+    for term, weight in zip(terms, weights):
+        expected[rows[inverted_indptr[term]]] += weight * data[inverted_indptr[term]]
+    np.testing.assert_allclose(index.similarities([favourite + 100], max_postings=1), expected, atol=1e-6)
+
+
+def test_blend_without_text_is_the_feature_ranking():
+    rng = np.random.default_rng(1)
+    engine = SimilarityEngine(rng.normal(size=(200, 8)).astype(np.float32), np.arange(200))
+    favourites = [4, 50, 120]
+    distances = engine.batch_profile_distances([favourites])[0]
+    ids, _ = blend_top_k(engine.anime_ids, distances, rng.uniform(size=200).astype(np.float32), 0.0, k=5)
+    expected, _ = engine.profile_top_k(favourites, k=5)
+    np.testing.assert_array_equal(ids, expected)
+    assert not set(ids) & set(favourites)
@@ -0,0 +1,157 @@
+"""Per-anime gender statistics for the Who Watches page.
+
+``python -m utils.anime_stats`` writes ``data/user/anime_gender_stats.parquet``
+from the user scores: one row per anime with its rating count, mean rating,
+and viewer count and mean rating for each gender.
+
+The statistics are computed from partial sums (``aggregate_ratings``) that
+can be added together, so ``--full`` builds them chunk by chunk from the full
+MyAnimeList score dump with bounded memory (``stream_gender_stats``).
+"""
+import argparse
+import os
+import resource
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.storage import iter_chunks, load_table
+
+STATS_PATH = "data/user/anime_gender_stats.parquet"
+
+GENDERS = ['Male', 'Female', 'Non-Binary']
+
+
+def gender_lookup(user_details_df):
+    """Sorted user ids and the position of their gender in ``GENDERS`` (-1 when unknown)."""
+    mal_ids = user_details_df['Mal ID'].to_numpy()
+    codes = pd.Categorical(user_details_df['Gender'], categories=GENDERS).codes.astype(np.int8)
+    order = np.argsort(mal_ids, kind='stable')
+    return mal_ids[order], codes[order]
+
+
+def gender_codes(user_ids, lookup):
+    """Gender code of each user in ``user_ids``, -1 when unknown."""
+    mal_ids, codes = lookup
+    if len(mal_ids) == 0:
+        return np.full(len(user_ids), -1, dtype=np.int8)
+    positions = np.minimum(np.searchsorted(mal_ids, user_ids), len(mal_ids) - 1)
+    return np.where(mal_ids[positions] == user_ids, codes[positions], -1).astype(np.int8)
+
+
+def aggregate_ratings(anime_ids, ratings, genders):
+    """Rating counts and sums per anime, overall and per gender.
+
+    The result is indexed by ``anime_id``; partial results of different
+    chunks are merged with ``DataFrame.add(..., fill_value=0)``.
+    """
+    keys, inverse = np.unique(anime_ids, return_inverse=True)
+    ratings = np.asarray(ratings, dtype=np.float64)
+    columns = {
+        'count': np.bincount(inverse, minlength=len(keys)),
+        'sum': np.bincount(inverse, weights=ratings, minlength=len(keys)),
+    }
+    for code, gender in enumerate(GENDERS):
+        mask = genders == code
+        columns[f'count_{gender}'] = np.bincount(inverse[mask], minlength=len(keys))
+        columns[f'sum_{gender}'] = np.bincount(inverse[mask], weights=ratings[mask], minlength=len(keys))
+    return pd.DataFrame(columns, index=pd.Index(keys, name='anime_id'))
+
+
+def finalize_stats(partial):
+    """Turn summed partials into the per-anime statistics table."""
+    stats = pd.DataFrame(index=partial.index)
+    stats['rating_count'] = partial['count'].astype(np.int64)
+    stats['mean_rating'] = (partial['sum'] / partial['count']).astype(np.float32)
+    for gender in GENDERS:
+        count = partial[f'count_{gender}']
+        stats[f'viewers_{gender}'] = count.astype(np.int64)
+        stats[f'mean_rating_{gender}'] = (partial[f'sum_{gender}'] / count.where(count > 0)).astype(np.float32)
+    for col in stats.select_dtypes(include='integer').columns:
+        stats[col] = pd.to_numeric(stats[col], downcast='integer')
+    return stats
+
+
+def aggregate_chunk(user_scores_df, lookup):
+    genders = gender_codes(user_scores_df['user_id'].to_numpy(), lookup)
+    return aggregate_ratings(user_scores_df['anime_id'].to_numpy(), user_scores_df['rating'].to_numpy(), genders)
+
+
+def compute_gender_stats(user_scores_df, user_details_df):
+    return finalize_stats(aggregate_chunk(user_scores_df, gender_lookup(user_details_df)))
+
+
+def stream_gender_stats(user_details_df, dataset='user_scores_full', chunksize=1_000_000, workers=1):
+    """``compute_gender_stats`` over a dataset read chunk by chunk.
+
+    Memory stays bounded by the chunk size and the number of anime: at most
+    ``2 * workers`` chunks are in flight and each is reduced to one partial
+    row per anime before being merged. Returns the statistics and the number
+    of ratings read.
+    """
+    lookup = gender_lookup(user_details_df)
+    total, rows, pending = None, 0, deque()
+
+    def merge(partial):
+        return partial if total is None else total.add(partial, fill_value=0)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for chunk in iter_chunks(dataset, columns=['user_id', 'anime_id', 'rating'], chunksize=chunksize):
+            rows += len(chunk)
+            pending.append(executor.submit(aggregate_chunk, chunk, lookup))
+            if len(pending) >= 2 * workers:
+                total = merge(pending.popleft().result())
+        while pending:
+            total = merge(pending.popleft().result())
+    if total is None:
+        total = aggregate_ratings(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int8))
+    return finalize_stats(total), rows
+
+
+def load_gender_stats(stats_path=STATS_PATH):
+    """Per-anime statistics, computed from the user scores when they have not been built."""
+    if os.path.exists(stats_path):
+        return pd.read_parquet(stats_path)
+    return compute_gender_stats(
+        load_table('user_scores', columns=['user_id', 'anime_id', 'rating']),
+        load_table('user_details', columns=['Mal ID', 'Gender']),
+    )
+
+
+def gender_breakdown(stats, anime_id, genders=('Male', 'Female')):
+    """Viewer count and mean rating of ``anime_id`` for each of ``genders`` that rated it."""
+    if anime_id not in stats.index:
+        return pd.DataFrame(columns=['Gender', 'viewers', 'rating'])
+    row = stats.loc[anime_id]
+    breakdown = pd.DataFrame({
+        'Gender': list(genders),
+        'viewers': [int(row[f'viewers_{gender}']) for gender in genders],
+        'rating': [row[f'mean_rating_{gender}'] for gender in genders],
+    })
+    return breakdown[breakdown['viewers'] > 0].sort_values('Gender').reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the per-anime gender statistics.")
+    parser.add_argument("--stats-path", default=STATS_PATH)
+    parser.add_argument("--full", action="store_true",
+                        help="Stream the full score dump (users-score-2023) instead of the filtered one.")
+    parser.add_argument("--chunksize", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=1, help="Threads aggregating chunks in --full mode")
+    args = parser.parse_args()
+
+    user_details_df = load_table('user_details', columns=['Mal ID', 'Gender'])
+    start = time.perf_counter()
+    if args.full:
+        stats, rows = stream_gender_stats(user_details_df, 'user_scores_full', args.chunksize, args.workers)
+    else:
+        user_scores_df = load_table('user_scores', columns=['user_id', 'anime_id', 'rating'])
+        stats, rows = compute_gender_stats(user_scores_df, user_details_df), len(user_scores_df)
+    elapsed = time.perf_counter() - start
+    stats.to_parquet(args.stats_path)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{rows:,} ratings -> statistics of {len(stats)} anime in {args.stats_path} "
+          f"({elapsed:.1f} s, {rows / elapsed:,.0f} ratings/s, peak RSS {peak_mb:.0f} MB)")
@@ -0,0 +1,148 @@
+"""Process-wide catalog of the datasets read by the pages.
+
+Each dataset is loaded once per process with compact dtypes and its data is
+handed to every page and session, so memory does not grow with the number
+of visitors. The data is shared, so it is read-only: each call returns a
+shallow copy of the loaded frame (assigning or dropping a column only
+changes that copy) whose NumPy arrays, categorical codes included, are not
+writeable (writing values in place raises ``ValueError``). Other columns
+(Arrow strings) get their own array in each copy: Arrow data is immutable,
+so that copy shares its buffers and a write only changes the copy. Pages
+build new frames or Series from them.
+``memory_usage()`` reports what each loaded dataset costs.
+
+``python -m utils.catalog`` loads the page datasets and prints that report
+next to the size of the same columns as plain ``load_table`` frames.
+"""
+import argparse
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.storage import load_table
+
+# Text columns with fewer distinct values than this share of rows become categoricals
+CATEGORY_RATIO = 0.5
+
+# Columns read by the pages, loaded by the CLI
+PAGE_TABLES = {
+    'anime': ['Name', 'Score', 'Genres', 'Image URL'],
+    'user_details': ['Mal ID', 'Gender', 'Days Watched', 'Episodes Watched'],
+    'anime_filtered': ['anime_id', 'Name', 'English name', 'Japanese name', 'Score', 'Popularity', 'Members',
+                       'Watching', 'Completed'],
+    'characters': ['Nom', 'Image', 'Traits', 'Tags', 'Manga Associé'],
+}
+
+
+def compact(df):
+    """Smallest dtypes for ``df``: categoricals for repeated text, Arrow strings for the rest, downcast numbers."""
+    for col in df.columns:
+        series = df[col]
+        if series.dtype == object or isinstance(series.dtype, pd.StringDtype):
+            if series.nunique() < CATEGORY_RATIO * len(series):
+                df[col] = series.astype('category')
+            else:
+                df[col] = series.astype('string[pyarrow]')
+        elif pd.api.types.is_integer_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='integer')
+        elif pd.api.types.is_float_dtype(series.dtype):
+            df[col] = pd.to_numeric(series, downcast='float')
+    return df
+
+
+def read_only(values):
+    values = np.array(values)
+    values.flags.writeable = False
+    return values
+
+
+def freeze(df):
+    """Copy of ``df`` whose NumPy columns and categorical codes are read-only arrays.
+
+    Each column gets its own array (a column of a 2D block is a view, and
+    freezing a view leaves its base writeable); other extension arrays are
+    kept as they are.
+    """
+    columns = {}
+    for col in df.columns:
+        values = df[col].array
+        if isinstance(values, pd.Categorical):
+            columns[col] = pd.Categorical.from_codes(read_only(values.codes), dtype=values.dtype)
+        elif isinstance(df[col].dtype, np.dtype):
+            columns[col] = read_only(values)
+        else:
+            columns[col] = values
+    return pd.DataFrame(columns, index=df.index, copy=False)
+
+
+class DataCatalog:
+    """Loads each dataset once and shares it."""
+
+    def __init__(self):
+        self._frames = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, loader):
+        # One lock for every load: concurrent first visits load a dataset once
+        with self._lock:
+            if key not in self._frames:
+                self._frames[key] = freeze(loader())
+            df = self._frames[key]
+        shared = df.copy(deep=False)
+        for col in df.columns:
+            values = df[col].array
+            if not isinstance(df[col].dtype, np.dtype) and not isinstance(values, pd.Categorical):
+                # Writing replaces the data of the array in place: each copy needs its own
+                shared[col] = values.copy()
+        return shared
+
+    def table(self, name, columns=None):
+        """Shared, read-only frame of dataset ``name`` (see ``utils.storage.DATASETS``)."""
+        key = ('table', name, tuple(columns) if columns else None)
+        return self._get(key, lambda: compact(load_table(name, columns=columns)))
+
+    def register(self, name, loader):
+        """Shared, read-only result of ``loader()``, for frames derived from the datasets."""
+        return self._get(('derived', name, None), loader)
+
+    def memory_usage(self):
+        """Rows, columns and memory (MB) of each loaded dataset."""
+        rows = []
+        with self._lock:
+            frames = list(self._frames.items())
+        for (_, name, _), df in frames:
+            rows.append({
+                'dataset': name,
+                'columns': len(df.columns),
+                'rows': len(df),
+                'MB': df.memory_usage(deep=True).sum() / 1e6,
+            })
+        return pd.DataFrame(rows, columns=['dataset', 'columns', 'rows', 'MB'])
+
+
+_catalog = DataCatalog()
+
+
+def get_catalog():
+    """The catalog of this process."""
+    return _catalog
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory of the page datasets, catalog against plain frames.")
+    parser.parse_args()
+
+    catalog = get_catalog()
+    plain = {}
+    for name, columns in PAGE_TABLES.items():
+        try:
+            catalog.table(name, columns)
+        except FileNotFoundError as e:
+            print(f"Skipping {name}: {e}")
+            continue
+        plain[name] = load_table(name, columns=columns).memory_usage(deep=True).sum() / 1e6
+    report = catalog.memory_usage()
+    report['plain MB'] = report['dataset'].map(plain)
+    print(report.to_string(index=False, float_format=lambda x: f"{x:.1f}"))
+    print(f"Total: {report['MB'].sum():.1f} MB shared, against {report['plain MB'].sum():.1f} MB per copy before")
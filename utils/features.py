@@ -0,0 +1,384 @@
+"""Feature matrix for the recommendation page.
+
+The page used to rebuild the whole encoding on every rerun. ``build_features``
+does it once, offline, and writes the result to ``data/anime/recommendation/``:
+
+- ``features.npy``: standardized and one-hot encoded matrix (float32, one row per anime)
+- ``anime_ids.npy``: the ``anime_id`` of each row
+- ``row_hashes.npy``: a hash of the source values of each row, to spot the ones that changed
+- ``metadata.json``: column vocabulary, genre columns, scaler statistics and
+  the ``fingerprint`` of the rows (tables derived from them, like the
+  neighbour table, are only used while it is the same)
+- ``display.csv``: the original values shown on the recommendation cards
+
+Rebuild it after each dataset refresh with ``python -m utils.features``, or,
+when the refresh mostly adds titles, update it with ``--update``
+(``update_features``): only the new and changed rows are encoded. Values
+missing from the vocabulary become new columns, appended at the end (zero for
+the existing rows), and the running mean and variance of the numeric columns
+are updated, but the rows keep the standardization they were encoded with
+until it drifts by more than ``DRIFT_THRESHOLD`` from the running statistics;
+then the numeric columns of every row are re-standardized. Anime removed from
+the source or falling under the minimum score are only dropped by a rebuild.
+"""
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import MultiLabelBinarizer, StandardScaler
+
+from utils.timing import span
+
+ANIME_DATA_PATH = "data/anime/anime-dataset-2023.csv"
+ARTIFACT_DIR = "data/anime/recommendation"
+
+# Columns the recommendation never uses
+DROPPED_COLUMNS = ['Image URL', 'Premiered', 'Aired', 'Status', 'Duration', 'Rating']
+# Multi-valued categorical columns, one-hot encoded with a "<col>_" prefix
+CATEGORICAL_COLUMNS = ['Type', 'Producers', 'Licensors', 'Studios', 'Source']
+# Numeric columns, standardized
+NUMERIC_COLUMNS = ['Score', 'Episodes', 'Rank', 'Popularity', 'Favorites', 'Scored By', 'Members']
+# Original values kept for the recommendation cards
+DISPLAY_COLUMNS = ['anime_id', 'English name', 'Other name', 'Genres', 'Score', 'Episodes', 'Image URL']
+
+MIN_SCORE = 8
+# Shift of a numeric column's mean, or log-ratio of its scale, in units of the
+# scale the rows were encoded with, above which an update re-standardizes every row
+DRIFT_THRESHOLD = 0.1
+
+
+def prepare_catalogue(anime_df, min_score=MIN_SCORE):
+    """Drop unused columns, rows with 'UNKNOWN' values and anime scored below ``min_score``."""
+    anime_info_df = anime_df.drop(columns=DROPPED_COLUMNS)
+    anime_info_df = anime_info_df.replace('UNKNOWN', np.nan).dropna()
+    if min_score is not None:
+        anime_info_df = anime_info_df[anime_info_df['Score'].astype(float) > min_score]
+    return anime_info_df
+
+
+def encode_features(anime_info_df):
+    """Encode a prepared catalogue.
+
+    Returns the feature matrix, its column names, the genre columns and the
+    scaler statistics: mean and scale of each numeric column, and the count,
+    mean and variance ``update_features`` keeps running.
+    """
+    blocks = []
+    columns = []
+
+    # Standardize numeric features
+    scaler_stats = {}
+    for feature in NUMERIC_COLUMNS:
+        scaler = StandardScaler()
+        blocks.append(scaler.fit_transform(anime_info_df[[feature]].astype(float)))
+        columns.append(feature)
+        scaler_stats[feature] = {
+            'mean': float(scaler.mean_[0]), 'scale': float(scaler.scale_[0]),
+            'count': int(scaler.n_samples_seen_), 'running_mean': float(scaler.mean_[0]),
+            'running_var': float(scaler.var_[0]),
+        }
+
+    # Handling 'Genres' - a comma-separated list
+    mlb_genres = MultiLabelBinarizer()
+    blocks.append(mlb_genres.fit_transform(anime_info_df['Genres'].astype(str).str.split(',')))
+    genre_columns = list(mlb_genres.classes_)
+    columns.extend(genre_columns)
+
+    # One-hot encoding for the other categorical columns
+    for col in CATEGORICAL_COLUMNS:
+        mlb = MultiLabelBinarizer()
+        blocks.append(mlb.fit_transform(anime_info_df[col].astype(str).str.split(', ')))
+        columns.extend(f"{col}_{cls}" for cls in mlb.classes_)
+
+    matrix = np.hstack(blocks).astype(np.float32)
+    return matrix, columns, genre_columns, scaler_stats
+
+
+def row_hashes(anime_info_df):
+    """Hash of the values of each row, as read from the CSV."""
+    return pd.util.hash_pandas_object(anime_info_df.astype(str), index=False).to_numpy()
+
+
+def extend_vocabulary(anime_info_df, columns, genre_columns):
+    """Append to ``columns`` (and ``genre_columns``) the values of ``anime_info_df`` they miss; returns them."""
+    known = set(columns)
+    added = []
+    values = [(None, anime_info_df['Genres'].astype(str).str.split(','))]
+    values += [(col, anime_info_df[col].astype(str).str.split(', ')) for col in CATEGORICAL_COLUMNS]
+    for col, lists in values:
+        for value in sorted(set(lists.explode())):
+            name = value if col is None else f"{col}_{value}"
+            if name not in known:
+                known.add(name)
+                added.append(name)
+                columns.append(name)
+                if col is None:
+                    genre_columns.append(name)
+    return added
+
+
+def encode_rows(anime_info_df, columns, scaler_stats):
+    """Encode a prepared catalogue with a fixed vocabulary and standardization.
+
+    Values missing from ``columns`` are ignored: call ``extend_vocabulary`` first.
+    """
+    matrix = np.zeros((len(anime_info_df), len(columns)), dtype=np.float32)
+    column_index = {col: i for i, col in enumerate(columns)}
+    for feature in NUMERIC_COLUMNS:
+        stats = scaler_stats[feature]
+        matrix[:, column_index[feature]] = (anime_info_df[feature].astype(float) - stats['mean']) / stats['scale']
+
+    values = [(None, anime_info_df['Genres'].astype(str).str.split(','))]
+    values += [(col, anime_info_df[col].astype(str).str.split(', ')) for col in CATEGORICAL_COLUMNS]
+    positions = np.arange(len(anime_info_df))
+    for col, lists in values:
+        exploded = lists.set_axis(positions).explode()
+        names = exploded if col is None else col + "_" + exploded
+        indices = names.map(column_index)
+        known = indices.notna().to_numpy()
+        matrix[exploded.index.to_numpy()[known], indices.to_numpy()[known].astype(np.int64)] = 1.0
+    return matrix
+
+
+def combine_stats(count, mean, var, values, sign=1):
+    """Count, mean and variance (``ddof=0``) after adding ``values`` (removing them with ``sign=-1``)."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return count, mean, var
+    other_count, other_mean = len(values), float(values.mean())
+    other_m2 = float(((values - other_mean) ** 2).sum())
+    m2 = var * count
+    if sign > 0:
+        total = count + other_count
+        delta = other_mean - mean
+        new_mean = mean + delta * other_count / total
+        new_m2 = m2 + other_m2 + delta ** 2 * count * other_count / total
+    else:
+        total = count - other_count
+        if total <= 0:
+            return 0, 0.0, 0.0
+        new_mean = (mean * count - other_mean * other_count) / total
+        new_m2 = m2 - other_m2 - (other_mean - new_mean) ** 2 * total * other_count / count
+    return total, float(new_mean), max(float(new_m2), 0.0) / total
+
+
+def scaler_drift(scaler_stats):
+    """Largest drift of the running statistics from the standardization in use (see ``DRIFT_THRESHOLD``)."""
+    drift = 0.0
+    for stats in scaler_stats.values():
+        running_scale = np.sqrt(stats['running_var']) or 1.0
+        drift = max(drift, abs(stats['running_mean'] - stats['mean']) / stats['scale'],
+                    abs(np.log(running_scale / stats['scale'])))
+    return float(drift)
+
+
+def save_array(path, array):
+    """``np.save`` to a new file replacing ``path``: pages memory-mapping the old one keep reading it."""
+    with open(f"{path}.tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(f"{path}.tmp", path)
+
+
+def fingerprint(anime_ids, hashes, columns, scaler_stats):
+    """Hash of what the rows of an artifact encode: their anime, source values, columns and standardization."""
+    digest = hashlib.sha256(np.ascontiguousarray(anime_ids, dtype=np.int64).tobytes())
+    digest.update(np.ascontiguousarray(hashes).tobytes())
+    scaling = {feature: [stats['mean'], stats['scale']] for feature, stats in scaler_stats.items()}
+    digest.update(json.dumps([columns, scaling], sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def write_artifact(output_dir, matrix, anime_ids, hashes, display_df, metadata):
+    os.makedirs(output_dir, exist_ok=True)
+    save_array(os.path.join(output_dir, "features.npy"), matrix)
+    save_array(os.path.join(output_dir, "anime_ids.npy"), anime_ids)
+    save_array(os.path.join(output_dir, "row_hashes.npy"), hashes)
+    display_df[DISPLAY_COLUMNS].to_csv(os.path.join(output_dir, "display.csv"), index=False)
+    with open(os.path.join(output_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({**metadata, 'rows': int(matrix.shape[0]),
+                   'fingerprint': fingerprint(anime_ids, hashes, metadata['columns'], metadata['scaler'])},
+                  f, ensure_ascii=False, indent=1)
+
+
+def display_rows(anime_info_df, anime_df):
+    display_df = anime_info_df[['anime_id', 'English name', 'Other name', 'Genres', 'Score', 'Episodes']]
+    return display_df.merge(anime_df[['anime_id', 'Image URL']], on='anime_id', how='left')
+
+
+def build_features(source=ANIME_DATA_PATH, output_dir=ARTIFACT_DIR, min_score=MIN_SCORE):
+    """Build the feature artifact from the anime dataset and write it to ``output_dir``."""
+    with span("read_catalogue"):
+        anime_df = pd.read_csv(source)
+    with span("prepare_catalogue"):
+        anime_info_df = prepare_catalogue(anime_df, min_score=min_score)
+    with span("encode_features"):
+        matrix, columns, genre_columns, scaler_stats = encode_features(anime_info_df)
+
+    write_artifact(output_dir, matrix, anime_info_df['anime_id'].to_numpy(dtype=np.int64), row_hashes(anime_info_df),
+                   display_rows(anime_info_df, anime_df), {
+                       'source': source,
+                       'min_score': min_score,
+                       'columns': columns,
+                       'genre_columns': genre_columns,
+                       'scaler': scaler_stats,
+                   })
+    return matrix.shape
+
+
+def update_features(source=ANIME_DATA_PATH, output_dir=ARTIFACT_DIR, drift_threshold=DRIFT_THRESHOLD):
+    """Update the feature artifact of ``output_dir`` with the new and changed anime of ``source``.
+
+    ``source`` is the refreshed dataset or only its new rows. Returns a
+    report: ``added`` and ``changed`` anime, ``new_columns``, ``delta_rows``
+    (rows of the updated matrix that were encoded), ``drift`` and
+    ``restandardized``. When ``restandardized`` is true every distance
+    changed and the neighbour table must be rebuilt, otherwise
+    ``utils.neighbours.update_neighbour_table`` only computes the delta.
+    """
+    with open(os.path.join(output_dir, "metadata.json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+    if not os.path.exists(os.path.join(output_dir, "row_hashes.npy")):
+        raise ValueError(f"{output_dir} was built without incremental statistics, rebuild it with python -m utils.features")
+    old_matrix = np.load(os.path.join(output_dir, "features.npy"), mmap_mode='r')
+    old_ids = np.load(os.path.join(output_dir, "anime_ids.npy"))
+    old_hashes = np.load(os.path.join(output_dir, "row_hashes.npy"))
+    display_df = pd.read_csv(os.path.join(output_dir, "display.csv"))
+
+    with span("read_catalogue"):
+        anime_df = pd.read_csv(source)
+    with span("prepare_catalogue"):
+        anime_info_df = prepare_catalogue(anime_df, min_score=metadata['min_score'])
+        anime_info_df = anime_info_df.drop_duplicates('anime_id', keep='last')
+    ids = anime_info_df['anime_id'].to_numpy(dtype=np.int64)
+    hashes = row_hashes(anime_info_df)
+    order = np.argsort(old_ids)
+    found = np.minimum(np.searchsorted(old_ids, ids, sorter=order), len(old_ids) - 1)
+    old_rows = order[found] if len(old_ids) else np.zeros(len(ids), dtype=np.int64)
+    is_new = ~(old_ids[old_rows] == ids) if len(old_ids) else np.ones(len(ids), dtype=bool)
+    is_changed = ~is_new & (old_hashes[old_rows] != hashes)
+    report = {'added': int(is_new.sum()), 'changed': int(is_changed.sum()), 'new_columns': 0,
+              'delta_rows': np.empty(0, dtype=np.int64), 'drift': scaler_drift(metadata['scaler']),
+              'restandardized': False}
+    if not is_new.any() and not is_changed.any():
+        return report
+
+    delta_df = anime_info_df[is_new | is_changed]
+    changed_rows = old_rows[is_changed]
+    scaler_stats = metadata['scaler']
+    # Running statistics: the old values of the changed rows out, the delta in
+    for feature in NUMERIC_COLUMNS:
+        stats = scaler_stats[feature]
+        column = metadata['columns'].index(feature)
+        old_values = old_matrix[changed_rows, column].astype(np.float64) * stats['scale'] + stats['mean']
+        count, mean, var = combine_stats(stats['count'], stats['running_mean'], stats['running_var'], old_values, -1)
+        count, mean, var = combine_stats(count, mean, var, delta_df[feature].astype(float))
+        stats.update(count=count, running_mean=mean, running_var=var)
+
+    with span("encode_features"):
+        new_columns = extend_vocabulary(delta_df, metadata['columns'], metadata['genre_columns'])
+        delta_matrix = encode_rows(delta_df, metadata['columns'], scaler_stats)
+
+    # Existing rows are copied as they are, zero in the new columns
+    n_old, n_added = len(old_ids), int(is_new.sum())
+    matrix = np.zeros((n_old + n_added, len(metadata['columns'])), dtype=np.float32)
+    matrix[:n_old, :old_matrix.shape[1]] = old_matrix
+    delta_rows = np.concatenate([changed_rows, np.arange(n_old, n_old + n_added)])
+    matrix[delta_rows] = delta_matrix[np.concatenate([np.flatnonzero(is_changed[is_new | is_changed]),
+                                                      np.flatnonzero(is_new[is_new | is_changed])])]
+    all_ids = np.concatenate([old_ids, ids[is_new]])
+    all_hashes = np.concatenate([old_hashes, hashes[is_new]])
+    all_hashes[changed_rows] = hashes[is_changed]
+
+    delta_display = display_rows(delta_df, anime_df)[DISPLAY_COLUMNS].set_index('anime_id')
+    display_df = display_df.set_index('anime_id').astype(object)
+    display_df.loc[ids[is_changed]] = delta_display.loc[ids[is_changed]]
+    display_df = pd.concat([display_df, delta_display.loc[ids[is_new]]]).reset_index()
+
+    drift = scaler_drift(scaler_stats)
+    if drift > drift_threshold:
+        for feature in NUMERIC_COLUMNS:
+            stats = scaler_stats[feature]
+            column = metadata['columns'].index(feature)
+            scale = float(np.sqrt(stats['running_var'])) or 1.0
+            matrix[:, column] = (matrix[:, column] * stats['scale'] + stats['mean'] - stats['running_mean']) / scale
+            stats.update(mean=stats['running_mean'], scale=scale)
+
+    write_artifact(output_dir, matrix, all_ids, all_hashes, display_df, {**metadata, 'source': source})
+    report.update(new_columns=len(new_columns), delta_rows=np.sort(delta_rows), drift=drift,
+                  restandardized=drift > drift_threshold)
+    return report
+
+
+class FeatureStore:
+    """Read-only view over a feature artifact written by ``build_features``."""
+
+    def __init__(self, matrix, anime_ids, metadata, display):
+        self.matrix = matrix
+        self.anime_ids = anime_ids
+        self.metadata = metadata
+        self.columns = metadata['columns']
+        self.genre_columns = metadata['genre_columns']
+        self.scaler = metadata['scaler']
+        # None for artifacts written before fingerprints: nothing derived from them is trusted
+        self.fingerprint = metadata.get('fingerprint')
+        self.display = display
+        self.column_index = {col: i for i, col in enumerate(self.columns)}
+        self.row_index = {int(anime_id): i for i, anime_id in enumerate(anime_ids)}
+
+    def row_of(self, anime_id):
+        """Row of ``anime_id`` in the feature matrix."""
+        return self.row_index[int(anime_id)]
+
+    def genre_weights(self, genres, factor):
+        """Per-column weights multiplying the columns of ``genres`` by ``factor``."""
+        weights = np.ones(len(self.columns))
+        for genre in genres:
+            if genre in self.column_index:
+                weights[self.column_index[genre]] = factor
+        return weights
+
+    def profile_genres(self, anime_ids):
+        """Union of the genres of ``anime_ids``, in order of first appearance."""
+        genres = self.display['Genres'].to_numpy()
+        return list(dict.fromkeys(
+            genre for anime_id in anime_ids for genre in str(genres[self.row_of(anime_id)]).split(", ")
+        ))
+
+
+def load_features(output_dir=ARTIFACT_DIR):
+    """Load the feature artifact, memory-mapping the matrix."""
+    with open(os.path.join(output_dir, "metadata.json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+    matrix = np.load(os.path.join(output_dir, "features.npy"), mmap_mode='r')
+    anime_ids = np.load(os.path.join(output_dir, "anime_ids.npy"))
+    display = pd.read_csv(os.path.join(output_dir, "display.csv"))
+    return FeatureStore(matrix, anime_ids, metadata, display)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the recommendation feature matrix.")
+    parser.add_argument("--source", default=ANIME_DATA_PATH)
+    parser.add_argument("--output-dir", default=ARTIFACT_DIR)
+    parser.add_argument("--min-score", type=float, default=MIN_SCORE,
+                        help="Keep anime scored above this value (use a negative value to keep all)")
+    parser.add_argument("--update", action="store_true",
+                        help="Only encode the new and changed anime of --source, and update the neighbour table")
+    parser.add_argument("--drift-threshold", type=float, default=DRIFT_THRESHOLD)
+    args = parser.parse_args()
+    if args.update:
+        from utils.neighbours import refresh_neighbour_table
+
+        start = time.perf_counter()
+        report = update_features(args.source, args.output_dir, args.drift_threshold)
+        print(f"{report['added']} new and {report['changed']} changed anime, {report['new_columns']} new columns, "
+              f"drift {report['drift']:.3f}{' (re-standardized)' if report['restandardized'] else ''} "
+              f"in {time.perf_counter() - start:.2f} s")
+        refresh_neighbour_table(report, args.output_dir)
+    else:
+        min_score = args.min_score if args.min_score >= 0 else None
+        rows, cols = build_features(args.source, args.output_dir, min_score)
+        print(f"Feature matrix {rows} x {cols} written to {args.output_dir}")
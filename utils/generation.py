@@ -0,0 +1,232 @@
+"""Image generation through the Hugging Face inference API.
+
+``GenerationService`` is shared by every session of the process:
+
+- requests run on a fixed number of worker threads; once ``max_queue``
+  requests are waiting, new ones are refused (``QueueFull``)
+- each session may start ``quota`` generations per ``quota_window`` seconds
+  (``QuotaExceeded``)
+- identical requests (same prompt and parameters) in flight at the same time
+  share a single API call
+- results are stored on disk under the hash of the model, prompt and
+  parameters (``CACHE_DIR``), so a repeated prompt is served from the cache
+  without calling the API or counting against the quota
+
+Images are returned as the raw bytes sent by the API, with their MIME type.
+``HF_API_URL`` points the service at another server, e.g. the local stand-in
+``python -m utils.mock_inference``.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.timing import span
+
+API_URL = os.environ.get(
+    "HF_API_URL", "https://router.huggingface.co/hf-inference/models/black-forest-labs/FLUX.1-schnell"
+)
+CACHE_DIR = "data/generated"
+WORKERS = int(os.environ.get("GENERATION_WORKERS", 4))
+REQUEST_TIMEOUT = 120
+EXTENSIONS = {'image/png': "png", 'image/jpeg': "jpg", 'image/webp': "webp"}
+
+# seconds: time spent on the API call, retries included (0 when served from the cache)
+GeneratedImage = namedtuple("GeneratedImage", ["data", "mime", "key", "cached", "seconds"], defaults=[0.0])
+
+
+class GenerationError(Exception):
+    """The API answered with an error; ``detail`` holds its JSON body (or message)."""
+
+    def __init__(self, detail):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class QuotaExceeded(GenerationError):
+    pass
+
+
+class QueueFull(GenerationError):
+    pass
+
+
+def cache_key(api_url, prompt, parameters=None):
+    payload = json.dumps({'model': api_url, 'inputs': prompt, 'parameters': parameters or {}}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class GenerationService:
+    """Queued, deduplicated and cached calls to a text-to-image endpoint."""
+
+    def __init__(self, api_url=API_URL, token=None, cache_dir=CACHE_DIR, workers=WORKERS, max_queue=16,
+                 quota=20, quota_window=3600, retries=2, backoff=2.0, session=None):
+        self.api_url = api_url
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self.max_queue = max_queue
+        self.quota = quota
+        self.quota_window = quota_window
+        self.retries = retries
+        self.backoff = backoff
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+        if token:
+            session.headers["Authorization"] = f"Bearer {token}"
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="generation")
+        self._pending = {}
+        self._usage = {}
+        self._swept_at = time.monotonic()
+        # Reentrant: a request that fails at once runs its done callback inside submit()
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _cached(self, key):
+        for mime, extension in EXTENSIONS.items():
+            path = os.path.join(self.cache_dir, f"{key}.{extension}")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    return GeneratedImage(f.read(), mime, key, True)
+        return None
+
+    def _store(self, key, data, mime):
+        path = os.path.join(self.cache_dir, f"{key}.{EXTENSIONS[mime]}")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _call(self, key, prompt, parameters):
+        payload = {'inputs': prompt}
+        if parameters:
+            payload['parameters'] = parameters
+        start = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                with span("generation.request"):
+                    response = self.session.post(self.api_url, json=payload, timeout=REQUEST_TIMEOUT)
+            except requests.RequestException as e:
+                error = {'error': str(e)}
+            else:
+                mime = response.headers.get("content-type", "").split(";")[0]
+                if response.status_code == 200 and mime in EXTENSIONS:
+                    self._store(key, response.content, mime)
+                    return GeneratedImage(response.content, mime, key, False, time.perf_counter() - start)
+                try:
+                    error = response.json()
+                except ValueError:
+                    error = {'error': f"HTTP {response.status_code}"}
+                # 503: the model is loading, 429: rate limited; other errors won't go away by retrying
+                if response.status_code not in (429, 503):
+                    break
+            if attempt < self.retries:
+                time.sleep(self.backoff * 2 ** attempt + random.uniform(0, self.backoff))
+        raise GenerationError(error)
+
+    def _recent(self, session_id, now):
+        """Requests of ``session_id`` in the current quota window; sessions without any are forgotten."""
+        usage = self._usage.get(session_id)
+        if usage is None:
+            return deque()
+        while usage and now - usage[0] >= self.quota_window:
+            usage.popleft()
+        if not usage:
+            del self._usage[session_id]
+        return usage
+
+    def _take_quota(self, session_id):
+        now = time.monotonic()
+        # Sessions that never came back are only dropped here, at most once per window
+        if now - self._swept_at >= self.quota_window:
+            self._swept_at = now
+            for other in list(self._usage):
+                self._recent(other, now)
+        usage = self._recent(session_id, now)
+        if len(usage) >= self.quota:
+            wait = int(self.quota_window - (now - usage[0])) + 1
+            raise QuotaExceeded(f"Generation quota reached ({self.quota} per {self.quota_window // 60} min), "
+                                f"try again in {wait // 60} min {wait % 60} s")
+        usage.append(now)
+        self._usage[session_id] = usage
+
+    def remaining_quota(self, session_id):
+        with self._lock:
+            return self.quota - len(self._recent(session_id, time.monotonic()))
+
+    def submit(self, prompt, parameters=None, session_id=None):
+        """Future of the ``GeneratedImage`` for ``prompt``.
+
+        Raises ``QuotaExceeded`` or ``QueueFull`` right away when the request
+        cannot be queued; API errors are raised by ``Future.result()``.
+        """
+        key = cache_key(self.api_url, prompt, parameters)
+        cached = self._cached(key)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        with self._lock:
+            future = self._pending.get(key)
+            if future is not None:
+                return future
+            # It may have finished between the cache lookup and here
+            cached = self._cached(key)
+            if cached is not None:
+                future = Future()
+                future.set_result(cached)
+                return future
+            if len(self._pending) >= self.max_queue:
+                raise QueueFull("Too many images are being generated right now, try again in a moment")
+            self._take_quota(session_id)
+            future = self.executor.submit(self._call, key, prompt, parameters)
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._forget(key))
+            return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def generate(self, prompt, parameters=None, session_id=None):
+        """Blocking ``submit``."""
+        return self.submit(prompt, parameters, session_id).result()
+
+    def generate_batch(self, variations, session_id=None, concurrency=WORKERS):
+        """Generate ``(prompt, parameters)`` pairs with at most ``concurrency`` requests in flight.
+
+        Yields ``(index, GeneratedImage or GenerationError)`` as each result
+        arrives, so callers can show images before the whole batch is done.
+        """
+        todo = deque(enumerate(variations))
+        pending = {}  # future -> indices of the variations it answers (identical ones share a future)
+        while todo or pending:
+            while todo and len(pending) < concurrency:
+                index, (prompt, parameters) = todo.popleft()
+                try:
+                    future = self.submit(prompt, parameters, session_id)
+                except GenerationError as e:
+                    yield index, e
+                    continue
+                pending.setdefault(future, []).append(index)
+            if not pending:
+                continue
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except GenerationError as e:
+                    result = e
+                for index in pending.pop(future):
+                    yield index, result
@@ -0,0 +1,246 @@
+"""Blurred character images for the quiz.
+
+``python -m utils.images`` downloads every character image once, resizes it
+to display size, renders it at each of ``BLUR_LEVELS`` and packs everything
+into a single file (``ThumbnailBundle``) that the quiz memory-maps, so no
+image is fetched or decoded at runtime.
+
+For images missing from the bundle, ``BlurCache`` keeps the blurred bytes of
+each ``(url, radius)`` in two tiers: an in-memory LRU shared by every session
+of the process, and a directory on disk that survives restarts, capped at
+``MAX_DISK_BYTES`` (least recently used files are deleted first). Images of
+upcoming questions are fetched and blurred ahead of time on a small thread
+pool (``prefetch``).
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import requests
+from PIL import Image, ImageFilter
+
+from utils.storage import load_table
+from utils.timing import span
+
+CACHE_DIR = "data/character/blur_cache"
+MAX_DISK_BYTES = 256 * 1024 * 1024
+BUNDLE_PATH = "data/character/thumbnails.bin"
+BLUR_RADIUS = 10
+# Blur radius of each hint level, from the first question view to the last hint
+BLUR_LEVELS = (10, 6, 3)
+THUMBNAIL_SIZE = (285, 399)
+REQUEST_TIMEOUT = 10
+
+BUNDLE_MAGIC = b"SMTB"
+
+
+def encode_jpeg(img):
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def blur(image_bytes, radius=BLUR_RADIUS):
+    """Blur encoded image bytes, returning JPEG bytes."""
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    return encode_jpeg(img.filter(ImageFilter.GaussianBlur(radius=radius)))
+
+
+def render_levels(image_bytes, levels=BLUR_LEVELS, size=THUMBNAIL_SIZE):
+    """Resize an image to fit ``size`` and blur it at each radius of ``levels``."""
+    img = Image.open(BytesIO(image_bytes)).convert("RGB")
+    img.thumbnail(size)
+    return [encode_jpeg(img.filter(ImageFilter.GaussianBlur(radius=radius))) for radius in levels]
+
+
+class BlurCache:
+    """Two-tier cache of blurred images with background prefetching."""
+
+    def __init__(self, cache_dir=CACHE_DIR, max_items=256, workers=4, session=None, max_disk_bytes=MAX_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self.session = session or requests.Session()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blur")
+        self._memory = OrderedDict()
+        self._pending = {}
+        self._lock = threading.RLock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # Size of each file on disk, least recently used first (by modification time, touched on each read)
+        files = sorted((entry.stat().st_mtime, entry.name, entry.stat().st_size)
+                       for entry in os.scandir(cache_dir) if entry.name.endswith(".jpg"))
+        self._disk = OrderedDict((name, size) for _, name, size in files)
+        self._disk_bytes = sum(self._disk.values())
+        self._evict()
+
+    def _key(self, url, radius):
+        return hashlib.sha256(f"{radius}:{url}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def _load(self, url, radius):
+        key = self._key(url, radius)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        name = f"{key}.jpg"
+        path = os.path.join(self.cache_dir, name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = None
+        if data is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass  # evicted meanwhile, the bytes read are still valid
+        else:
+            with span("image.fetch"):
+                response = self.session.get(url, timeout=REQUEST_TIMEOUT)
+                response.raise_for_status()
+            data = blur(response.content, radius)
+            # Write then rename so a concurrent reader never sees a partial file
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk.pop(name, 0)
+            self._disk[name] = len(data)
+            self._evict()
+        self._remember(key, data)
+        return data
+
+    def _evict(self):
+        """Delete the least recently used files until the disk tier fits in ``max_disk_bytes``."""
+        with self._lock:
+            while self._disk_bytes > self.max_disk_bytes and self._disk:
+                name, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                except FileNotFoundError:
+                    pass  # already deleted by another process sharing the directory
+
+    def _submit(self, url, radius):
+        key = self._key(url, radius)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self.executor.submit(self._load, url, radius)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+            return future
+
+    def _forget(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def get(self, url, radius=BLUR_RADIUS):
+        """Blurred JPEG bytes of the image at ``url``, waiting for an in-flight prefetch if any."""
+        key = self._key(url, radius)
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        return self._submit(url, radius).result()
+
+    def prefetch(self, url, radius=BLUR_RADIUS):
+        """Start fetching and blurring ``url`` in the background."""
+        if url:
+            self._submit(url, radius)
+
+
+def build_thumbnail_bundle(urls, path=BUNDLE_PATH, levels=BLUR_LEVELS, size=THUMBNAIL_SIZE, workers=8):
+    """Download each of ``urls`` once and pack its blur levels into the bundle at ``path``.
+
+    Layout: ``BUNDLE_MAGIC``, the length of the JSON index (uint32, little
+    endian), the JSON index, then the JPEG data. The index maps each URL to
+    the ``[offset, length]`` of each level, offsets counted from the start of
+    the JPEG data. Returns the URLs that could not be fetched.
+    """
+    session = requests.Session()
+
+    def fetch(url):
+        try:
+            response = session.get(url, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            return url, render_levels(response.content, levels, size)
+        except (requests.RequestException, OSError) as e:
+            print(f"Skipping {url}: {e}")
+            return url, None
+
+    urls = list(dict.fromkeys(url for url in urls if isinstance(url, str)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        rendered = [(url, images) for url, images in executor.map(fetch, urls) if images is not None]
+
+    entries, position = {}, 0
+    for url, images in rendered:
+        entries[url] = []
+        for data in images:
+            entries[url].append([position, len(data)])
+            position += len(data)
+    index_bytes = json.dumps({'levels': list(levels), 'size': list(size), 'entries': entries}).encode("utf-8")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(BUNDLE_MAGIC)
+        f.write(struct.pack("<I", len(index_bytes)))
+        f.write(index_bytes)
+        for _, images in rendered:
+            for data in images:
+                f.write(data)
+    os.replace(tmp_path, path)
+    return [url for url in urls if url not in entries]
+
+
+class ThumbnailBundle:
+    """Memory-mapped reader of a bundle written by ``build_thumbnail_bundle``."""
+
+    def __init__(self, path=BUNDLE_PATH):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(BUNDLE_MAGIC)] != BUNDLE_MAGIC:
+            raise ValueError(f"{path} is not a thumbnail bundle")
+        start = len(BUNDLE_MAGIC)
+        (index_length,) = struct.unpack("<I", self._mmap[start:start + 4])
+        index = json.loads(self._mmap[start + 4:start + 4 + index_length])
+        self._data_start = start + 4 + index_length
+        self.levels = index['levels']
+        self._entries = index['entries']
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def get(self, url, level=0):
+        """JPEG bytes of ``url`` at blur ``level`` (clamped to the last level)."""
+        offset, length = self._entries[url][min(level, len(self.levels) - 1)]
+        offset += self._data_start
+        return self._mmap[offset:offset + length]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the packed bundle of blurred character thumbnails.")
+    parser.add_argument("--output", default=BUNDLE_PATH)
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    urls = load_table('characters', columns=['Image'])['Image']
+    failed = build_thumbnail_bundle(urls, args.output, workers=args.workers)
+    print(f"{urls.nunique() - len(failed)} images x {len(BLUR_LEVELS)} blur levels packed into {args.output} "
+          f"({os.path.getsize(args.output) / 1e6:.1f} MB), {len(failed)} failed")
@@ -0,0 +1,191 @@
+"""Client for the Jikan API (unofficial MyAnimeList API) used by the Welcome page.
+
+Every response is kept in memory and on disk (``CACHE_DIR``) so it survives
+restarts. A cached response older than ``ttl`` is still returned right away
+while a background thread fetches a fresh one (stale-while-revalidate); the
+network is only waited on when nothing is cached at all.
+
+Requests share one pooled session and stay under Jikan's rate limits
+(``RATE_LIMITS``); 429 and 5xx responses are retried with backoff.
+``JIKAN_BASE_URL`` points the client at another server, e.g. the local mock
+``python -m utils.mock_jikan``.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.timing import span
+
+BASE_URL = os.environ.get("JIKAN_BASE_URL", "https://api.jikan.moe/v4")
+CACHE_DIR = "data/jikan_cache"
+TTL = 3600
+# Jikan allows 3 requests per second and 60 per minute
+RATE_LIMITS = ((3, 1.0), (60, 60.0))
+PAGE_SIZE = 25
+REQUEST_TIMEOUT = 10
+
+
+class JikanError(Exception):
+    """Raised when Jikan cannot be reached and nothing is cached."""
+
+
+class RateLimiter:
+    """Blocks until a request fits in every ``(requests, seconds)`` window of ``limits``.
+
+    ``margin`` widens each window a little, since the server measures them at
+    arrival and not at departure.
+    """
+
+    def __init__(self, limits=RATE_LIMITS, margin=0.1):
+        self.limits = [(count, seconds + margin) for count, seconds in limits]
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                longest = max(seconds for _, seconds in self.limits)
+                while self._sent and now - self._sent[0] >= longest:
+                    self._sent.popleft()
+                wait = 0.0
+                for count, seconds in self.limits:
+                    recent = [t for t in self._sent if now - t < seconds]
+                    if len(recent) >= count:
+                        wait = max(wait, recent[-count] + seconds - now)
+                if wait <= 0:
+                    self._sent.append(now)
+                    return
+            time.sleep(wait)
+
+
+class JikanClient:
+    """Cached, rate-limited access to Jikan endpoints."""
+
+    def __init__(self, base_url=BASE_URL, cache_dir=CACHE_DIR, ttl=TTL, rate_limits=RATE_LIMITS,
+                 retries=3, backoff=1.0, session=None):
+        self.base_url = base_url.rstrip("/")
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.retries = retries
+        self.backoff = backoff
+        self.limiter = RateLimiter(rate_limits)
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="jikan")
+        self._memory = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, path, params):
+        return hashlib.sha256(f"{path}?{json.dumps(params or {}, sort_keys=True)}".encode("utf-8")).hexdigest()
+
+    def _cached(self, key):
+        """``(fetched_at, payload)`` from memory, then disk, or None."""
+        with self._lock:
+            if key in self._memory:
+                return self._memory[key]
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        cached = (entry['fetched_at'], entry['payload'])
+        with self._lock:
+            self._memory.setdefault(key, cached)
+        return cached
+
+    def _store(self, key, path, params, payload):
+        fetched_at = time.time()
+        with self._lock:
+            self._memory[key] = (fetched_at, payload)
+        file_path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({'path': path, 'params': params, 'fetched_at': fetched_at, 'payload': payload}, f)
+        os.replace(tmp_path, file_path)
+
+    def _fetch(self, path, params):
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            try:
+                with span("jikan.request", path=path):
+                    response = self.session.get(url, params=params, timeout=REQUEST_TIMEOUT)
+                if response.status_code == 200:
+                    return response.json()
+                if response.status_code != 429 and response.status_code < 500:
+                    raise JikanError(f"{url}: HTTP {response.status_code}")
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get("Retry-After")
+            except (requests.RequestException, ValueError) as e:
+                error, retry_after = e, None
+            if attempt < self.retries:
+                delay = float(retry_after) if retry_after and retry_after.isdigit() else self.backoff * 2 ** attempt
+                time.sleep(delay + random.uniform(0, self.backoff))
+        raise JikanError(f"{url}: {error}")
+
+    def _refresh(self, key, path, params):
+        try:
+            self._store(key, path, params, self._fetch(path, params))
+        except JikanError:
+            pass  # keep serving the stale response, the next call retries
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def get(self, path, params=None, ttl=None):
+        """JSON response of ``path``, from the cache when possible."""
+        ttl = self.ttl if ttl is None else ttl
+        key = self._key(path, params)
+        cached = self._cached(key)
+        if cached is None:
+            payload = self._fetch(path, params)
+            self._store(key, path, params, payload)
+            return payload
+
+        fetched_at, payload = cached
+        if time.time() - fetched_at > ttl:
+            with self._lock:
+                start_refresh = key not in self._refreshing
+                self._refreshing.add(key)
+            if start_refresh:
+                self.executor.submit(self._refresh, key, path, params)
+        return payload
+
+    def top_anime(self, limit=PAGE_SIZE, **params):
+        """The ``limit`` best-ranked anime, fetched page by page (``PAGE_SIZE`` per page).
+
+        Only a failure of the first page raises ``JikanError``: when a later
+        page cannot be fetched, the anime of the pages before it are returned.
+        """
+        anime, seen, page = [], set(), 1
+        while len(anime) < limit:
+            try:
+                response = self.get("top/anime", {**params, 'page': page, 'limit': PAGE_SIZE})
+            except JikanError:
+                if page == 1:
+                    raise
+                break
+            for item in response.get('data', []):
+                # The ranking can shift between two pages, don't show a title twice
+                if item['mal_id'] not in seen:
+                    seen.add(item['mal_id'])
+                    anime.append(item)
+            if not response.get('pagination', {}).get('has_next_page'):
+                break
+            page += 1
+        return anime[:limit]
@@ -0,0 +1,99 @@
+"""Local stand-in for the Hugging Face text-to-image endpoint.
+
+    python -m utils.mock_inference --port 8091 --latency 2 --error-rate 0.1
+    HF_API_URL=http://127.0.0.1:8091/generate streamlit run Welcome.py
+
+Answers each POST ``{"inputs": prompt}`` with a JPEG derived from the prompt
+and ``parameters.seed`` after ``--latency`` seconds, or with a JSON error like
+the real endpoint.
+``GET /stats`` returns the number of generations served, to check caching
+and deduplication.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image, ImageDraw
+
+
+def render(prompt, seed=None, size=(512, 512)):
+    """A JPEG whose colours depend on the prompt and seed."""
+    digest = hashlib.sha256(f"{prompt}|{seed}".encode("utf-8")).digest()
+    img = Image.new("RGB", size, tuple(digest[:3]))
+    draw = ImageDraw.Draw(img)
+    for i in range(8):
+        x, y = digest[3 + 2 * i] * size[0] // 256, digest[4 + 2 * i] * size[1] // 256
+        draw.ellipse([x - 40, y - 40, x + 40, y + 40], fill=tuple(digest[i:i + 3]))
+    draw.text((10, 10), prompt[:60], fill=(255, 255, 255))
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+def make_handler(latency=0.0, error_rate=0.0, stats=None):
+    stats = stats if stats is not None else {}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_body(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with lock:
+                body = json.dumps(stats).encode("utf-8")
+            self.send_body(200, body, "application/json")
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            with lock:
+                stats['requests'] = stats.get('requests', 0) + 1
+            time.sleep(latency)
+            if random.random() < error_rate:
+                error = {'error': "Model black-forest-labs/FLUX.1-schnell is currently loading", 'estimated_time': 1.0}
+                self.send_body(503, json.dumps(error).encode("utf-8"), "application/json")
+                return
+            if not payload.get('inputs'):
+                self.send_body(400, json.dumps({'error': "inputs is required"}).encode("utf-8"), "application/json")
+                return
+            with lock:
+                stats['generated'] = stats.get('generated', 0) + 1
+            self.send_body(200, render(payload['inputs'], payload.get('parameters', {}).get('seed')), "image/jpeg")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=8091, latency=0.0, error_rate=0.0):
+    """Start the stand-in in a background thread; ``server.stats`` counts the requests."""
+    stats = {}
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency, error_rate, stats))
+    server.stats = stats
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the text-to-image inference endpoint.")
+    parser.add_argument("--port", type=int, default=8091)
+    parser.add_argument("--latency", type=float, default=2.0, help="Generation time (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.latency, args.error_rate)
+    print(f"Stand-in inference server on http://127.0.0.1:{args.port}/generate")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,128 @@
+"""Local stand-in for the Jikan API, to run the Welcome page and the client offline.
+
+    python -m utils.mock_jikan --port 8090 --titles 100 --error-rate 0.1
+    JIKAN_BASE_URL=http://127.0.0.1:8090/v4 streamlit run Welcome.py
+
+Serves ``/v4/top/anime`` with Jikan's pagination, answers 429 above
+``--rate-limit`` requests per second like Jikan does, and can add latency and
+random 500 errors.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+STATUSES = ["Finished Airing", "Currently Airing"]
+GENRES = ["Action", "Adventure", "Comedy", "Drama", "Fantasy", "Romance", "Sci-Fi", "Slice of Life"]
+
+
+def make_anime(rank):
+    mal_id = 1000 + rank
+    genres = random.Random(rank).sample(GENRES, 3)
+    return {
+        'mal_id': mal_id,
+        'url': f"https://myanimelist.net/anime/{mal_id}",
+        'images': {'jpg': {'large_image_url': f"https://cdn.myanimelist.net/images/anime/{mal_id}l.jpg"}},
+        # Like on Jikan, some titles have no trailer
+        'trailer': {'embed_url': None if rank % 5 == 0 else f"https://www.youtube.com/embed/mock{mal_id}"},
+        'title': f"Mock Anime {rank}",
+        'episodes': 12 + rank % 13,
+        'status': STATUSES[rank % 2],
+        'aired': {'string': f"Apr {2000 + rank % 24} to Jun {2000 + rank % 24}"},
+        'rating': "PG-13 - Teens 13 or older",
+        'score': round(9.5 - rank * 0.01, 2),
+        'scored_by': 1_000_000 - rank * 1000,
+        'rank': rank,
+        'synopsis': f"Synopsis of mock anime number {rank}. " * 10,
+        'genres': [{'name': genre, 'url': f"https://myanimelist.net/anime/genre/{i}"} for i, genre in enumerate(genres)],
+    }
+
+
+def top_anime_page(catalogue, page, limit):
+    start = (page - 1) * limit
+    items = catalogue[start:start + limit]
+    last_page = max(1, -(-len(catalogue) // limit))
+    return {
+        'pagination': {
+            'last_visible_page': last_page,
+            'has_next_page': page < last_page,
+            'current_page': page,
+            'items': {'count': len(items), 'total': len(catalogue), 'per_page': limit},
+        },
+        'data': items,
+    }
+
+
+def make_handler(catalogue, error_rate=0.0, latency=0.0, rate_limit=3):
+    recent, lock = deque(), threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, payload, headers=()):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            with lock:
+                now = time.monotonic()
+                while recent and now - recent[0] >= 1.0:
+                    recent.popleft()
+                limited = rate_limit and len(recent) >= rate_limit
+                if not limited:
+                    recent.append(now)
+            if limited:
+                self.send_json(429, {'status': 429, 'type': 'RateLimitException'}, [("Retry-After", "1")])
+                return
+            time.sleep(latency)
+            if random.random() < error_rate:
+                self.send_json(500, {'status': 500, 'type': 'InternalException'})
+                return
+
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/v4/top/anime":
+                self.send_json(404, {'status': 404, 'type': 'BadResponseException'})
+                return
+            query = parse_qs(url.query)
+            page = int(query.get('page', ['1'])[0])
+            limit = min(int(query.get('limit', ['25'])[0]), 25)
+            self.send_json(200, top_anime_page(catalogue, page, limit))
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port=8090, titles=100, error_rate=0.0, latency=0.0, rate_limit=3):
+    """Start the mock in a background thread, returning the server (``.shutdown()`` to stop it)."""
+    catalogue = [make_anime(rank) for rank in range(1, titles + 1)]
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(catalogue, error_rate, latency, rate_limit))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local mock of the Jikan API.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--titles", type=int, default=100, help="Number of anime in the ranking")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--latency", type=float, default=0.0, help="Delay of each response (s)")
+    parser.add_argument("--rate-limit", type=int, default=3, help="Requests per second before answering 429 (0: none)")
+    args = parser.parse_args()
+
+    server = serve(args.port, args.titles, args.error_rate, args.latency, args.rate_limit)
+    print(f"Mock Jikan on http://127.0.0.1:{args.port}/v4 ({args.titles} top anime)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
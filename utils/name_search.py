@@ -0,0 +1,220 @@
+"""Name search for the anime pickers of the pages.
+
+The pickers used to send every title of the catalogue to the browser on each
+render. They now send a search box and the best ``PAGE_SIZE`` matches of what
+was typed, from a ``NameIndex`` built once per process:
+
+- every name of an item (those of the columns the page passes, e.g. the
+  English, Japanese or other name), normalized (NFKC, case-folded,
+  punctuation as spaces), and each of its word suffixes
+  (``"titan"`` for ``"attack on titan"``) sit in one sorted array: a prefix
+  is a range found by binary search
+- the trigrams of each name are an inverted index (CSR by trigram): the names
+  sharing trigrams with the query are counted with one ``np.bincount``,
+  which tolerates typos and missing spaces
+
+Matches are ranked by exact name, then names ending with the query from one
+of their words (``"title 9"`` for ``"English title 9"``), then prefix of a
+name, then prefix of one of its words, then names where every word of the
+query starts a word (``"titl 9"`` for ``"English title 9"``), then share of
+the query's trigrams found in the name, and ties by popularity; an empty
+query lists the most popular items. Results come by pages (``search(query,
+limit, offset)``). ``search_box`` is the Streamlit widget the pages use.
+"""
+import argparse
+import re
+import time
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+PAGE_SIZE = 20
+# Share of the query's trigrams a name needs to match when none of its words starts with the query
+MIN_SIMILARITY = 0.6
+# Placeholders of the datasets, never indexed as names
+MISSING_NAMES = {"", "unknown", "nan", "none"}
+SEPARATORS = re.compile(r"[\W_]+")
+
+EXACT, EXACT_SUFFIX, PREFIX, WORD_PREFIX, ALL_WORDS = 3.0, 2.5, 2.0, 1.5, 1.2
+
+
+def normalize(name):
+    """Name as indexed: NFKC, case-folded, words separated by single spaces."""
+    return SEPARATORS.sub(" ", unicodedata.normalize("NFKC", str(name)).casefold()).strip()
+
+
+def trigram_codes(names):
+    """Distinct trigrams of each name (padded as ``"  name "``) as 63-bit codes, and the name of each.
+
+    A trigram is three code points of 21 bits each, so the whole extraction
+    runs on one array of the concatenated names.
+    """
+    padded = [f"  {name} " for name in names]
+    lengths = np.array([len(name) for name in padded], dtype=np.int64)
+    chars = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    counts = lengths - 2
+    owners = np.repeat(np.arange(len(names), dtype=np.int64), counts)
+    positions = np.arange(counts.sum()) + np.repeat(np.cumsum(lengths) - lengths - (np.cumsum(counts) - counts), counts)
+    codes = (chars[positions] << np.uint64(42)) | (chars[positions + 1] << np.uint64(21)) | chars[positions + 2]
+    order = np.lexsort((codes, owners))
+    owners, codes = owners[order], codes[order]
+    distinct = np.concatenate([[True], (owners[1:] != owners[:-1]) | (codes[1:] != codes[:-1])])
+    return codes[distinct], owners[distinct]
+
+
+class NameIndex:
+    """Ranked prefix and trigram search over the names of a list of items."""
+
+    def __init__(self, keys, names, popularity=None):
+        """``keys`` identify the items (e.g. the name the page selects by), ``names[i]`` lists the names of item ``i``."""
+        self.keys = np.asarray(keys, dtype=object)
+        self.popularity = np.zeros(len(self.keys)) if popularity is None else np.asarray(popularity, dtype=np.float64)
+        self.key_index = {key: i for i, key in enumerate(self.keys.tolist())}
+
+        aliases, alias_items = [], []
+        for item, item_names in enumerate(names):
+            for name in dict.fromkeys(normalize(name) for name in item_names):
+                if name not in MISSING_NAMES:
+                    aliases.append(name)
+                    alias_items.append(item)
+        self.alias_items = np.asarray(alias_items, dtype=np.int64)
+
+        # Names and their word suffixes, sorted for prefix ranges
+        entries, entry_aliases, entry_kinds = [], [], []
+        for alias, name in enumerate(aliases):
+            starts = [0] + [m.end() for m in re.finditer(" ", name)]
+            for start in starts:
+                entries.append(name[start:])
+                entry_aliases.append(alias)
+                entry_kinds.append(PREFIX if start == 0 else WORD_PREFIX)
+        order = np.array(sorted(range(len(entries)), key=entries.__getitem__), dtype=np.int64)
+        self.entries = np.asarray(entries, dtype=object)[order]
+        self.entry_aliases = np.asarray(entry_aliases, dtype=np.int64)[order]
+        self.entry_kinds = np.asarray(entry_kinds)[order]
+        self.aliases = np.asarray(aliases, dtype=object)
+
+        # Inverted index trigram -> aliases
+        codes, owners = trigram_codes(aliases)
+        self.trigrams, ids = np.unique(codes, return_inverse=True)
+        self.trigram_indptr = np.concatenate([[0], np.cumsum(np.bincount(ids, minlength=len(self.trigrams)))])
+        self.trigram_postings = owners[np.argsort(ids, kind='stable')]
+
+    @classmethod
+    def from_frame(cls, df, key_column, name_columns, popularity_column=None):
+        """Index of the rows of ``df`` (first row of each key), named by ``name_columns``."""
+        df = df[df[key_column].notna()].drop_duplicates(key_column)
+        names = zip(*(df[col].astype(object).where(df[col].notna(), "").astype(str) for col in name_columns))
+        popularity = None if popularity_column is None else pd.to_numeric(df[popularity_column], errors='coerce').fillna(0)
+        return cls(df[key_column].astype(object).to_numpy(), list(names), popularity)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def scores(self, query):
+        """Match score of every item for ``query`` (0 for no match)."""
+        query = normalize(query)
+        scores = np.zeros(len(self.keys))
+        if not query:
+            return scores
+
+        # Prefixes of a name or of one of its words
+        aliases, kinds = self._prefixed(query)
+        # Entries equal to the query come first in the range: whole names are exact matches, word suffixes end with it
+        exact = np.searchsorted(self.entries, query, side='right') - np.searchsorted(self.entries, query, side='left')
+        kinds = kinds.copy()
+        kinds[:exact] = np.where(kinds[:exact] == PREFIX, EXACT, EXACT_SUFFIX)
+        np.maximum.at(scores, self.alias_items[aliases], kinds)
+
+        # Every word of the query starts a word of the name
+        words = query.split(" ")
+        if len(words) > 1:
+            common = self._prefixed(words[0])[0]
+            for word in words[1:]:
+                common = np.intersect1d(common, self._prefixed(word)[0])
+            np.maximum.at(scores, self.alias_items[common], ALL_WORDS)
+
+        # Trigram similarity, below the prefix matches
+        query_trigrams, _ = trigram_codes([query])
+        ids = np.minimum(np.searchsorted(self.trigrams, query_trigrams), len(self.trigrams) - 1)
+        ids = ids[self.trigrams[ids] == query_trigrams]
+        if len(ids):
+            starts, ends = self.trigram_indptr[ids], self.trigram_indptr[ids + 1]
+            postings = np.concatenate([self.trigram_postings[s:e] for s, e in zip(starts, ends)])
+            shared = np.bincount(postings, minlength=len(self.aliases))
+            candidates = np.flatnonzero(shared)
+            similarity = shared[candidates] / len(query_trigrams)
+            kept = similarity >= MIN_SIMILARITY
+            np.maximum.at(scores, self.alias_items[candidates[kept]], similarity[kept])
+        return scores
+
+    def _prefixed(self, prefix):
+        """Aliases with a name or word starting with ``prefix`` (the entries in [prefix, prefix + max char)), and how."""
+        lo = np.searchsorted(self.entries, prefix, side='left')
+        hi = np.searchsorted(self.entries, prefix + "\U0010ffff", side='left')
+        return self.entry_aliases[lo:hi], self.entry_kinds[lo:hi]
+
+    def search(self, query, limit=PAGE_SIZE, offset=0, allowed=None):
+        """Keys of the matches of ``query`` ranked best first, from ``offset``, and the number of matches.
+
+        ``allowed`` (a boolean mask over the items, or a collection of keys)
+        restricts the results.
+        """
+        scores = self.scores(query)
+        matched = scores > 0 if normalize(query) else np.ones(len(self.keys), dtype=bool)
+        if allowed is not None:
+            matched &= self.mask(allowed)
+        candidates = np.flatnonzero(matched)
+        order = np.lexsort((-self.popularity[candidates], -scores[candidates]))
+        return self.keys[candidates[order[offset:offset + limit]]].tolist(), len(candidates)
+
+    def mask(self, keys):
+        """Boolean mask of the items of ``keys`` (returned as is if already a mask)."""
+        if isinstance(keys, np.ndarray) and keys.dtype == bool:
+            return keys
+        mask = np.zeros(len(self.keys), dtype=bool)
+        mask[[self.key_index[key] for key in keys if key in self.key_index]] = True
+        return mask
+
+
+def search_box(index, key, label="Search an anime:", allowed=None, placeholder="Type a few letters of the title"):
+    """Search input with paging; returns the keys of the shown matches.
+
+    Shows ``PAGE_SIZE`` more matches each time "More results" is clicked;
+    the page count resets when the query changes.
+    """
+    import streamlit as st
+
+    query = st.text_input(label, key=f"{key}_query", placeholder=placeholder)
+    pages_key = f"{key}_pages"
+    if st.session_state.get(f"{key}_last_query") != query:
+        st.session_state[f"{key}_last_query"] = query
+        st.session_state[pages_key] = 1
+    shown, total = index.search(query, PAGE_SIZE * st.session_state.get(pages_key, 1), allowed=allowed)
+    if total > len(shown):
+        def more():
+            st.session_state[pages_key] = st.session_state.get(pages_key, 1) + 1
+
+        st.caption(f"{len(shown)} of {total:,} matches")
+        st.button("More results", key=f"{key}_more", on_click=more)
+    elif not total:
+        st.caption("No match, try another spelling.")
+    return shown
+
+
+if __name__ == "__main__":
+    from utils.storage import load_table
+
+    parser = argparse.ArgumentParser(description="Build the anime name index and time a few searches.")
+    parser.add_argument("queries", nargs="*", default=["attack on titan", "titan", "naruto", "shingeki", "fullmetal alchemist"])
+    args = parser.parse_args()
+
+    anime_df = load_table('anime', columns=['Name', 'English name', 'Other name', 'Members'])
+    start = time.perf_counter()
+    index = NameIndex.from_frame(anime_df, 'Name', ['Name', 'English name', 'Other name'], 'Members')
+    print(f"{len(index):,} anime, {len(index.aliases):,} names indexed in {time.perf_counter() - start:.2f} s")
+    for query in args.queries:
+        start = time.perf_counter()
+        keys, total = index.search(query, limit=5)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{query!r}: {total:,} matches in {elapsed:.1f} ms -> {keys}")
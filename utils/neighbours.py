@@ -0,0 +1,231 @@
+"""Precomputed neighbour table for the recommendation page.
+
+The catalogue only changes when the dataset is refreshed, so the neighbours
+of every anime are computed once, in blocks of queries answered by a single
+matrix product each, and written next to the feature artifact:
+
+- ``neighbour_ids.npy``: ``(n, N)`` neighbour ids, closest first, in the row order of ``anime_ids.npy``
+- ``neighbour_distances.npy``: the matching distances (float32)
+- ``neighbours.json``: parameters the table was built with, and the
+  ``fingerprint`` of the feature artifact it was computed from
+
+Build it with ``python -m utils.neighbours`` after ``python -m utils.features``
+(use ``--min-score -1`` there to cover the full catalogue). After an
+incremental ``python -m utils.features --update``, ``update_neighbour_table``
+refreshes it from the delta only: the new and changed anime get a full search,
+and every other anime only compares its stored neighbours with them. A full
+rebuild of the features leaves the table stale: ``NeighbourTable.matches``
+is then false and the page searches with ``SimilarityEngine`` until the table
+is rebuilt.
+"""
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from utils.features import ARTIFACT_DIR, load_features, save_array
+from utils.similarity import SimilarityEngine
+
+GENRE_WEIGHT_FACTOR = 7.0
+N_NEIGHBOURS = 10
+BLOCK_SIZE = 512
+# Profiles per matrix product in recommend_profiles
+PROFILE_BLOCK_SIZE = 128
+
+
+def block_weights(feature_store, rows, genre_weight_factor):
+    """Genre weight vector of each row, as the page builds it for the selected anime."""
+    genres = feature_store.display['Genres'].to_numpy()
+    return np.vstack([feature_store.genre_weights(genres[row].split(", "), genre_weight_factor) for row in rows])
+
+
+def build_neighbour_table(feature_store, n_neighbours=N_NEIGHBOURS, block_size=BLOCK_SIZE, workers=None,
+                          genre_weight_factor=GENRE_WEIGHT_FACTOR, metric="euclidean"):
+    """Top ``n_neighbours`` of every anime, computed block by block on ``workers`` threads.
+
+    NumPy releases the GIL in the matrix products, so threads share the
+    matrix without copying it to worker processes.
+    """
+    engine = SimilarityEngine(feature_store.matrix, feature_store.anime_ids)
+    n_rows = len(feature_store.anime_ids)
+    n_neighbours = min(n_neighbours, n_rows - 1)
+    neighbour_ids = np.empty((n_rows, n_neighbours), dtype=np.int64)
+    neighbour_distances = np.empty((n_rows, n_neighbours), dtype=np.float32)
+
+    def run_block(start):
+        rows = np.arange(start, min(start + block_size, n_rows))
+        weights = block_weights(feature_store, rows, genre_weight_factor)
+        ids, distances = engine.batch_top_k(rows, n_neighbours, weights, metric)
+        neighbour_ids[rows] = ids
+        neighbour_distances[rows] = distances
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        list(executor.map(run_block, range(0, n_rows, block_size)))
+    return neighbour_ids, neighbour_distances
+
+
+def recommend_profiles(feature_store, profiles, k=N_NEIGHBOURS, block_size=PROFILE_BLOCK_SIZE, workers=None,
+                       genre_weight_factor=GENRE_WEIGHT_FACTOR, metric="euclidean", aggregate="mean"):
+    """Top ``k`` recommendations of each taste profile (a list of anime ids), offline.
+
+    Each block of ``block_size`` profiles is one ``batch_profile_top_k``
+    call, with the genre boost of the union of each profile's genres.
+    Returns two ``(len(profiles), k)`` arrays: ids and aggregated distances.
+    """
+    engine = SimilarityEngine(feature_store.matrix, feature_store.anime_ids)
+    k = min(k, len(feature_store.anime_ids) - max(len(profile) for profile in profiles))
+    profile_ids = np.empty((len(profiles), k), dtype=np.int64)
+    profile_distances = np.empty((len(profiles), k), dtype=np.float32)
+
+    def run_block(start):
+        block = profiles[start:start + block_size]
+        weights = np.vstack([
+            feature_store.genre_weights(feature_store.profile_genres(profile), genre_weight_factor) for profile in block
+        ])
+        ids, distances = engine.batch_profile_top_k(block, k, weights, metric, aggregate)
+        profile_ids[start:start + len(block)] = ids
+        profile_distances[start:start + len(block)] = distances
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        list(executor.map(run_block, range(0, len(profiles), block_size)))
+    return profile_ids, profile_distances
+
+
+def update_neighbour_table(feature_store, table, delta_rows, block_size=BLOCK_SIZE, workers=None):
+    """Neighbour table of the updated ``feature_store``, from the ``table`` built before the update.
+
+    ``delta_rows`` are the rows ``update_features`` encoded. They, and the
+    anime whose stored neighbours include a changed one, are searched against
+    the whole catalogue; the other rows merge their stored neighbours with
+    the delta rows. Costs ``O(len(delta_rows) x n)`` instead of ``O(n x n)``.
+    """
+    genre_weight_factor = table.metadata['genre_weight_factor']
+    metric = table.metadata['metric']
+    n_rows = len(feature_store.anime_ids)
+    n_old, n_neighbours = table.neighbour_ids.shape
+    delta_rows = np.asarray(delta_rows, dtype=np.int64)
+    delta_ids = feature_store.anime_ids[delta_rows]
+
+    # Stored distances to a changed anime are out of date
+    stale = np.flatnonzero(np.isin(table.neighbour_ids, delta_ids[delta_rows < n_old]).any(axis=1))
+    searched = np.union1d(delta_rows, stale)
+    merged = np.setdiff1d(np.arange(n_old), searched)
+
+    engine = SimilarityEngine(feature_store.matrix, feature_store.anime_ids)
+    delta_engine = SimilarityEngine(feature_store.matrix[delta_rows], delta_ids)
+    neighbour_ids = np.empty((n_rows, n_neighbours), dtype=np.int64)
+    neighbour_distances = np.empty((n_rows, n_neighbours), dtype=np.float32)
+
+    def search_block(start):
+        rows = searched[start:start + block_size]
+        weights = block_weights(feature_store, rows, genre_weight_factor)
+        ids, distances = engine.batch_top_k(rows, n_neighbours, weights, metric)
+        neighbour_ids[rows] = ids
+        neighbour_distances[rows] = distances
+
+    def merge_block(start):
+        rows = merged[start:start + block_size]
+        weights = block_weights(feature_store, rows, genre_weight_factor)
+        candidates = np.hstack([np.asarray(table.neighbour_ids[rows]), np.broadcast_to(delta_ids, (len(rows), len(delta_ids)))])
+        distances = np.hstack([np.asarray(table.neighbour_distances[rows], dtype=np.float64),
+                               delta_engine.batch_distances(feature_store.matrix[rows], weights, metric)])
+        best = np.argsort(distances, axis=1, kind='stable')[:, :n_neighbours]
+        neighbour_ids[rows] = np.take_along_axis(candidates, best, axis=1)
+        neighbour_distances[rows] = np.take_along_axis(distances, best, axis=1)
+
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        list(executor.map(search_block, range(0, len(searched), block_size)))
+        list(executor.map(merge_block, range(0, len(merged), block_size)))
+    return neighbour_ids, neighbour_distances
+
+
+def refresh_neighbour_table(report, features_dir=ARTIFACT_DIR, block_size=BLOCK_SIZE, workers=None):
+    """Bring the neighbour table of ``features_dir`` (if any) up to date with an ``update_features`` report."""
+    if not os.path.exists(os.path.join(features_dir, "neighbours.json")) or not len(report['delta_rows']):
+        return
+    feature_store = load_features(features_dir)
+    table = load_neighbour_table(features_dir)
+    params = {'genre_weight_factor': table.metadata['genre_weight_factor'], 'metric': table.metadata['metric']}
+    start = time.perf_counter()
+    if report['restandardized']:
+        neighbour_ids, neighbour_distances = build_neighbour_table(
+            feature_store, table.metadata['n_neighbours'], block_size, workers, **params
+        )
+    else:
+        neighbour_ids, neighbour_distances = update_neighbour_table(
+            feature_store, table, report['delta_rows'], block_size, workers
+        )
+    save_neighbour_table(neighbour_ids, neighbour_distances, feature_store.fingerprint, features_dir, **params)
+    print(f"Neighbour table {'rebuilt' if report['restandardized'] else 'updated'} "
+          f"in {time.perf_counter() - start:.2f} s")
+
+
+def save_neighbour_table(neighbour_ids, neighbour_distances, fingerprint, output_dir=ARTIFACT_DIR, **params):
+    """Write the table computed from the feature artifact of ``fingerprint`` (``FeatureStore.fingerprint``)."""
+    save_array(os.path.join(output_dir, "neighbour_ids.npy"), neighbour_ids)
+    save_array(os.path.join(output_dir, "neighbour_distances.npy"), neighbour_distances)
+    with open(os.path.join(output_dir, "neighbours.json"), "w", encoding="utf-8") as f:
+        json.dump({'rows': int(neighbour_ids.shape[0]), 'n_neighbours': int(neighbour_ids.shape[1]),
+                   'features': fingerprint, **params}, f, indent=1)
+
+
+class NeighbourTable:
+    """Lookup over a table written by ``save_neighbour_table``."""
+
+    def __init__(self, anime_ids, neighbour_ids, neighbour_distances, metadata):
+        self.neighbour_ids = neighbour_ids
+        self.neighbour_distances = neighbour_distances
+        self.metadata = metadata
+        self.row_index = {int(anime_id): i for i, anime_id in enumerate(anime_ids)}
+
+    def matches(self, feature_store, genre_weight_factor, metric="euclidean"):
+        """Whether the table holds the neighbours of ``feature_store`` for these parameters."""
+        return (self.metadata.get('features') is not None
+                and self.metadata['features'] == feature_store.fingerprint
+                and self.metadata['rows'] == len(feature_store.anime_ids) == len(self.neighbour_ids)
+                and self.metadata['genre_weight_factor'] == genre_weight_factor
+                and self.metadata['metric'] == metric)
+
+    def lookup(self, anime_id, k=3):
+        """The ``k`` precomputed neighbours of ``anime_id``, closest first."""
+        row = self.row_index[int(anime_id)]
+        return self.neighbour_ids[row, :k], self.neighbour_distances[row, :k]
+
+
+def load_neighbour_table(output_dir=ARTIFACT_DIR):
+    """Load the neighbour table, memory-mapping the arrays."""
+    with open(os.path.join(output_dir, "neighbours.json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+    return NeighbourTable(
+        np.load(os.path.join(output_dir, "anime_ids.npy")),
+        np.load(os.path.join(output_dir, "neighbour_ids.npy"), mmap_mode='r'),
+        np.load(os.path.join(output_dir, "neighbour_distances.npy"), mmap_mode='r'),
+        metadata,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the neighbours of every anime.")
+    parser.add_argument("--features-dir", default=ARTIFACT_DIR)
+    parser.add_argument("-n", "--n-neighbours", type=int, default=N_NEIGHBOURS)
+    parser.add_argument("--block-size", type=int, default=BLOCK_SIZE)
+    parser.add_argument("--workers", type=int, default=None, help="Threads (default: all cores)")
+    parser.add_argument("--genre-weight-factor", type=float, default=GENRE_WEIGHT_FACTOR)
+    parser.add_argument("--metric", default="euclidean", choices=["euclidean", "cosine"])
+    args = parser.parse_args()
+
+    feature_store = load_features(args.features_dir)
+    start = time.perf_counter()
+    neighbour_ids, neighbour_distances = build_neighbour_table(
+        feature_store, args.n_neighbours, args.block_size, args.workers, args.genre_weight_factor, args.metric
+    )
+    elapsed = time.perf_counter() - start
+    save_neighbour_table(neighbour_ids, neighbour_distances, feature_store.fingerprint, args.features_dir,
+                         genre_weight_factor=args.genre_weight_factor, metric=args.metric)
+
+    n_rows = len(feature_store.anime_ids)
+    print(f"{n_rows} anime x {neighbour_ids.shape[1]} neighbours in {elapsed:.2f} s "
+          f"({n_rows / elapsed:,.0f} anime/s, {n_rows * n_rows / elapsed:,.0f} pairs/s)")
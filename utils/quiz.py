@@ -0,0 +1,183 @@
+"""Question and answer sampling of the quiz page.
+
+The characters of each anime (``Manga Associé``) are grouped once per
+process into one array of row numbers, sorted by anime (``CharacterPools``):
+the characters of an anime are a slice of it, "All" is every row. A quiz
+draws its questions from that slice at once, without replacement, and each
+question draws its wrong answers the same way. ``Generator.choice`` without
+replacement only touches the rows it returns when they are few next to the
+pool, so a question costs the same with 300 or 300,000 characters, and a
+session only keeps the row numbers of its questions and the names of the
+current options.
+
+In hard mode the wrong answers are the characters whose ``Traits`` and
+``Tags`` are closest to the answer's (Jaccard similarity of their sets).
+``TraitIndex`` keeps one packed bitset per trait or tag (uint64 words, bit
+``i`` for character ``i``) and the number of traits and tags of each
+character. The items every character shares with the answer are counted by
+adding the unpacked bitsets of the answer's few items, one pass over the
+table each; since a character sharing ``s`` of the answer's ``a`` items is
+at most ``s / a`` similar, only those sharing enough of them to reach the
+best ones are scored.
+"""
+import numpy as np
+import pandas as pd
+
+ALL = "All"
+N_QUESTIONS = 5
+N_OPTIONS = 4
+# Extra wrong answers drawn in case some share the name of the answer or of each other
+SPARE_OPTIONS = 3
+
+
+class CharacterPools:
+    """Row numbers of the characters of each anime."""
+
+    def __init__(self, titles):
+        codes, uniques = pd.factorize(pd.Series(titles, dtype=object))
+        order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        self.rows = order[np.count_nonzero(codes < 0):].astype(np.int64)
+        self.indptr = np.concatenate([[0], np.cumsum(counts)])
+        self.title_index = {title: i for i, title in enumerate(uniques)}
+        self.all_rows = np.arange(len(codes), dtype=np.int64)
+
+    def pool(self, title):
+        """Sorted row numbers of the characters of ``title`` (every row for ``ALL``), a view."""
+        if title == ALL:
+            return self.all_rows
+        i = self.title_index.get(title)
+        if i is None:
+            return self.all_rows[:0]
+        return self.rows[self.indptr[i]:self.indptr[i + 1]]
+
+
+def draw_questions(pool, n=N_QUESTIONS, rng=None):
+    """Row numbers of ``n`` different characters of ``pool`` (fewer if the pool is smaller)."""
+    rng = rng or np.random.default_rng()
+    return pool[rng.choice(len(pool), min(n, len(pool)), replace=False)]
+
+
+def draw_options(pool, answer_row, names, n=N_OPTIONS, rng=None):
+    """The name of ``answer_row`` and ``n - 1`` other names of ``pool``, shuffled.
+
+    Wrong answers are other characters of the pool with a different name,
+    drawn without replacement around the answer's position; ``names`` is
+    the name of every row (e.g. the ``Nom`` column as an array).
+    """
+    rng = rng or np.random.default_rng()
+    position = np.searchsorted(pool, answer_row)
+    drawn = rng.choice(len(pool) - 1, min(n - 1 + SPARE_OPTIONS, len(pool) - 1), replace=False)
+    drawn[drawn >= position] += 1
+    return shuffled_options(answer_row, pool[drawn], names, n, rng)
+
+
+def draw_hard_options(traits, pool, answer_row, names, n=N_OPTIONS, rng=None):
+    """Like ``draw_options``, with the characters of ``pool`` most similar to the answer as wrong answers."""
+    rng = rng or np.random.default_rng()
+    similar = traits.most_similar(answer_row, n - 1 + SPARE_OPTIONS, pool, rng)
+    return shuffled_options(answer_row, similar, names, n, rng)
+
+
+def shuffled_options(answer_row, candidates, names, n, rng):
+    """The answer's name and the first names of ``candidates`` different from it and each other, shuffled."""
+    options = [names[answer_row]]
+    for row in candidates:
+        if len(options) == n:
+            break
+        if names[row] not in options:
+            options.append(names[row])
+    rng.shuffle(options)
+    return options
+
+
+class TraitIndex:
+    """Traits and tags of every character as packed bitsets, for Jaccard similarity."""
+
+    def __init__(self, columns, sep=", "):
+        """``columns`` maps a name (``'Traits'``) to the ``sep``-separated items of every character."""
+        self.n_rows = len(next(iter(columns.values())))
+        rows, keys = [], []
+        for name, values in columns.items():
+            items = pd.Series(values, dtype=object).reset_index(drop=True).fillna("").astype(str).str.split(sep).explode()
+            items = items.str.strip()
+            items = items[items != ""]
+            rows.append(items.index.to_numpy(dtype=np.int64))
+            keys.append((name + ": " + items).to_numpy(dtype=object))
+        codes, self.vocabulary = pd.factorize(np.concatenate(keys))
+        # Each (item, character) once, even if listed twice
+        pairs = np.unique(codes.astype(np.int64) * self.n_rows + np.concatenate(rows))
+        items, rows = np.divmod(pairs, self.n_rows)
+
+        self.bits = np.zeros((len(self.vocabulary), (self.n_rows + 63) // 64), dtype=np.uint64)
+        np.bitwise_or.at(self.bits, (items, rows >> 6), np.left_shift(np.uint64(1), (rows & 63).astype(np.uint64)))
+        self.sizes = np.bincount(rows, minlength=self.n_rows).astype(np.float32)
+
+    @property
+    def nbytes(self):
+        return self.bits.nbytes + self.sizes.nbytes
+
+    def items(self, row):
+        """Codes of the traits and tags of ``row``."""
+        return np.flatnonzero((self.bits[:, row >> 6] >> np.uint64(row & 63)) & np.uint64(1))
+
+    def shared(self, items):
+        """Number of the traits and tags ``items`` that every character has."""
+        shared = np.zeros(self.n_rows, dtype=np.uint8 if len(items) < 256 else np.uint16)
+        for item in items:
+            shared += np.unpackbits(self.bits[item].view(np.uint8), count=self.n_rows, bitorder='little')
+        return shared
+
+    def similarities(self, row):
+        """Jaccard similarity of the traits and tags of every character to those of ``row``."""
+        items = self.items(row)
+        return jaccard(self.shared(items), self.sizes, len(items))
+
+    def most_similar(self, row, k, pool=None, rng=None):
+        """The ``k`` characters (of ``pool``, sorted row numbers, if given) most similar to ``row``, best first.
+
+        The similarity of a character is at most the share of the answer's
+        items it has, so the characters sharing the most items give a lower
+        bound of the ``k``-th best similarity and only those that can reach
+        it are scored. Characters tied with the last one kept are drawn at
+        random, so the same answer does not always get the same options.
+        """
+        rng = rng or np.random.default_rng()
+        items = self.items(row)
+        shared, sizes, candidates = self.shared(items), self.sizes, None
+        answer = row
+        if pool is not None:
+            candidates = np.asarray(pool)
+            shared, sizes = shared[candidates], sizes[candidates]
+            answer = np.searchsorted(candidates, row)
+            if answer == len(candidates) or candidates[answer] != row:
+                answer = -1
+        if answer >= 0:
+            shared[answer] = 0
+        k = min(k, len(shared) - (answer >= 0))
+        if k <= 0:
+            return np.empty(0, dtype=np.int64)
+
+        # Fewest shared items among the k characters sharing the most, then the bound it gives
+        at_least = np.cumsum(np.bincount(shared, minlength=len(items) + 1)[::-1])[::-1]
+        first = np.flatnonzero(shared >= np.flatnonzero(at_least >= k)[-1])
+        first = first[first != answer]
+        lowest = np.partition(jaccard(shared[first], sizes[first], len(items)), len(first) - k)[len(first) - k]
+        # Sharing s items allows s / len(items) at most; floor keeps ties whatever the rounding of the float32 bound
+        kept = np.flatnonzero(shared >= np.floor(np.float64(lowest) * len(items)))
+        kept = kept[kept != answer]
+
+        scores = jaccard(shared[kept], sizes[kept], len(items))
+        last = np.partition(scores, len(scores) - k)[len(scores) - k]
+        better = np.flatnonzero(scores > last)
+        tied = np.flatnonzero(scores == last)
+        best = kept[np.concatenate([better, rng.choice(tied, k - len(better), replace=False)])]
+        best = best[np.argsort(-jaccard(shared[best], sizes[best], len(items)), kind='stable')]
+        return best if candidates is None else candidates[best]
+
+
+def jaccard(shared, sizes, n_items):
+    """Jaccard similarity of sets of ``sizes`` items sharing ``shared`` of the ``n_items`` of another set."""
+    shared = shared.astype(np.float32)
+    union = sizes + np.float32(n_items) - shared
+    return np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
@@ -0,0 +1,198 @@
+"""Exact top-k neighbour search over the recommendation feature matrix.
+
+Query-time column weights (the genre boost) are applied to the distances
+rather than to the matrix, so the shared matrix is never modified. With
+weights ``w`` and query ``q``, both metrics only need ``X @ (w² * q)`` and
+``X² @ w²``:
+
+- euclidean: ``|w * (x - q)|² = X² @ w² - 2 X @ (w² * q) + q² @ w²``
+- cosine: ``(X @ (w² * q)) / (|w * x| |w * q|)``
+
+The matrix is used as given (the memory-mapped float32 artifact, shared by
+every session): both products are computed ``ROW_BLOCK`` rows at a time in
+float64, so only one block is ever copied.
+
+A taste profile (several favourites) is answered with the same product: the
+distances of all its anime are computed at once and aggregated per catalogue
+row, by mean distance (``"mean"``) or by the distance to the closest
+favourite (``"max"`` similarity). ``batch_profile_top_k`` does it for many
+profiles per call.
+
+Spark's ``BucketedRandomProjectionLSH``, which the page used to run, is kept
+as an optional backend to compare results with (``spark_top_k``); it loads
+the whole matrix in the driver, so it does not scale further than the
+engine.
+"""
+import numpy as np
+
+from utils.timing import span
+
+METRICS = ("euclidean", "cosine")
+AGGREGATES = ("mean", "max")
+# Rows of the matrix converted to float64 at a time
+ROW_BLOCK = 1024
+
+
+class SimilarityEngine:
+    """Top-k search over a fixed feature matrix."""
+
+    def __init__(self, matrix, anime_ids):
+        self.matrix = np.asarray(matrix)
+        self.anime_ids = np.asarray(anime_ids)
+        self.row_index = {int(anime_id): i for i, anime_id in enumerate(self.anime_ids)}
+
+    def distances(self, query, weights=None, metric="euclidean"):
+        """Distance from ``query`` to every row (cosine distance is ``1 - similarity``)."""
+        query = np.asarray(query, dtype=np.float64)[None, :]
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[None, :]
+        return self.batch_distances(query, weights, metric)[0]
+
+    def top_k(self, anime_id, k=3, weights=None, metric="euclidean"):
+        """The ``k`` nearest anime to ``anime_id``, excluding itself.
+
+        Returns the neighbour ids and their distances, closest first.
+        """
+        if weights is not None:
+            weights = np.asarray(weights, dtype=np.float64)[None, :]
+        ids, distances = self.batch_top_k([self.row_index[int(anime_id)]], k, weights, metric)
+        return ids[0], distances[0]
+
+    def batch_distances(self, queries, weights=None, metric="euclidean", groups=None):
+        """Distances from each row of ``queries`` to every row, as one matrix product.
+
+        ``weights`` holds one weight vector per query, or one per group of
+        consecutive queries of sizes ``groups`` (a single vector is shared by
+        every query), or is ``None``.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+        queries = np.asarray(queries, dtype=np.float64)
+        if weights is None:
+            w2, groups = np.ones((1, queries.shape[1])), [len(queries)]
+        else:
+            w2 = np.asarray(weights, dtype=np.float64) ** 2
+            if groups is None and len(w2) == 1:
+                groups = [len(queries)]
+
+        # Catalogue norms once per weight vector, not once per query
+        row_norms = np.empty((len(w2), len(self.matrix)))
+        dot = np.empty((len(queries), len(self.matrix)))
+        weighted = np.repeat(w2, groups, axis=0) * queries if groups is not None else w2 * queries
+        for start in range(0, len(self.matrix), ROW_BLOCK):
+            block = np.asarray(self.matrix[start:start + ROW_BLOCK], dtype=np.float64)
+            row_norms[:, start:start + len(block)] = w2 @ (block * block).T
+            dot[:, start:start + len(block)] = weighted @ block.T
+        if groups is not None:
+            w2 = np.repeat(w2, groups, axis=0)
+            row_norms = np.repeat(row_norms, groups, axis=0)
+        query_norms = np.sum(queries ** 2 * w2, axis=1)[:, None]
+        if metric == "euclidean":
+            # In place: these are (queries x catalogue) arrays
+            row_norms -= dot
+            row_norms -= dot
+            row_norms += query_norms
+            np.maximum(row_norms, 0.0, out=row_norms)
+            return np.sqrt(row_norms, out=row_norms)
+        denominator = np.sqrt(row_norms * query_norms)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            similarity = np.where(denominator > 0, dot / denominator, 0.0)
+        return 1.0 - similarity
+
+    def batch_top_k(self, rows, k=3, weights=None, metric="euclidean"):
+        """``top_k`` for several rows of the matrix at once.
+
+        Returns two ``(len(rows), k)`` arrays: neighbour ids and distances.
+        """
+        rows = np.asarray(rows)
+        distances = self.batch_distances(self.matrix[rows], weights, metric)
+        distances[np.arange(len(rows)), rows] = np.inf
+        return self._smallest(distances, min(k, distances.shape[1] - 1))
+
+    def profile_top_k(self, anime_ids, k=3, weights=None, metric="euclidean", aggregate="mean"):
+        """The ``k`` anime closest to the taste profile ``anime_ids``, excluding them.
+
+        ``weights`` is one weight vector for the whole profile (e.g. the
+        genre boost of the union of its genres). Returns the ids and the
+        aggregated distances, closest first.
+        """
+        ids, distances = self.batch_profile_top_k(
+            [anime_ids], k, None if weights is None else np.asarray(weights)[None, :], metric, aggregate)
+        return ids[0], distances[0]
+
+    def batch_profile_top_k(self, profiles, k=3, weights=None, metric="euclidean", aggregate="mean"):
+        """``profile_top_k`` for several profiles, with one matrix product for all their anime.
+
+        ``profiles`` is a list of lists of anime ids, ``weights`` one weight
+        vector per profile (or ``None``). Returns two ``(len(profiles), k)``
+        arrays: ids and aggregated distances.
+        """
+        aggregated = self.batch_profile_distances(profiles, weights, metric, aggregate)
+        longest = max(len(profile) for profile in profiles)
+        return self._smallest(aggregated, min(k, aggregated.shape[1] - longest))
+
+    def batch_profile_distances(self, profiles, weights=None, metric="euclidean", aggregate="mean"):
+        """Aggregated distance of every anime to each profile, ``inf`` for the profile's own anime.
+
+        Returns a ``(len(profiles), n)`` array, for callers that rank on more
+        than the distance (e.g. blended with the synopsis similarity).
+        """
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{aggregate}', expected one of {AGGREGATES}")
+        if not profiles or any(len(profile) == 0 for profile in profiles):
+            raise ValueError("Every profile needs at least one anime")
+        rows = np.array([self.row_index[int(anime_id)] for profile in profiles for anime_id in profile])
+        lengths = np.array([len(profile) for profile in profiles])
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+
+        distances = self.batch_distances(self.matrix[rows], weights, metric, groups=lengths)
+        if aggregate == "mean":
+            aggregated = np.add.reduceat(distances, starts, axis=0)
+            aggregated /= lengths[:, None]
+        else:
+            # Highest similarity = smallest distance to any favourite
+            aggregated = np.minimum.reduceat(distances, starts, axis=0)
+        aggregated[np.repeat(np.arange(len(profiles)), lengths), rows] = np.inf
+        return aggregated
+
+    def _smallest(self, distances, k):
+        """Ids and distances of the ``k`` smallest distances of each row, closest first."""
+        if k <= 0:
+            return self.anime_ids[:0].reshape(len(distances), 0), distances[:, :0]
+        candidates = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        candidate_distances = np.take_along_axis(distances, candidates, axis=1)
+        order = np.argsort(candidate_distances, axis=1, kind='stable')
+        neighbours = np.take_along_axis(candidates, order, axis=1)
+        return self.anime_ids[neighbours], np.take_along_axis(candidate_distances, order, axis=1)
+
+
+def spark_top_k(matrix, anime_ids, anime_id, k=3, weights=None, spark=None):
+    """Approximate top-k with Spark's BucketedRandomProjectionLSH (euclidean only).
+
+    This is what the recommendation page used to run on every request, kept
+    to compare results with. The whole matrix is converted in the driver and
+    sent to Spark as a Python list, so it needs more memory than
+    ``SimilarityEngine`` and is only meant for catalogues of the page's size.
+    """
+    from pyspark.sql import SparkSession
+    from pyspark.ml.linalg import Vectors
+    from pyspark.ml.feature import BucketedRandomProjectionLSH
+    from pyspark.sql import functions as F
+
+    if spark is None:
+        spark = SparkSession.builder.appName("AnimeRecommendation").getOrCreate()
+    features = np.asarray(matrix, dtype=np.float64)
+    if weights is not None:
+        features = features * weights
+
+    anime_spark_df = spark.createDataFrame(
+        [(int(i), Vectors.dense(row)) for i, row in zip(anime_ids, features)],
+        ['anime_id', 'features']
+    )
+    lsh = BucketedRandomProjectionLSH(inputCol="features", outputCol="hashes", bucketLength=2.0, numHashTables=3)
+    with span("lsh.fit"):
+        lsh_model = lsh.fit(anime_spark_df)
+    query = anime_spark_df.filter(F.col("anime_id") == int(anime_id)).select("features").first()['features']
+    with span("lsh.approxNearestNeighbors"):
+        nearest_neighbors = lsh_model.approxNearestNeighbors(anime_spark_df, query, numNearestNeighbors=k + 1)
+        return [row['anime_id'] for row in nearest_neighbors.collect() if row['anime_id'] != int(anime_id)][:k]
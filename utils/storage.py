@@ -0,0 +1,137 @@
+"""Columnar storage for the Kaggle CSVs.
+
+``python -m utils.storage`` converts each dataset to Parquet next to its CSV,
+with compact dtypes: categoricals for low-cardinality text columns,
+downcast integers and numeric scores where 'UNKNOWN' becomes NaN.
+
+``load_table`` reads the Parquet file when it exists (only the requested
+columns) and falls back to the CSV with the same dtypes otherwise;
+``iter_chunks`` does the same in bounded-size chunks.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+DATASETS = {
+    'anime': {
+        'csv': 'data/anime/anime-dataset-2023.csv',
+        'categorical': ['Type', 'Source', 'Status', 'Rating'],
+        'numeric': ['Score', 'Episodes', 'Rank', 'Scored By'],
+    },
+    'user_details': {
+        'csv': 'data/user/users-details-2023.csv',
+        'categorical': ['Gender'],
+        'numeric': ['Days Watched', 'Mean Score', 'Watching', 'Completed', 'On Hold', 'Dropped',
+                    'Plan to Watch', 'Total Entries', 'Rewatched', 'Episodes Watched'],
+    },
+    'user_scores': {
+        'csv': 'data/user/user_scores_filtered.csv',
+        'categorical': [],
+        'numeric': ['rating'],
+    },
+    # Full MyAnimeList score dump, too large to load at once: converted and read in chunks
+    'user_scores_full': {
+        'csv': 'data/user/users-score-2023.csv',
+        'categorical': [],
+        'numeric': ['rating'],
+        'dtypes': {'user_id': 'int32', 'anime_id': 'int32', 'rating': 'int8'},
+        'chunked': True,
+    },
+    'anime_filtered': {
+        'csv': 'data/anime/anime-filtered.csv',
+        'categorical': ['Type', 'Source', 'Rating'],
+        'numeric': ['Score', 'Episodes', 'Ranked'],
+    },
+    'characters': {
+        'csv': 'data/character/anime_planet_characters.csv',
+        'categorical': [],
+        'numeric': [],
+    },
+}
+
+
+def parquet_path(name):
+    return os.path.splitext(DATASETS[name]['csv'])[0] + ".parquet"
+
+
+def optimize_dtypes(df, name, downcast=True):
+    """Compact dtypes for a frame of dataset ``name`` (only the columns it has).
+
+    Chunks of a chunked dataset are not downcast, their dtypes come from the
+    dataset's ``dtypes`` so that every chunk has the same schema.
+    """
+    spec = DATASETS[name]
+    for col in spec['numeric']:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col].replace('UNKNOWN', np.nan), errors='coerce')
+    for col, dtype in spec.get('dtypes', {}).items():
+        if col in df.columns:
+            df[col] = df[col].astype(dtype)
+    if downcast:
+        for col in df.select_dtypes(include='integer').columns:
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        for col in df.select_dtypes(include='float').columns:
+            # Integer columns that only became float because of missing values
+            if df[col].notna().all() and (df[col] % 1 == 0).all():
+                df[col] = pd.to_numeric(df[col], downcast='integer')
+    for col in spec['categorical']:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    return df
+
+
+def convert_dataset(name, chunksize=1_000_000):
+    """Convert the CSV of dataset ``name`` to Parquet, returning the output path."""
+    spec = DATASETS[name]
+    path = parquet_path(name)
+    if not spec.get('chunked'):
+        optimize_dtypes(pd.read_csv(spec['csv']), name).to_parquet(path, index=False)
+        return path
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    for chunk in pd.read_csv(spec['csv'], chunksize=chunksize):
+        table = pa.Table.from_pandas(optimize_dtypes(chunk, name, downcast=False), preserve_index=False)
+        if writer is None:
+            writer = pq.ParquetWriter(path, table.schema)
+        writer.write_table(table.cast(writer.schema))
+    if writer is not None:
+        writer.close()
+    return path
+
+
+def load_table(name, columns=None):
+    """Load dataset ``name``, reading only ``columns`` when given."""
+    path = parquet_path(name)
+    if os.path.exists(path):
+        return pd.read_parquet(path, columns=columns)
+    return optimize_dtypes(pd.read_csv(DATASETS[name]['csv'], usecols=columns), name)
+
+
+def iter_chunks(name, columns=None, chunksize=1_000_000):
+    """Yield dataset ``name`` as frames of at most ``chunksize`` rows, Parquet first, CSV otherwise."""
+    path = parquet_path(name)
+    if os.path.exists(path):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        for chunk in pd.read_csv(DATASETS[name]['csv'], usecols=columns, chunksize=chunksize):
+            yield optimize_dtypes(chunk, name, downcast=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the Kaggle CSVs to Parquet.")
+    parser.add_argument("datasets", nargs="*", default=list(DATASETS), help="Datasets to convert (default: all)")
+    args = parser.parse_args()
+
+    for name in args.datasets:
+        csv_path = DATASETS[name]['csv']
+        if not os.path.exists(csv_path):
+            print(f"Skipping {name}: {csv_path} not found")
+            continue
+        path = convert_dataset(name)
+        print(f"{csv_path} ({os.path.getsize(csv_path) / 1e6:.1f} MB) -> {path} ({os.path.getsize(path) / 1e6:.1f} MB)")
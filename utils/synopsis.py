@@ -0,0 +1,205 @@
+"""Synopsis similarity index for the recommendation page.
+
+``python -m utils.synopsis`` encodes the synopsis of every anime of the
+feature artifact as a TF-IDF vector (English stop words removed, sublinear
+term frequency), keeps its ``MAX_TERMS`` heaviest terms, normalizes it, and
+writes two sparse views of the result to ``data/anime/recommendation/synopsis/``:
+
+- ``forward_*.npy``: CSR arrays (``indptr``, ``indices``, ``data``), one row per anime
+- ``inverted_*.npy``: the same matrix by term (an inverted index), each
+  postings list sorted by decreasing weight
+- ``anime_ids.npy``: the anime of each row
+- ``synopsis.json``: parameters the index was built with
+
+The similarity of a taste profile to every anime is a sparse dot product:
+the terms of the profile's vector select their postings lists, and the
+weighted postings are summed per anime (``np.bincount``), never touching
+anime without a common term. ``max_postings`` prunes it to the heaviest
+postings of each term. ``blend_top_k`` mixes the result with the
+genre-weighted feature distances.
+
+Arrays are memory-mapped: nothing is read until the first query, and pages
+of every session share the same copy.
+"""
+import argparse
+import json
+import os
+import re
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from utils.features import ANIME_DATA_PATH, ARTIFACT_DIR as FEATURES_DIR, save_array
+
+ARTIFACT_DIR = "data/anime/recommendation/synopsis"
+MAX_TERMS = 64
+MIN_DF = 2
+MAX_DF = 0.5
+AGGREGATES = ("mean", "max")
+# Filler the dataset uses for missing synopses, and credits appended to them
+PLACEHOLDER = "No description available"
+CREDITS = re.compile(r"\((Source|source):[^)]*\)|\[Written by [^\]]*\]")
+
+
+def clean_synopses(texts):
+    """Synopses without credits, empty for missing ones."""
+    texts = pd.Series(texts, dtype=object).fillna("").astype(str)
+    texts = texts.str.replace(CREDITS, " ", regex=True)
+    return texts.where(~texts.str.startswith(PLACEHOLDER), "").to_numpy()
+
+
+def keep_heaviest(matrix, max_terms):
+    """Keep the ``max_terms`` largest values of each row of a CSR matrix, then L2-normalize the rows."""
+    rows = np.repeat(np.arange(matrix.shape[0]), np.diff(matrix.indptr))
+    order = np.lexsort((-matrix.data, rows))
+    rank = np.arange(len(order)) - matrix.indptr[rows[order]]
+    kept = np.sort(order[rank < max_terms])
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(rows[kept], minlength=matrix.shape[0]))])
+    data = matrix.data[kept].astype(np.float32)
+    norms = np.sqrt(np.bincount(rows[kept], weights=data.astype(np.float64) ** 2, minlength=matrix.shape[0]))
+    data /= np.maximum(norms, 1e-12)[rows[kept]]
+    return indptr.astype(np.int64), matrix.indices[kept].astype(np.int32), data
+
+
+def invert(indptr, indices, data, n_terms):
+    """CSR arrays by term of a CSR matrix by anime, each postings list sorted by decreasing weight."""
+    rows = np.repeat(np.arange(len(indptr) - 1, dtype=np.int32), np.diff(indptr))
+    order = np.lexsort((-data, indices))
+    inverted_indptr = np.concatenate([[0], np.cumsum(np.bincount(indices, minlength=n_terms))])
+    return inverted_indptr.astype(np.int64), rows[order], data[order]
+
+
+def build_synopsis_index(texts, max_terms=MAX_TERMS, min_df=MIN_DF, max_df=MAX_DF, bigrams=False):
+    """Forward and inverted CSR arrays of the TF-IDF vectors of ``texts``, and the number of terms."""
+    vectorizer = TfidfVectorizer(stop_words="english", sublinear_tf=True, min_df=min_df, max_df=max_df,
+                                 ngram_range=(1, 2) if bigrams else (1, 1), dtype=np.float32)
+    matrix = vectorizer.fit_transform(clean_synopses(texts)).tocsr()
+    forward = keep_heaviest(matrix, max_terms)
+    return forward, invert(*forward, matrix.shape[1]), matrix.shape[1]
+
+
+def save_synopsis_index(anime_ids, forward, inverted, output_dir=ARTIFACT_DIR, **params):
+    os.makedirs(output_dir, exist_ok=True)
+    save_array(os.path.join(output_dir, "anime_ids.npy"), np.asarray(anime_ids, dtype=np.int64))
+    for prefix, arrays in (("forward", forward), ("inverted", inverted)):
+        for name, array in zip(("indptr", "indices", "data"), arrays):
+            save_array(os.path.join(output_dir, f"{prefix}_{name}.npy"), array)
+    with open(os.path.join(output_dir, "synopsis.json"), "w", encoding="utf-8") as f:
+        json.dump({'rows': int(len(anime_ids)), 'nnz': int(len(forward[2])), **params}, f, indent=1)
+
+
+def gather(indptr, indices, data, keys, limit=None):
+    """Concatenated ``indices`` and ``data`` of the rows ``keys`` (their first ``limit`` entries at most)."""
+    starts = indptr[keys]
+    lengths = indptr[np.asarray(keys) + 1] - starts
+    if limit is not None:
+        lengths = np.minimum(lengths, limit)
+    offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    positions = offsets + np.arange(lengths.sum())
+    return np.asarray(indices[positions]), np.asarray(data[positions]), lengths
+
+
+class SynopsisIndex:
+    """Queries over an index written by ``save_synopsis_index``."""
+
+    def __init__(self, anime_ids, forward, inverted, metadata):
+        self.anime_ids = anime_ids
+        self.forward = forward
+        self.inverted = inverted
+        self.metadata = metadata
+        self.row_index = {int(anime_id): i for i, anime_id in enumerate(anime_ids)}
+
+    def __contains__(self, anime_id):
+        return int(anime_id) in self.row_index
+
+    def similarities(self, anime_ids, aggregate="mean", max_postings=None):
+        """Cosine similarity of every anime of the index to the synopses of ``anime_ids``.
+
+        ``"mean"`` compares each anime with the centroid of the favourites,
+        ``"max"`` keeps its best similarity to any of them. Favourites
+        missing from the index are ignored.
+        """
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"Unknown aggregate '{aggregate}', expected one of {AGGREGATES}")
+        rows = [self.row_index[int(anime_id)] for anime_id in anime_ids if int(anime_id) in self.row_index]
+        if not rows:
+            return np.zeros(len(self.anime_ids), dtype=np.float32)
+        if aggregate == "max":
+            return np.max([self._dot(*gather(*self.forward, [row])[:2], max_postings) for row in rows], axis=0)
+        terms, weights, _ = gather(*self.forward, rows)
+        terms, inverse = np.unique(terms, return_inverse=True)
+        weights = np.bincount(inverse, weights=weights)
+        return self._dot(terms, weights / max(np.linalg.norm(weights), 1e-12), max_postings)
+
+    def _dot(self, terms, weights, max_postings):
+        rows, values, lengths = gather(*self.inverted, terms, max_postings)
+        scores = np.bincount(rows, weights=values * np.repeat(weights, lengths), minlength=len(self.anime_ids))
+        return scores.astype(np.float32)
+
+    def aligned(self, scores, anime_ids):
+        """``scores`` (one per anime of the index) in the order of ``anime_ids``, 0 for anime not in the index."""
+        if len(anime_ids) == len(self.anime_ids) and np.array_equal(anime_ids, self.anime_ids):
+            return scores
+        rows = np.array([self.row_index.get(int(anime_id), -1) for anime_id in anime_ids])
+        return np.where(rows >= 0, scores[rows], 0.0).astype(np.float32)
+
+
+def blend_top_k(anime_ids, distances, text_similarities, text_weight, k=3):
+    """The ``k`` best anime by ``(1 - text_weight)`` feature similarity + ``text_weight`` synopsis similarity.
+
+    Feature distances (``inf`` for excluded anime) become similarities in
+    [0, 1] by dividing them by the largest one. Returns ids and blended
+    scores, best first.
+    """
+    finite = np.isfinite(distances)
+    largest = distances[finite].max() if finite.any() else 1.0
+    feature_similarities = 1 - np.where(finite, distances, largest) / max(largest, 1e-12)
+    scores = (1 - text_weight) * feature_similarities + text_weight * text_similarities
+    scores[~finite] = -np.inf
+    k = min(k, int(finite.sum()))
+    best = np.argpartition(-scores, k - 1)[:k] if k > 0 else np.empty(0, dtype=np.int64)
+    best = best[np.argsort(-scores[best], kind='stable')]
+    return anime_ids[best], scores[best]
+
+
+def load_synopsis_index(output_dir=ARTIFACT_DIR):
+    """Load the synopsis index, memory-mapping the arrays."""
+    with open(os.path.join(output_dir, "synopsis.json"), encoding="utf-8") as f:
+        metadata = json.load(f)
+    forward, inverted = (
+        tuple(np.load(os.path.join(output_dir, f"{prefix}_{name}.npy"), mmap_mode='r')
+              for name in ("indptr", "indices", "data"))
+        for prefix in ("forward", "inverted")
+    )
+    return SynopsisIndex(np.load(os.path.join(output_dir, "anime_ids.npy")), forward, inverted, metadata)
+
+
+def index_size_mb(index):
+    return sum(array.nbytes for array in (*index.forward, *index.inverted, index.anime_ids)) / 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the synopsis similarity index of the recommendation page.")
+    parser.add_argument("--source", default=ANIME_DATA_PATH)
+    parser.add_argument("--features-dir", default=FEATURES_DIR,
+                        help="Index the anime of this feature artifact, in its row order")
+    parser.add_argument("--output-dir", default=ARTIFACT_DIR)
+    parser.add_argument("--max-terms", type=int, default=MAX_TERMS, help="Terms kept per synopsis")
+    parser.add_argument("--min-df", type=int, default=MIN_DF)
+    parser.add_argument("--max-df", type=float, default=MAX_DF)
+    parser.add_argument("--bigrams", action="store_true", help="Index word pairs too")
+    args = parser.parse_args()
+
+    anime_df = pd.read_csv(args.source, usecols=['anime_id', 'Synopsis']).drop_duplicates('anime_id')
+    anime_ids = np.load(os.path.join(args.features_dir, "anime_ids.npy"))
+    texts = anime_df.set_index('anime_id')['Synopsis'].reindex(anime_ids).to_numpy()
+    start = time.perf_counter()
+    forward, inverted, n_terms = build_synopsis_index(texts, args.max_terms, args.min_df, args.max_df, args.bigrams)
+    elapsed = time.perf_counter() - start
+    save_synopsis_index(anime_ids, forward, inverted, args.output_dir, terms=n_terms, max_terms=args.max_terms,
+                        min_df=args.min_df, max_df=args.max_df, bigrams=args.bigrams)
+    index = load_synopsis_index(args.output_dir)
+    print(f"{len(anime_ids):,} synopses -> {n_terms:,} terms, {len(forward[2]):,} weights in {elapsed:.1f} s, "
+          f"index {index_size_mb(index):.1f} MB in {args.output_dir}")
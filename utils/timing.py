@@ -0,0 +1,189 @@
+"""Stage timings of the pages.
+
+    with span("load_data"):
+        ...
+
+    @timed("blur_image")
+    def blur_image(url, level=0):
+        ...
+
+Spans are recorded:
+
+- for one session when its URL ends with ``?debug=timing``: the spans of each
+  run are listed in the sidebar by ``debug_panel()``
+- for the whole process when ``TIMING=1`` is set
+
+and written to ``TIMING_OUTPUT`` when it is set: one JSON object per line, or,
+when the path ends in ``.prom``, a Prometheus text file with the count and
+total seconds of each span (for the node exporter textfile collector),
+rewritten at most every ``PROM_INTERVAL`` seconds.
+
+When nothing is recorded, ``span`` returns a shared no-op context manager and
+``timed`` calls the function directly: instrumented code only pays for one
+check. Spans in worker threads (background refreshes, image generation,
+prefetching) are only recorded with ``TIMING=1``.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+
+ENABLED = os.environ.get("TIMING", "") not in ("", "0")
+OUTPUT = os.environ.get("TIMING_OUTPUT")
+PROM_INTERVAL = 5.0
+# ?debug=<DEBUG_PARAM> shows the panel for a session
+DEBUG_PARAM = "timing"
+
+# Spans of the script run of this thread (None when the session did not ask for them)
+_local = threading.local()
+
+
+class Span:
+    __slots__ = ("name", "labels", "start", "seconds")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.start
+        _record(self)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name, **labels):
+    """Context manager timing the block as ``name``; ``labels`` go to the JSONL output."""
+    if not ENABLED and getattr(_local, 'spans', None) is None:
+        return _NO_SPAN
+    return Span(name, labels)
+
+
+def timed(name=None):
+    """Decorator timing each call as ``name`` (default: the function name)."""
+    def decorate(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED and getattr(_local, 'spans', None) is None:
+                return function(*args, **kwargs)
+            with Span(span_name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+class JsonlSink:
+    """Appends one JSON line per span."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def write(self, name, seconds, labels):
+        line = json.dumps({'time': round(time.time(), 3), 'span': name, 'seconds': round(seconds, 6), **labels},
+                          default=str)
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def flush(self):
+        pass
+
+
+class PrometheusSink:
+    """Count and total seconds of each (span, page), rewritten as a Prometheus text file."""
+
+    def __init__(self, path, interval=PROM_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._totals = {}
+        self._written = 0.0
+        self._lock = threading.Lock()
+
+    def write(self, name, seconds, labels):
+        with self._lock:
+            totals = self._totals.setdefault((name, labels.get('page') or ""), [0, 0.0])
+            totals[0] += 1
+            totals[1] += seconds
+            if time.monotonic() - self._written >= self.interval:
+                self._write_file()
+
+    def flush(self):
+        with self._lock:
+            self._write_file()
+
+    def _write_file(self):
+        def escape(value):
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        lines = ["# HELP streamimanga_span_seconds Time spent in each instrumented stage of the pages.",
+                 "# TYPE streamimanga_span_seconds summary"]
+        for (name, page), (count, seconds) in sorted(self._totals.items()):
+            labels = f'span="{escape(name)}",page="{escape(page)}"'
+            lines.append(f"streamimanga_span_seconds_count{{{labels}}} {count}")
+            lines.append(f"streamimanga_span_seconds_sum{{{labels}}} {seconds:.6f}")
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, self.path)
+        self._written = time.monotonic()
+
+
+def make_sink(path):
+    return PrometheusSink(path) if path.endswith(".prom") else JsonlSink(path)
+
+
+_sink = make_sink(OUTPUT) if OUTPUT else None
+if _sink is not None:
+    atexit.register(_sink.flush)
+
+
+def _record(span):
+    spans = getattr(_local, 'spans', None)
+    if spans is not None:
+        spans.append((span.start, span.name, span.seconds))
+    if _sink is not None:
+        _sink.write(span.name, span.seconds, {'page': getattr(_local, 'page', None), **span.labels})
+
+
+def start_page(page):
+    """Start the timings of this run of ``page``; called at the top of each page."""
+    import streamlit as st
+
+    _local.page = page
+    _local.run_start = time.perf_counter()
+    _local.spans = [] if st.query_params.get("debug") == DEBUG_PARAM else None
+
+
+def debug_panel():
+    """Sidebar table of the spans of this run, for sessions opened with ``?debug=timing``."""
+    spans = getattr(_local, 'spans', None)
+    if spans is None:
+        return
+    import streamlit as st
+
+    with st.sidebar.expander("⏱️ Timings", expanded=True):
+        st.dataframe(
+            [{'stage': name, 'ms': round(seconds * 1000, 1)} for _, name, seconds in sorted(spans)],
+            hide_index=True, use_container_width=True,
+        )
+        st.caption(f"Script run: {(time.perf_counter() - _local.run_start) * 1000:.0f} ms")